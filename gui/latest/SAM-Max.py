@@ -4,7 +4,6 @@
 import tkinter as tk
 from tkinter import messagebox
 import tkinter.ttk as ttk
-from tkinter import colorchooser
 import serial
 import serial.tools.list_ports
 import threading
@@ -14,17 +13,91 @@ import RPi.GPIO as GPIO
 import os
 import json
 import socket
+import struct
+import array
+import bisect
+import calendar
+import mmap
+import zlib
+import queue
+import collections
+import heapq
+import math
 import sys
 import subprocess
 import platform
 import shutil
 import signal
-import hashlib
-import urllib.request
-import urllib.error
+import logging
+import logging.handlers
 
-__version__ = "1.4.0"
+# Startup trace reference point (time-to-window / time-to-first-live-reading)
+_STARTUP_T0 = time.monotonic()
+
+__version__ = "1.5.0"
 GUI_MANIFEST_URL = "https://raw.githubusercontent.com/Stork-Solutions/Aquatics-Monitor/main/gui/latest/gui_update.json"
+# Last known readings, shown (marked stale) while sensors reconnect at startup
+LAST_READINGS_PATH = "last_readings.json"
+SETTINGS_PATH = "settings.json"
+# Long-term reading history (columnar, one pair of files per sensor metric)
+HISTORY_DIR = "history"
+# Pump / alarm / connectivity event journal (SQLite)
+EVENTS_PATH = "events.db"
+# History exports go to a USB stick when one is mounted, else here
+EXPORT_DIR = "exports"
+# Daily statistics reports (one small JSON file per day)
+REPORT_DIR = "reports"
+# Local tools (logger, kiosk, maintenance scripts) connect here
+IPC_SOCKET_PATH = os.environ.get("SAM_MAX_SOCKET", "/tmp/sam-max.sock")
+LOG_PATH = "sam-max.log"
+# The acquisition process (`SAM-Max.py acquire`) logs to its own file
+ACQUIRE_LOG_PATH = "sam-max-acquire.log"
+
+log = logging.getLogger("sam_max")
+# One child logger per subsystem: its name ("sam_max.history") is on every
+# line, and each can be levelled on its own (SAM_MAX_LOG_LEVEL below).
+# Messages take %-style arguments, formatted only if the record is emitted.
+log_sensors = log.getChild("sensors")         # sessions, polling, watchdog, firmware, tare
+log_pumps = log.getChild("pumps")             # override / safety decisions
+log_alarms = log.getChild("alarms")           # rules, transitions, sound
+log_readings = log.getChild("readings")       # shared table, last_readings.json
+log_history = log.getChild("history")         # column store, archive, export, reports
+log_events = log.getChild("events")           # event journal
+log_ipc = log.getChild("ipc")
+log_acquire = log.getChild("acquire")         # acquisition process lifecycle
+log_settings = log.getChild("settings")
+log_metrics = log.getChild("metrics")
+log_diagnostics = log.getChild("diagnostics") # loop monitor, profiling
+log_ui = log.getChild("ui")                   # render pass, display, theme
+
+def setup_logging(path=LOG_PATH, level=None, max_bytes=1_000_000, backups=3):
+    """
+    Console + size-rotated file logging. Records are put on a queue and a
+    QueueListener thread does the formatting and writing, so a poll loop
+    never waits on stdout or the SD card. Level: SAM_MAX_LOG_LEVEL (INFO),
+    optionally followed by per-subsystem levels: "INFO,sensors=DEBUG".
+    Returns the listener; stop() it on exit to flush.
+    """
+    level, *overrides = (level or os.environ.get("SAM_MAX_LOG_LEVEL", "INFO")).upper().split(",")
+    fmt = logging.Formatter("%(asctime)s %(levelname)-7s %(name)s %(threadName)s %(message)s")
+    handlers = [logging.StreamHandler(sys.stdout)]
+    try:
+        handlers.append(logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups))
+    except OSError as e:
+        print(f"[LOG] File logging disabled: {e}")
+    for h in handlers:
+        h.setFormatter(fmt)
+
+    q = queue.SimpleQueue()
+    log.addHandler(logging.handlers.QueueHandler(q))
+    log.setLevel(level.strip())
+    for item in overrides:
+        name, _, sub_level = item.partition("=")
+        log.getChild(name.strip().lower()).setLevel(sub_level.strip())
+    log.propagate = False
+    listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
 
 class TransportTCP:
     def __init__(self, host, port=8888, timeout=2.0):
@@ -49,27 +122,3158 @@ class TransportTCP:
         return buf.decode().strip()
     def close(self):
         try:
-            if self.sock: self.sock.close()
-        except: pass
-
-class TransportSerial:
-    def __init__(self, ser): self.ser = ser
-    def open(self): pass
-    def write(self, s: str): self.ser.write(s.encode())
-    def readline(self) -> str: return self.ser.readline().decode().strip()
-    @property
-    def is_open(self):  # for UI checks if you still need them
-        try: return self.ser.is_open
-        except: return True
-    def close(self):
-        try: self.ser.close()
-        except: pass
+            if self.sock: self.sock.close()
+        except: pass
+
+class TransportSerial:
+    def __init__(self, ser): self.ser = ser
+    def open(self): pass
+    def write(self, s: str): self.ser.write(s.encode())
+    def readline(self) -> str: return self.ser.readline().decode().strip()
+    @property
+    def is_open(self):  # for UI checks if you still need them
+        try: return self.ser.is_open
+        except: return True
+    def close(self):
+        try: self.ser.close()
+        except: pass
+
+class ReadingsTableBusy(RuntimeError):
+    """Another live process owns the readings table."""
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True     # exists, owned by another user
+    except OSError:
+        return False
+    return True
+
+class ReadingsTable:
+    """
+    Fixed-layout table of the latest readings and pump states, kept in
+    multiprocessing.shared_memory so any local process can attach by name.
+
+    Writers (poll threads / control) publish under a seqlock: the sequence
+    counter is odd while a write is in progress. Readers copy the whole table
+    and retry if the counter was odd or moved during the copy, so they never
+    take a lock and never block acquisition.
+
+    The header records the owner's PID: a second instance refuses to start
+    while that process is alive, and only a crashed run's segment is replaced.
+
+    Besides the readings, each sensor row carries its alarm severity
+    (AlarmEngine.SEVERITY) and each pump row the cause code of the current
+    run (PUMP_ON_CAUSE, 0 while off) and the time of its last safety
+    shutdown: everything a display process needs to draw the tiles.
+    """
+    SENSORS = ("A", "B", "C", "D", "E")
+    FIELDS = ("connected", "ts", "temperature", "level", "ph", "tds", "cond", "sal", "alarm")
+    PUMPS = ("RO Pump A", "RO Pump B")
+    PUMP_FIELDS = ("on", "auto", "override", "keepalive", "ts", "cause", "safety")
+
+    _HDR = struct.Struct("<QQQ")                        # seq, magic/version, owner pid
+    _SENSOR = struct.Struct("<Q" + "d" * len(FIELDS))   # update count + fields
+    _PUMP = struct.Struct("<Q" + "d" * len(PUMP_FIELDS))
+    MAGIC = 0x53414D0003                                # "SAM" + layout v3
+
+    SIZE = _HDR.size + _SENSOR.size * len(SENSORS) + _PUMP.size * len(PUMPS)
+    DEFAULT_NAME = "sam_max_readings"
+
+    def __init__(self, name=DEFAULT_NAME, create=True):
+        self.name = name
+        self._shm = None
+        self._owner = False
+        self._wlock = threading.Lock()
+        try:
+            from multiprocessing import shared_memory
+            if create:
+                try:
+                    self._shm = shared_memory.SharedMemory(name=name, create=True, size=self.SIZE)
+                except FileExistsError:
+                    existing = self._open_existing(shared_memory, name)
+                    pid = self._owner_pid(existing.buf)
+                    existing.close()
+                    if pid and _pid_alive(pid):
+                        raise ReadingsTableBusy(f"Shared memory '{name}' belongs to running process {pid}")
+                    # Stale segment from a crashed run: replace it
+                    log_readings.info("[READINGS] Replacing stale table '%s' (owner %s gone)", name, pid or 'unknown')
+                    existing = shared_memory.SharedMemory(name=name)
+                    existing.close(); existing.unlink()
+                    self._shm = shared_memory.SharedMemory(name=name, create=True, size=self.SIZE)
+                self._owner = True
+            else:
+                self._shm = self._open_existing(shared_memory, name)
+            self.buf = self._shm.buf
+        except ReadingsTableBusy:
+            raise
+        except Exception as e:
+            if not create:
+                raise
+            # No /dev/shm (or no permission): keep the same layout in-process
+            log_readings.warning("[READINGS] Shared memory unavailable (%s); using private table.", e)
+            self.buf = memoryview(bytearray(self.SIZE))
+
+        if create:
+            nan = float("nan")
+            for i in range(len(self.SENSORS)):
+                self._SENSOR.pack_into(self.buf, self._sensor_off(i), 0, 0.0, *([nan] * (len(self.FIELDS) - 1)))
+            for i in range(len(self.PUMPS)):
+                self._PUMP.pack_into(self.buf, self._pump_off(i), 0, *([0.0] * len(self.PUMP_FIELDS)))
+            # Header last: a process waiting for our PID sees a filled-in table
+            self._HDR.pack_into(self.buf, 0, 0, self.MAGIC, os.getpid())
+        elif self._HDR.unpack_from(self.buf, 0)[1] != self.MAGIC:
+            raise ValueError(f"Shared memory '{name}' is not a SAM-Max readings table")
+
+    @classmethod
+    def attach(cls, name=DEFAULT_NAME):
+        """Read-only style attach from another process (logger, kiosk, scripts)."""
+        return cls(name=name, create=False)
+
+    @staticmethod
+    def _open_existing(shared_memory, name):
+        shm = shared_memory.SharedMemory(name=name)
+        # Attaching must not let this process's resource tracker
+        # unlink the owner's segment when it exits
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+    @classmethod
+    def _owner_pid(cls, buf):
+        """PID recorded by the creator (any layout since v2), or None for a foreign / v1 segment."""
+        if len(buf) < cls._HDR.size:
+            return None
+        _, magic, pid = cls._HDR.unpack_from(buf, 0)
+        return pid if magic >> 8 == cls.MAGIC >> 8 and magic & 0xFF >= 2 else None
+
+    def _sensor_off(self, idx):
+        return self._HDR.size + idx * self._SENSOR.size
+
+    def _pump_off(self, idx):
+        return self._HDR.size + len(self.SENSORS) * self._SENSOR.size + idx * self._PUMP.size
+
+    def _write(self, fmt, off, fields, values):
+        with self._wlock:
+            seq = self._HDR.unpack_from(self.buf, 0)[0]
+            struct.pack_into("<Q", self.buf, 0, seq + 1)     # odd: write in progress
+            cur = list(fmt.unpack_from(self.buf, off))
+            cur[0] += 1
+            for k, v in values.items():
+                cur[1 + fields.index(k)] = float(v)
+            fmt.pack_into(self.buf, off, *cur)
+            struct.pack_into("<Q", self.buf, 0, seq + 2)     # even: stable
+
+    def publish(self, sensor_id, **values):
+        """Update some fields of one sensor row; missing values should be NaN."""
+        values.setdefault("ts", time.time())
+        self._write(self._SENSOR, self._sensor_off(self.SENSORS.index(sensor_id)), self.FIELDS, values)
+
+    def publish_pump(self, pump_name, **values):
+        values.setdefault("ts", time.time())
+        self._write(self._PUMP, self._pump_off(self.PUMPS.index(pump_name)), self.PUMP_FIELDS, values)
+
+    def snapshot(self, retries=100):
+        """Consistent copy of the table: {"seq", "sensors": {...}, "pumps": {...}}."""
+        raw = None
+        for _ in range(retries):
+            s1 = self._HDR.unpack_from(self.buf, 0)[0]
+            if s1 & 1:
+                time.sleep(0)
+                continue
+            raw = bytes(self.buf[:self.SIZE])
+            if self._HDR.unpack_from(self.buf, 0)[0] == s1:
+                break
+            raw = None
+        if raw is None:
+            raw = bytes(self.buf[:self.SIZE])   # writer stuck mid-update; best effort
+
+        seq = self._HDR.unpack_from(raw, 0)[0]
+        sensors = {}
+        for i, sid in enumerate(self.SENSORS):
+            vals = self._SENSOR.unpack_from(raw, self._sensor_off(i))
+            rec = dict(zip(self.FIELDS, vals[1:]))
+            rec["count"] = vals[0]
+            sensors[sid] = rec
+        pumps = {}
+        for i, name in enumerate(self.PUMPS):
+            vals = self._PUMP.unpack_from(raw, self._pump_off(i))
+            rec = dict(zip(self.PUMP_FIELDS, vals[1:]))
+            rec["count"] = vals[0]
+            pumps[name] = rec
+        return {"seq": seq, "sensors": sensors, "pumps": pumps}
+
+    @property
+    def seq(self):
+        return self._HDR.unpack_from(self.buf, 0)[0]
+
+    def close(self):
+        try:
+            self.buf = memoryview(bytearray(self.SIZE))   # drop exported view before close
+            if self._shm:
+                self._shm.close()
+                if self._owner:
+                    self._shm.unlink()
+        except Exception as e:
+            log_readings.warning("[READINGS] Close error: %s", e)
+        self._shm = None
+
+class ReadingRing:
+    """
+    Recent history of every sensor metric, in memory only.
+
+    Each (sensor, metric) series is a fixed-capacity ring of two
+    array('d') buffers (timestamps, values): no per-sample Python objects,
+    O(1) append, memory bounded at 16 bytes x capacity per series. Series
+    are allocated on their first sample, so metrics a site doesn't have
+    cost nothing. Timestamps only move forward, so time windows are found
+    by binary search over the ring in logical (oldest-first) order.
+    """
+    # 24 h at the fastest possible poll: every loop sleeps 0.4 s between
+    # cycles (C with temperature off adds only one RX203 round trip, ~2.3 Hz),
+    # so no series gets more than one sample per 0.4 s
+    POLL_FLOOR_S = 0.4
+    DEFAULT_CAPACITY = int(24 * 60 * 60 / POLL_FLOOR_S)
+
+    class _Series:
+        __slots__ = ("ts", "vals", "start", "n", "lock")
+
+        def __init__(self, capacity):
+            self.ts = array.array("d", bytes(8 * capacity))
+            self.vals = array.array("d", bytes(8 * capacity))
+            self.start = 0      # physical index of the oldest sample
+            self.n = 0
+            self.lock = threading.Lock()
+
+    class _TimeView:
+        """Oldest-first read-only view of a series' timestamps, for bisect."""
+        __slots__ = ("series", "cap")
+
+        def __init__(self, series):
+            self.series = series
+            self.cap = len(series.ts)
+
+        def __len__(self):
+            return self.series.n
+
+        def __getitem__(self, i):
+            return self.series.ts[(self.series.start + i) % self.cap]
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._series = {}       # (sid, metric) -> _Series
+        self._lock = threading.Lock()
+
+    def _get(self, sid, metric, create=False):
+        key = (sid, metric)
+        s = self._series.get(key)
+        if s is None and create:
+            with self._lock:
+                s = self._series.get(key)
+                if s is None:
+                    s = self._series[key] = self._Series(self.capacity)
+        return s
+
+    def append(self, sid, metric, ts, value):
+        """Add one sample; NaN ("no value this cycle") is not stored."""
+        if value != value:
+            return
+        s = self._get(sid, metric, create=True)
+        with s.lock:
+            if s.n and ts < s.ts[(s.start + s.n - 1) % self.capacity]:
+                return      # clock stepped back; keep the series ordered
+            if s.n < self.capacity:
+                i = (s.start + s.n) % self.capacity
+                s.n += 1
+            else:
+                i = s.start
+                s.start = (s.start + 1) % self.capacity
+            s.ts[i] = ts
+            s.vals[i] = value
+
+    def _slice(self, s, lo, hi):
+        """Logical [lo, hi) as two arrays, copied with at most two C-level slices."""
+        a, b = (s.start + lo) % self.capacity, (s.start + hi) % self.capacity
+        if hi - lo <= 0:
+            return array.array("d"), array.array("d")
+        if a < b:
+            return s.ts[a:b], s.vals[a:b]
+        return s.ts[a:] + s.ts[:b], s.vals[a:] + s.vals[:b]
+
+    def window(self, sid, metric, start=None, end=None):
+        """(timestamps, values) with start <= ts <= end, oldest first, as array('d') copies."""
+        s = self._get(sid, metric)
+        if s is None:
+            return array.array("d"), array.array("d")
+        with s.lock:
+            view = self._TimeView(s)
+            lo = 0 if start is None else bisect.bisect_left(view, start)
+            hi = s.n if end is None else bisect.bisect_right(view, end)
+            return self._slice(s, lo, hi)
+
+    def last(self, sid, metric, seconds):
+        """Samples from the last `seconds` before the newest one."""
+        s = self._get(sid, metric)
+        if s is None or not s.n:
+            return array.array("d"), array.array("d")
+        newest = s.ts[(s.start + s.n - 1) % self.capacity]
+        return self.window(sid, metric, newest - seconds, None)
+
+    def latest(self, sid, metric):
+        """(ts, value) of the newest sample, or None."""
+        s = self._get(sid, metric)
+        if s is None:
+            return None
+        with s.lock:
+            if not s.n:
+                return None
+            i = (s.start + s.n - 1) % self.capacity
+            return s.ts[i], s.vals[i]
+
+    def series(self):
+        """{(sid, metric): sample count} for every allocated series."""
+        return {k: s.n for k, s in list(self._series.items())}
+
+    @property
+    def nbytes(self):
+        return sum(2 * s.ts.itemsize * len(s.ts) for s in list(self._series.values()))
+
+def lttb(ts, vals, n_out):
+    """
+    Largest-Triangle-Three-Buckets: indices of n_out samples that keep the
+    visual shape of (ts, vals). First and last samples are always kept;
+    each bucket in between keeps the sample forming the largest triangle
+    with the previously kept sample and the next bucket's average, so
+    spikes and dips survive where plain averaging would flatten them.
+    """
+    n = len(ts)
+    if n_out >= n or n_out < 3:
+        return list(range(n))
+    out = [0]
+    every = (n - 2) / (n_out - 2)
+    a = 0
+    for i in range(n_out - 2):
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        # Average of the next bucket (just the last sample for the final one)
+        nlo, nhi = hi, min(int((i + 2) * every) + 1, n)
+        if nlo >= nhi:
+            nlo, nhi = n - 1, n
+        cnt = nhi - nlo
+        avg_t = sum(ts[nlo:nhi]) / cnt
+        avg_v = sum(vals[nlo:nhi]) / cnt
+        at, av = ts[a], vals[a]
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((at - avg_t) * (vals[j] - av) - (at - ts[j]) * (avg_v - av))
+            if area > best_area:
+                best, best_area = j, area
+        out.append(best)
+        a = best
+    out.append(n - 1)
+    return out
+
+class TrendChart:
+    """
+    Small trend line for a sensor tile: the last `span_s` seconds of one
+    metric, drawn as a single canvas line item.
+
+    The first load reduces the history to one point per pixel column with
+    LTTB; reduce() touches no Tk state, so that pass can run on a worker
+    and apply() installs its result on the Tk thread. After that new samples are folded in incrementally: samples
+    collect in the open pixel bucket, and when time moves on to the next
+    column the bucket is closed by keeping its largest-triangle sample
+    (against the previous kept point and the new sample). Points older
+    than the span drop off the front. A redraw only recomputes at most
+    `width` coordinates and updates the existing item with coords(); no
+    canvas items are created or deleted while it runs.
+    """
+    REFRESH_S = 5.0         # minimum seconds between redraws
+
+    def __init__(self, parent, color, width=240, height=48, span_s=24 * 60 * 60):
+        self.width, self.height, self.span_s = width, height, span_s
+        self.canvas = tk.Canvas(parent, width=width, height=height, highlightthickness=0, bd=0)
+        self._line = self.canvas.create_line(0, 0, 0, 0, fill=color, width=2, state="hidden")
+        self._pts = collections.deque()     # kept (ts, value), one per closed pixel column
+        self._bucket = None                 # pixel column index of the open bucket
+        self._open = []                     # samples in the open bucket
+        self.last_ts = None                 # newest sample folded in
+        self.last_draw = 0.0
+        self.loaded = False
+        self.loading = False                # a worker is reading the first span
+
+    @property
+    def bucket_s(self):
+        return self.span_s / self.width
+
+    def set_color(self, color):
+        self.canvas.itemconfigure(self._line, fill=color)
+
+    def due(self, now):
+        return now - self.last_draw >= self.REFRESH_S
+
+    def load(self, ts, vals):
+        """Replace the chart contents with (ts, vals), LTTB-reduced to the width."""
+        self.apply(self.reduce(ts, vals))
+
+    def reduce(self, ts, vals):
+        """(kept points, newest sample) for apply(); safe to call off the Tk thread."""
+        if not ts:
+            return [], None
+        keep = lttb(ts, vals, self.width)
+        return [(ts[i], vals[i]) for i in keep[:-1]], (ts[-1], vals[-1])
+
+    def apply(self, reduced):
+        """Replace the chart contents with a reduce() result."""
+        pts, newest = reduced
+        self._pts.clear()
+        self._pts.extend(pts)
+        self._open = [newest] if newest else []
+        self._bucket = int(newest[0] // self.bucket_s) if newest else None
+        self.last_ts = newest[0] if newest else None
+        self.loaded = True
+        self.loading = False
+
+    def extend(self, ts, vals):
+        """Fold in samples newer than the last one seen."""
+        size = self.bucket_s
+        for t, v in zip(ts, vals):
+            if self.last_ts is not None and t <= self.last_ts:
+                continue
+            b = int(t // size)
+            if self._bucket is not None and b != self._bucket:
+                self._close_bucket(t, v)
+            self._bucket = b
+            self._open.append((t, v))
+            self.last_ts = t
+
+    def _close_bucket(self, next_t, next_v):
+        if not self._open:
+            return
+        if not self._pts:
+            self._pts.append(self._open[0])
+        else:
+            at, av = self._pts[-1]
+            best, best_area = self._open[0], -1.0
+            for t, v in self._open:
+                area = abs((at - next_t) * (v - av) - (at - t) * (next_v - av))
+                if area > best_area:
+                    best, best_area = (t, v), area
+            self._pts.append(best)
+        self._open = []
+
+    def draw(self, now):
+        self.last_draw = now
+        start = now - self.span_s
+        while self._pts and self._pts[0][0] < start:
+            self._pts.popleft()
+        pts = list(self._pts)
+        if self._open:
+            pts.append(self._open[-1])
+        if len(pts) < 2:
+            self.canvas.itemconfigure(self._line, state="hidden")
+            return
+        lo = min(v for _, v in pts)
+        hi = max(v for _, v in pts)
+        if hi - lo < 1e-9:
+            lo, hi = lo - 1.0, hi + 1.0
+        pad = 3
+        xs = (self.width - 1) / self.span_s
+        ys = (self.height - 2 * pad) / (hi - lo)
+        coords = []
+        for t, v in pts:
+            coords.append((t - start) * xs)
+            coords.append(self.height - pad - (v - lo) * ys)
+        self.canvas.coords(self._line, *coords)
+        self.canvas.itemconfigure(self._line, state="normal")
+
+class SlidingFit:
+    """
+    Least-squares line y = a + b*t over a sliding time window, kept as
+    running sums (n, Sx, Sy, Sxx, Sxy): each sample is added once and
+    subtracted once when it leaves, so a slope costs O(1) however long the
+    window. x is measured from a movable origin, re-based algebraically
+    (no pass over the samples) once it has drifted far, which keeps the
+    sums small enough not to lose precision. At most max_n samples are
+    held; denser input is thinned to one sample per window_s / max_n.
+    """
+    __slots__ = ("window_s", "max_n", "min_dt", "pts", "t0", "n", "sx", "sy", "sxx", "sxy")
+
+    def __init__(self, window_s, max_n=2048):
+        self.window_s = window_s
+        self.max_n = max_n
+        self.min_dt = window_s / max_n
+        self.reset()
+
+    def reset(self):
+        self.pts = collections.deque()      # (t, y), oldest first
+        self.t0 = None
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.sxy = 0.0
+
+    def add(self, t, y):
+        if self.pts and t - self.pts[-1][0] < self.min_dt:
+            return
+        if self.t0 is None:
+            self.t0 = t
+        elif t - self.t0 > 4 * self.window_s:
+            self._rebase(self.pts[0][0] if self.pts else t)
+        x = t - self.t0
+        self.pts.append((t, y))
+        self.n += 1
+        self.sx += x; self.sy += y
+        self.sxx += x * x; self.sxy += x * y
+        while self.n > self.max_n or t - self.pts[0][0] > self.window_s:
+            ot, oy = self.pts.popleft()
+            ox = ot - self.t0
+            self.n -= 1
+            self.sx -= ox; self.sy -= oy
+            self.sxx -= ox * ox; self.sxy -= ox * oy
+
+    def _rebase(self, t0):
+        c = t0 - self.t0
+        self.sxx += -2.0 * c * self.sx + self.n * c * c
+        self.sxy -= c * self.sy
+        self.sx -= self.n * c
+        self.t0 = t0
+
+    @property
+    def span(self):
+        return self.pts[-1][0] - self.pts[0][0] if self.n > 1 else 0.0
+
+    def slope(self):
+        """dy/dt over the window, or None with fewer than two distinct times."""
+        d = self.n * self.sxx - self.sx * self.sx
+        if self.n < 2 or d <= 0:
+            return None
+        return (self.n * self.sxy - self.sx * self.sy) / d
+
+class LevelRate:
+    """
+    Evaporation and fill rate of one tank from its level readings.
+
+    Readings taken with the pump OFF feed one SlidingFit (6 h window,
+    level falls as water evaporates), readings with the pump ON another
+    (15 min window, level rises as RO water comes in). Each pump switch
+    starts a fresh segment for the new regime, so no fit spans a top-up,
+    and the first SETTLE_S seconds after a switch are skipped while the
+    water settles. The last good slope of each regime is kept until the
+    next segment has enough span to replace it. Rates are mm/day.
+    """
+    SETTLE_S = 120.0
+    MIN_SAMPLES = 10
+
+    def __init__(self, off_window_s=6 * 3600, on_window_s=15 * 60, max_n=2048):
+        self.fits = {False: SlidingFit(off_window_s, max_n), True: SlidingFit(on_window_s, max_n)}
+        self.min_span = {False: off_window_s / 6, True: on_window_s / 6}
+        self.rates = {False: None, True: None}      # mm/day, last usable fit per regime
+        self.updated = {False: None, True: None}
+        self.pump_on = None
+        self.since = 0.0
+
+    def add(self, t, level_mm, pump_on):
+        pump_on = bool(pump_on)
+        if pump_on != self.pump_on:
+            self.pump_on, self.since = pump_on, t
+            self.fits[pump_on].reset()
+        if t - self.since < self.SETTLE_S:
+            return
+        fit = self.fits[pump_on]
+        fit.add(t, level_mm)
+        if fit.n >= self.MIN_SAMPLES and fit.span >= self.min_span[pump_on]:
+            slope = fit.slope()
+            if slope is not None:
+                self.rates[pump_on] = slope * 86400.0
+                self.updated[pump_on] = t
+
+    def estimate(self, litres_per_mm=None):
+        """{"evaporation_mm_day", "fill_mm_day", ...}, plus L/day when the tank size is known."""
+        evap = -self.rates[False] if self.rates[False] is not None else None
+        fill = self.rates[True]
+        out = {"evaporation_mm_day": evap, "fill_mm_day": fill,
+               "evaporation_updated": self.updated[False], "fill_updated": self.updated[True]}
+        if litres_per_mm:
+            out["evaporation_l_day"] = evap * litres_per_mm if evap is not None else None
+            out["fill_l_day"] = fill * litres_per_mm if fill is not None else None
+        return out
+
+class CompressedArchive:
+    """
+    Compressed long-term history: years of readings in a few bytes each.
+
+    One file per series (<sid>.<metric>.gor) made of self-contained blocks
+    of up to BLOCK_ROWS samples:
+      header  BLOCK struct (magic, count, payload length, first/last time,
+              first/min/max value, time unit, value quantum)
+      payload one control byte per sample, then any escaped varints
+      crc32   of the payload
+    Readings are quantized at the source (level 0.1 mmWG, pH 0.01, TDS
+    1 ppm, ...), so values are stored as integer steps of QUANTA[metric]
+    and timestamps as integer TS_UNIT steps. Each sample is a
+    delta-of-delta of its timestamp and a delta of its value (Gorilla
+    style), zigzag encoded; both usually fit in a nibble, so a steady
+    sample costs one byte. Byte-aligned nibbles rather than Gorilla's
+    bit stream keep pure-Python encode/decode fast.
+
+    A sparse index (<sid>.<metric>.gor.idx, one INDEX record per block:
+    first/last time, file offset, end offset, min/max value) is held in
+    memory as arrays. Range reads bisect it straight to the first
+    overlapping block and stop after the last one, and threshold filters
+    skip blocks whose min/max cannot match, so a query costs in
+    proportion to its result rather than to the whole history. The index
+    is derived data: it is rebuilt from the block headers whenever it
+    does not end exactly where the archive file ends.
+    """
+    EXT = ".gor"
+    MAGIC = b"SGB1"
+    BLOCK = struct.Struct("<4sIIqqqqqdd")
+    CRC = struct.Struct("<I")
+    INDEX = struct.Struct("<qqQQqq")    # first/last time, offset, end offset, min/max value
+    BLOCK_ROWS = 4096
+    TS_UNIT = 0.1                   # seconds
+    QUANTA = {"level": 0.1, "temperature": 0.1, "ph": 0.01, "tds": 1.0, "cond": 1.0, "sal": 0.01}
+    DEFAULT_QUANTUM = 0.001
+
+    def __init__(self, root=HISTORY_DIR, readonly=False):
+        self.root = root
+        self.readonly = readonly    # another process owns the files: never repair or rewrite
+        self._lock = threading.Lock()
+        self._indexes = {}          # key -> _Index, loaded on first use
+        if not readonly:
+            os.makedirs(root, exist_ok=True)
+            self.recover()
+
+    def _path(self, key):
+        sid, metric = key
+        return os.path.join(self.root, f"{sid}.{metric}{self.EXT}")
+
+    @staticmethod
+    def encode(t, q):
+        """Integer times and values -> payload bytes (the first sample lives in the header)."""
+        out = bytearray()
+        append = out.append
+        prev_t, prev_d, prev_q = t[0], 0, q[0]
+        for i in range(1, len(t)):
+            d = t[i] - prev_t
+            dod = d - prev_d
+            dv = q[i] - prev_q
+            prev_t, prev_d, prev_q = t[i], d, q[i]
+            zt = dod << 1 if dod >= 0 else (-dod << 1) - 1
+            zv = dv << 1 if dv >= 0 else (-dv << 1) - 1
+            if zt < 15 and zv < 15:
+                append(zt << 4 | zv)
+                continue
+            append((zt if zt < 15 else 15) << 4 | (zv if zv < 15 else 15))
+            for z in ((zt,) if zt >= 15 else ()) + ((zv,) if zv >= 15 else ()):
+                z -= 15
+                while z >= 0x80:
+                    append(z & 0x7F | 0x80)
+                    z >>= 7
+                append(z)
+        return bytes(out)
+
+    @staticmethod
+    def decode(payload, count, t0, q0):
+        """Inverse of encode(): lists of integer times and values."""
+        t, q = [t0], [q0]
+        prev_t, prev_d, prev_q = t0, 0, q0
+        i, n = 0, len(payload)
+        while i < n and len(t) < count:
+            c = payload[i]
+            i += 1
+            zt, zv = c >> 4, c & 0x0F
+            if zt == 15:
+                z, shift = 0, 0
+                while True:
+                    b = payload[i]
+                    i += 1
+                    z |= (b & 0x7F) << shift
+                    shift += 7
+                    if b < 0x80:
+                        break
+                zt = z + 15
+            if zv == 15:
+                z, shift = 0, 0
+                while True:
+                    b = payload[i]
+                    i += 1
+                    z |= (b & 0x7F) << shift
+                    shift += 7
+                    if b < 0x80:
+                        break
+                zv = z + 15
+            prev_d += (zt >> 1) if not zt & 1 else -((zt + 1) >> 1)
+            prev_t += prev_d
+            prev_q += (zv >> 1) if not zv & 1 else -((zv + 1) >> 1)
+            t.append(prev_t)
+            q.append(prev_q)
+        return t, q
+
+    def _headers(self, f):
+        """(offset, header tuple) for each block header in an open file."""
+        off = 0
+        while True:
+            f.seek(off)
+            raw = f.read(self.BLOCK.size)
+            if len(raw) < self.BLOCK.size:
+                return
+            h = self.BLOCK.unpack(raw)
+            if h[0] != self.MAGIC:
+                return
+            yield off, h
+            off += self.BLOCK.size + h[2] + self.CRC.size
+
+    def recover(self):
+        """Cut each file after its last complete block with a valid checksum."""
+        try:
+            names = [n for n in os.listdir(self.root) if n.endswith(self.EXT)]
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.root, name)
+            sid, _, metric = name[:-len(self.EXT)].partition(".")
+            key = (sid, metric)
+            try:
+                size = os.path.getsize(path)
+                idx = self._load_index(key)     # headers are scanned only if the index is stale
+                with open(path, "rb") as f:
+                    # Only the newest block can be torn: check it fully
+                    while len(idx) and not self._block_ok(f, idx.off[-1], idx.end[-1]):
+                        idx.truncate(len(idx) - 1)
+                good = idx.end[-1] if len(idx) else 0
+                if good != size:
+                    with open(path, "ab") as f:
+                        f.truncate(good)
+                    with open(path + ".idx", "wb") as f:
+                        f.write(b"".join(self.INDEX.pack(*r) for r in idx.records()))
+                    log_history.warning("[HISTORY] Archive %s: dropped %s bytes of torn tail", name, size - good)
+                self._indexes[key] = idx
+            except Exception as e:
+                log_history.warning("[HISTORY] Archive recovery of %s failed: %s", name, e)
+
+    def _block_ok(self, f, off, end):
+        f.seek(off)
+        raw = f.read(end - off)
+        if len(raw) != end - off or len(raw) < self.BLOCK.size + self.CRC.size:
+            return False
+        h = self.BLOCK.unpack_from(raw, 0)
+        if h[0] != self.MAGIC or not h[1] or self.BLOCK.size + h[2] + self.CRC.size != len(raw):
+            return False
+        payload = raw[self.BLOCK.size:self.BLOCK.size + h[2]]
+        return self.CRC.unpack_from(raw, len(raw) - self.CRC.size)[0] == zlib.crc32(payload)
+
+    class _Index:
+        """Per-block columns of the sparse index."""
+        __slots__ = ("t0", "t1", "off", "end", "vmin", "vmax")
+
+        def __init__(self):
+            self.t0, self.t1 = array.array("q"), array.array("q")
+            self.off, self.end = array.array("Q"), array.array("Q")
+            self.vmin, self.vmax = array.array("q"), array.array("q")
+
+        def add(self, t0, t1, off, end, vmin, vmax):
+            self.t0.append(t0); self.t1.append(t1)
+            self.off.append(off); self.end.append(end)
+            self.vmin.append(vmin); self.vmax.append(vmax)
+
+        def __len__(self):
+            return len(self.t0)
+
+        def truncate(self, n):
+            for col in (self.t0, self.t1, self.off, self.end, self.vmin, self.vmax):
+                del col[n:]
+
+        def records(self, lo=0):
+            return zip(self.t0[lo:], self.t1[lo:], self.off[lo:], self.end[lo:], self.vmin[lo:], self.vmax[lo:])
+
+    def _index(self, key):
+        """Sparse index of one series (call under _lock)."""
+        idx = self._indexes.get(key)
+        if idx is None:
+            idx = self._indexes[key] = self._load_index(key)
+        return idx
+
+    def _load_index(self, key):
+        path = self._path(key)
+        idx = self._Index()
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return idx
+        try:
+            with open(path + ".idx", "rb") as f:
+                raw = f.read()
+            for rec in self.INDEX.iter_unpack(raw[:len(raw) - len(raw) % self.INDEX.size]):
+                idx.add(*rec)
+        except OSError:
+            pass
+        if (idx.end[-1] if len(idx) else 0) != size:
+            idx = self._rebuild_index(key, size)
+        return idx
+
+    def _rebuild_index(self, key, size):
+        path = self._path(key)
+        idx = self._Index()
+        with open(path, "rb") as f:
+            for off, h in self._headers(f):
+                end = off + self.BLOCK.size + h[2] + self.CRC.size
+                if end > size or not h[1]:
+                    break
+                idx.add(h[3], h[4], off, end, h[6], h[7])
+        if self.readonly:
+            return idx
+        with open(path + ".idx", "wb") as f:
+            f.write(b"".join(self.INDEX.pack(*r) for r in idx.records()))
+        log_history.info("[HISTORY] Rebuilt archive index for %s.%s (%s blocks)", key[0], key[1], len(idx))
+        return idx
+
+    def last_time(self, key):
+        """Newest stored timestamp (seconds) or None."""
+        with self._lock:
+            idx = self._index(key)
+            return idx.t1[-1] * self.TS_UNIT if len(idx) else None
+
+    def append(self, sid, metric, ts, vals):
+        """
+        Append a batch (ascending timestamps, seconds) as one or more blocks.
+        Samples at or before the newest stored one are skipped, so re-archiving
+        the same rows after a crash is harmless.
+        """
+        key = (sid, metric)
+        quantum = self.QUANTA.get(metric, self.DEFAULT_QUANTUM)
+        with self._lock:
+            idx = self._index(key)
+            last = idx.t1[-1] if len(idx) else None
+            t, q = [], []
+            for ti, vi in zip(ts, vals):
+                if vi != vi:
+                    continue
+                tu = int(round(ti / self.TS_UNIT))
+                if (last is not None and tu <= last) or (t and tu <= t[-1]):
+                    continue
+                t.append(tu)
+                q.append(int(round(vi / quantum)))
+            if not t:
+                return 0
+            first_new = len(idx)
+            path = self._path(key)
+            with open(path, "ab") as f:
+                off = f.seek(0, os.SEEK_END)
+                for s in range(0, len(t), self.BLOCK_ROWS):
+                    bt, bq = t[s:s + self.BLOCK_ROWS], q[s:s + self.BLOCK_ROWS]
+                    payload = self.encode(bt, bq)
+                    vmin, vmax = min(bq), max(bq)
+                    f.write(self.BLOCK.pack(self.MAGIC, len(bt), len(payload), bt[0], bt[-1],
+                                            bq[0], vmin, vmax, self.TS_UNIT, quantum))
+                    f.write(payload)
+                    f.write(self.CRC.pack(zlib.crc32(payload)))
+                    end = off + self.BLOCK.size + len(payload) + self.CRC.size
+                    idx.add(bt[0], bt[-1], off, end, vmin, vmax)
+                    off = end
+                f.flush()
+                os.fsync(f.fileno())
+            # Index after the data is durable; a missing tail entry just triggers a rebuild
+            with open(path + ".idx", "ab") as f:
+                f.write(b"".join(self.INDEX.pack(*r) for r in idx.records(first_new)))
+            return len(t)
+
+    def blocks(self, sid, metric, start=None, end=None, above=None, below=None):
+        """
+        Yield (timestamps, values) as array('d') for every block overlapping
+        [start, end] that can hold a value > above / < below. Only those
+        blocks are read from disk and decoded.
+        """
+        key = (sid, metric)
+        quantum = self.QUANTA.get(metric, self.DEFAULT_QUANTUM)
+        with self._lock:
+            idx = self._index(key)
+            lo = 0 if start is None else bisect.bisect_left(idx.t1, start / self.TS_UNIT)
+            hi = len(idx) if end is None else bisect.bisect_right(idx.t0, end / self.TS_UNIT)
+            picks = [(idx.off[i], idx.end[i]) for i in range(lo, hi)
+                     if (above is None or idx.vmax[i] * quantum > above)
+                     and (below is None or idx.vmin[i] * quantum < below)]
+        if not picks:
+            return
+        with open(self._path(key), "rb") as f:
+            for off, end_off in picks:
+                f.seek(off)
+                raw = f.read(end_off - off)
+                h = self.BLOCK.unpack_from(raw, 0)
+                _, count, plen, t0, _, q0, _, _, unit, q_unit = h
+                t, q = self.decode(raw[self.BLOCK.size:self.BLOCK.size + plen], count, t0, q0)
+                yield (array.array("d", [x * unit for x in t]),
+                       array.array("d", [x * q_unit for x in q]))
+
+    def read(self, sid, metric, start=None, end=None, above=None, below=None):
+        """All samples with start <= ts <= end (and value > above / < below) as (array('d'), array('d'))."""
+        out_ts, out_vals = array.array("d"), array.array("d")
+        for ts, vals in self.blocks(sid, metric, start, end, above, below):
+            lo = 0 if start is None else bisect.bisect_left(ts, start)
+            hi = len(ts) if end is None else bisect.bisect_right(ts, end)
+            if above is None and below is None:
+                out_ts += ts[lo:hi]
+                out_vals += vals[lo:hi]
+                continue
+            for i in range(lo, hi):
+                v = vals[i]
+                if (above is None or v > above) and (below is None or v < below):
+                    out_ts.append(ts[i])
+                    out_vals.append(v)
+        return out_ts, out_vals
+
+class ColumnStore:
+    """
+    Append-only long-term history on disk, one series per (sensor, metric).
+
+    Each series is a run of day segments (UTC) in `root`, each two
+    fixed-width column files:
+      <sid>.<metric>.<YYYYMMDD>.ts   float64 Unix timestamps, ascending
+      <sid>.<metric>.<YYYYMMDD>.f32  float32 values, same row order
+    (an unsegmented <sid>.<metric>.ts from older versions is read as the
+    oldest segment). append() only buffers in memory; a writer thread appends each
+    series' batch every `flush_s` seconds (one write per file, then
+    fsync), so the SD card sees a few large writes instead of one per
+    poll. Readers mmap the columns and bisect the timestamp column, so a
+    30-day window costs page faults rather than parsing.
+
+    Rollups: the same writer folds every flushed sample into running
+    min/max/mean/count buckets per tier (1 min, 1 h, 1 day, UTC aligned)
+    and appends each bucket to <sid>.<metric>.<tier> when it closes. The
+    open bucket lives in memory and is rebuilt from the raw columns at
+    start-up. compact() moves each raw segment that is entirely older than
+    `raw_days` into the compressed archive and deletes its files, so
+    expiry never rewrites the rows that are kept. 1-minute rows older
+    than `rollup_days["1m"]` are dropped by rewriting the tail to a .new
+    file and renaming it into place. window() reads through to the
+    archive for spans older than the raw columns.
+
+    Crash safety: the value column is written before the timestamp column
+    and a row counts only once both are complete. recover() runs at open,
+    finishes or discards an interrupted compaction and trims each segment
+    back to its last complete, in-order row.
+    """
+    TS, VAL = "d", "f"
+    TS_EXT, VAL_EXT = ".ts", ".f32"
+    TIERS = (("1m", 60), ("1h", 3600), ("1d", 86400))
+    ROLLUP = struct.Struct("<dfffI")     # bucket start, min, max, mean, count
+    COMPACT_EVERY_S = 6 * 3600
+    COMPACT_SLACK_S = 86400             # only rewrite a rollup once a day's worth has expired
+    SEG_S = 86400                       # raw segment length (UTC days)
+
+    def __init__(self, root=HISTORY_DIR, flush_s=60.0, raw_days=30, rollup_days=None, readonly=False):
+        self.root = root
+        self.flush_s = flush_s
+        self.raw_days = raw_days
+        self.rollup_days = {"1m": 365, "1h": None, "1d": None}
+        self.rollup_days.update(rollup_days or {})
+        self._pending = {}          # (sid, metric) -> (array('d'), array('f'))
+        self._pending_lock = threading.Lock()
+        self._io_lock = threading.RLock()   # file appends vs mmaps vs maintenance
+        self._maps = {}             # (key, ext, seg) -> (mmap, size)
+        self._acc = {}              # (key, tier) -> [bucket start, min, max, sum, count]
+        self._last_compact = 0.0
+        self._wake = threading.Event()
+        self._running = False
+        if not readonly:
+            # Read-only opens (CLI export while the GUI runs) must not trim a tail mid-append
+            os.makedirs(root, exist_ok=True)
+            self.recover()
+        self.archive = CompressedArchive(root, readonly=readonly)
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        self.flush()
+        with self._io_lock:
+            self._close_maps()
+
+    def _close_maps(self, key=None):
+        for k in [k for k in self._maps if key is None or k[0] == key]:
+            try:
+                self._maps.pop(k)[0].close()
+            except Exception:
+                pass
+
+    def _path(self, key, ext, seg=""):
+        sid, metric = key
+        if seg:
+            return os.path.join(self.root, f"{sid}.{metric}.{seg}{ext}")
+        return os.path.join(self.root, f"{sid}.{metric}{ext}")
+
+    def _seg_of(self, ts):
+        return time.strftime("%Y%m%d", time.gmtime(ts))
+
+    def _seg_span(self, seg):
+        """[start, end) covered by a day segment; None for the legacy unsegmented file."""
+        if not seg:
+            return None
+        start = calendar.timegm(time.strptime(seg, "%Y%m%d"))
+        return start, start + self.SEG_S
+
+    def _raw_files(self):
+        """{(sid, metric): [segment, ...] oldest first} for every raw timestamp column."""
+        out = {}
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return out
+        for name in names:
+            if not name.endswith(self.TS_EXT):
+                continue
+            parts = name[:-len(self.TS_EXT)].split(".")
+            if len(parts) == 2:
+                seg = ""                    # legacy single file: older than any segment
+            elif len(parts) == 3 and len(parts[2]) == 8 and parts[2].isdigit():
+                seg = parts[2]
+            else:
+                continue
+            out.setdefault((parts[0], parts[1]), []).append(seg)
+        for segs in out.values():
+            segs.sort()
+        return out
+
+    def _segments(self, key):
+        return self._raw_files().get(key, [])
+
+    def keys(self):
+        """Every (sid, metric) with a series on disk."""
+        return sorted(self._raw_files())
+
+    def recover(self):
+        """Finish/undo interrupted compactions, then trim torn or out-of-order tails."""
+        ts_size, val_size = array.array(self.TS).itemsize, array.array(self.VAL).itemsize
+        try:
+            leftovers = [n for n in os.listdir(self.root) if n.endswith(".new")]
+        except OSError:
+            leftovers = []
+        for name in leftovers:
+            path = os.path.join(self.root, name)
+            try:
+                if name.endswith(self.TS_EXT + ".new") and \
+                   not os.path.exists(path[:-len(self.TS_EXT + ".new")] + self.VAL_EXT + ".new"):
+                    os.replace(path, path[:-4])     # values already swapped in: commit the timestamps
+                else:
+                    os.unlink(path)                 # compaction never committed
+            except OSError as e:
+                log_history.warning("[HISTORY] Could not resolve %s: %s", name, e)
+        raw = self._raw_files()
+        try:
+            # A value column whose timestamps are gone is the tail of a segment delete
+            for name in os.listdir(self.root):
+                if name.endswith(self.VAL_EXT) and \
+                   not os.path.exists(os.path.join(self.root, name[:-len(self.VAL_EXT)] + self.TS_EXT)):
+                    os.unlink(os.path.join(self.root, name))
+        except OSError as e:
+            log_history.warning("[HISTORY] Could not remove orphaned value columns: %s", e)
+        for key, seg in ((k, seg) for k in sorted(raw) for seg in raw[k]):
+            ts_path, val_path = self._path(key, self.TS_EXT, seg), self._path(key, self.VAL_EXT, seg)
+            try:
+                n_ts = os.path.getsize(ts_path) // ts_size
+                n_val = os.path.getsize(val_path) // val_size if os.path.exists(val_path) else 0
+                n = min(n_ts, n_val)
+                # A zero-filled or stepped-back tail is not a real row
+                if n:
+                    with open(ts_path, "rb") as f:
+                        back = min(n, 64)
+                        f.seek((n - back) * ts_size)
+                        tail = array.array(self.TS)
+                        tail.frombytes(f.read(back * ts_size))
+                    keep = back
+                    while keep > 1 and not (0 < tail[keep - 1] >= tail[keep - 2]):
+                        keep -= 1
+                    if keep == 1 and not tail[0] > 0:
+                        keep = 0
+                    n -= back - keep
+                if not n:
+                    for path in (val_path, ts_path):
+                        if os.path.exists(path):
+                            os.unlink(path)
+                    log_history.warning("[HISTORY] Recovered %s.%s: dropped empty segment %s", key[0], key[1], seg or '(legacy)')
+                elif os.path.getsize(ts_path) != n * ts_size or os.path.getsize(val_path) != n * val_size:
+                    for path, size in ((ts_path, ts_size), (val_path, val_size)):
+                        with open(path, "ab") as f:
+                            f.truncate(n * size)
+                    log_history.warning("[HISTORY] Recovered %s.%s %s: trimmed to %s rows", key[0], key[1], seg or '(legacy)', n)
+            except Exception as e:
+                log_history.warning("[HISTORY] Recovery of %s.%s failed: %s", key[0], key[1], e)
+        for key in sorted(raw):
+            for tier, _ in self.TIERS:
+                path = self._path(key, "." + tier)
+                try:
+                    size = os.path.getsize(path)
+                    if size % self.ROLLUP.size:
+                        with open(path, "ab") as f:
+                            f.truncate(size - size % self.ROLLUP.size)
+                except OSError:
+                    pass
+
+    def append(self, sid, metric, ts, value):
+        """Buffer one sample (NaN is skipped); written by the next flush."""
+        if value != value:
+            return
+        with self._pending_lock:
+            cols = self._pending.get((sid, metric))
+            if cols is None:
+                cols = self._pending[(sid, metric)] = (array.array(self.TS), array.array(self.VAL))
+            cols[0].append(ts)
+            cols[1].append(value)
+
+    def _run(self):
+        try:
+            self.rebuild_rollups()
+        except Exception as e:
+            log_history.error("[HISTORY] Rollup rebuild failed: %s", e)
+        while self._running:
+            try:
+                self.flush()
+                if time.time() - self._last_compact >= self.COMPACT_EVERY_S:
+                    self._last_compact = time.time()
+                    self.compact()
+            except Exception as e:
+                log_history.error("[HISTORY] Flush failed: %s", e)
+            self._wake.wait(self.flush_s)
+            self._wake.clear()
+
+    def flush(self):
+        """Write every buffered batch now, then the rollup buckets it closed."""
+        with self._pending_lock:
+            batches, self._pending = self._pending, {}
+        if not batches:
+            return
+        with self._io_lock:
+            for key, (ts, vals) in batches.items():
+                ts, vals = self._append_rows(key, ts, vals)
+                self._write_rollups(key, self._fold(key, ts, vals))
+
+    def _append_rows(self, key, ts, vals):
+        """Append one batch to both columns; returns the rows actually written."""
+        last = self.last_ts(key)
+        if last is not None and ts and ts[0] < last:
+            # Keep the column ascending (clock stepped back): drop the overlap
+            keep = [i for i in range(len(ts)) if ts[i] >= last]
+            ts = array.array(self.TS, (ts[i] for i in keep))
+            vals = array.array(self.VAL, (vals[i] for i in keep))
+            if not ts:
+                return ts, vals
+        # One run per UTC day (a batch spans two only around midnight)
+        lo = 0
+        while lo < len(ts):
+            seg = self._seg_of(ts[lo])
+            hi = bisect.bisect_left(ts, self._seg_span(seg)[1], lo)
+            for path, col in ((self._path(key, self.VAL_EXT, seg), vals[lo:hi]),
+                              (self._path(key, self.TS_EXT, seg), ts[lo:hi])):
+                with open(path, "ab") as f:
+                    col.tofile(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+            lo = hi
+        return ts, vals
+
+    def rows(self, key):
+        n = 0
+        for seg in self._segments(key):
+            try:
+                n += os.path.getsize(self._path(key, self.TS_EXT, seg)) // array.array(self.TS).itemsize
+            except OSError:
+                pass
+        return n
+
+    def _seg_ts(self, key, seg, last=False):
+        """First (or last) timestamp of one segment, None if it is empty."""
+        path = self._path(key, self.TS_EXT, seg)
+        try:
+            n = os.path.getsize(path) // 8
+            if not n:
+                return None
+            with open(path, "rb") as f:
+                f.seek((n - 1) * 8 if last else 0)
+                return struct.unpack("<d", f.read(8))[0]
+        except OSError:
+            return None
+
+    def last_ts(self, key):
+        for seg in reversed(self._segments(key)):
+            t = self._seg_ts(key, seg, last=True)
+            if t is not None:
+                return t
+        return None
+
+    def first_ts(self, key):
+        """Oldest raw (not yet archived) timestamp of a series, or None."""
+        for seg in self._segments(key):
+            t = self._seg_ts(key, seg)
+            if t is not None:
+                return t
+        return None
+
+    # Rollups
+    def _fold(self, key, ts, vals, tiers=None):
+        """Fold samples into the open buckets; returns {tier: [closed rows]}."""
+        closed = {}
+        for tier, width in tiers or self.TIERS:
+            acc = self._acc.get((key, tier))
+            rows = closed[tier] = []
+            for t, v in zip(ts, vals):
+                b = t - t % width
+                if acc is None or b != acc[0]:
+                    if acc is not None and b > acc[0]:
+                        rows.append((acc[0], acc[1], acc[2], acc[3] / acc[4], acc[4]))
+                    elif acc is not None:
+                        continue        # older than the open bucket (already rolled up)
+                    acc = [b, v, v, 0.0, 0]
+                if v < acc[1]:
+                    acc[1] = v
+                if v > acc[2]:
+                    acc[2] = v
+                acc[3] += v
+                acc[4] += 1
+            if acc is not None:
+                self._acc[(key, tier)] = acc
+        return closed
+
+    def _write_rollups(self, key, closed):
+        for tier, rows in closed.items():
+            if not rows:
+                continue
+            with open(self._path(key, "." + tier), "ab") as f:
+                f.write(b"".join(self.ROLLUP.pack(*r) for r in rows))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _last_rollup_start(self, key, tier):
+        path = self._path(key, "." + tier)
+        try:
+            size = os.path.getsize(path)
+            if size < self.ROLLUP.size:
+                return None
+            with open(path, "rb") as f:
+                f.seek(size - self.ROLLUP.size)
+                return self.ROLLUP.unpack(f.read(self.ROLLUP.size))[0]
+        except OSError:
+            return None
+
+    def rebuild_rollups(self):
+        """
+        Restore the open buckets after a restart (and write any bucket that
+        closed before the crash) by re-reading raw rows past the last
+        rollup row of each tier.
+        """
+        with self._io_lock:
+            for key in self.keys():
+                closed = {}
+                for tier, width in self.TIERS:
+                    last = self._last_rollup_start(key, tier)
+                    ts, vals = self.window(key[0], key[1], None if last is None else last + width)
+                    if ts:
+                        self._acc.pop((key, tier), None)
+                        closed.update(self._fold(key, ts, vals, tiers=((tier, width),)))
+                self._write_rollups(key, closed)
+
+    def _open_bucket(self, key, tier):
+        acc = self._acc.get((key, tier))
+        if not acc or not acc[4]:
+            return None
+        return (acc[0], acc[1], acc[2], acc[3] / acc[4], acc[4])
+
+    def rollups(self, sid, metric, tier, start=None, end=None):
+        """
+        Rollup rows (bucket start, min, max, mean, count) whose bucket starts
+        within [start, end], including the still-open bucket.
+        """
+        key = (sid, metric)
+        out = []
+        with self._io_lock:
+            mm = self._map(key, "." + tier)
+            if mm is not None:
+                size = self.ROLLUP.size
+                n = len(mm) // size
+                starts = _StructColumn(mm, self.ROLLUP, n)
+                lo = 0 if start is None else bisect.bisect_left(starts, start)
+                hi = n if end is None else bisect.bisect_right(starts, end)
+                out = [self.ROLLUP.unpack_from(mm, i * size) for i in range(lo, hi)]
+            cur = self._open_bucket(key, tier)
+        if cur and (start is None or cur[0] >= start) and (end is None or cur[0] <= end) \
+           and (not out or cur[0] > out[-1][0]):
+            out.append(cur)
+        return out
+
+    def best_tier(self, start, end, max_points):
+        """Finest tier ("raw", "1m", "1h", "1d") whose span fits in max_points rows."""
+        span = max(0.0, end - start)
+        for tier, width in (("raw", 0.4),) + self.TIERS:
+            if span / width <= max_points:
+                return tier
+        return self.TIERS[-1][0]
+
+    # Retention
+    def compact(self, now=None):
+        """Archive raw segments older than raw_days; drop rollup rows past their tier's retention."""
+        now = time.time() if now is None else now
+        for key in self.keys():
+            try:
+                with self._io_lock:
+                    if self.raw_days:
+                        self._compact_raw(key, now - self.raw_days * 86400)
+                    for tier, _ in self.TIERS:
+                        days = self.rollup_days.get(tier)
+                        if days:
+                            self._compact_rollup(key, tier, now - days * 86400)
+            except Exception as e:
+                log_history.warning("[HISTORY] Compaction of %s.%s failed: %s", key[0], key[1], e)
+
+    def _rewrite_from(self, path, offset):
+        """Write path[offset:] to path.new (fsynced); caller renames it into place."""
+        with open(path, "rb") as src, open(path + ".new", "wb") as dst:
+            src.seek(offset)
+            shutil.copyfileobj(src, dst, 1 << 20)
+            dst.flush()
+            os.fsync(dst.fileno())
+
+    def _compact_raw(self, key, cutoff):
+        """Archive and delete every segment whose rows are all older than cutoff."""
+        segs = self._segments(key)
+        for seg in segs[:-1]:           # never the segment appends are going to
+            span = self._seg_span(seg)
+            end = span[1] if span else self._seg_ts(key, seg, last=True)
+            if end is not None and end > cutoff:
+                break
+            # Archive first: if we crash before the delete, the next pass
+            # re-archives the same rows and append() skips them
+            old_ts, old_vals = self._read_raw(key, None, None, segs=(seg,))
+            self.archive.append(key[0], key[1], old_ts, old_vals)
+            self._close_maps(key)
+            # Timestamps first: recover() removes a value column left without them
+            os.unlink(self._path(key, self.TS_EXT, seg))
+            os.unlink(self._path(key, self.VAL_EXT, seg))
+            log_history.info("[HISTORY] Compacted %s.%s: archived segment %s, %s raw rows", key[0], key[1], seg or '(legacy)', len(old_ts))
+
+    def _compact_rollup(self, key, tier, cutoff):
+        mm = self._map(key, "." + tier)
+        if mm is None:
+            return
+        starts = _StructColumn(mm, self.ROLLUP, len(mm) // self.ROLLUP.size)
+        if starts[0] >= cutoff - self.COMPACT_SLACK_S:
+            return
+        n_drop = bisect.bisect_left(starts, cutoff)
+        self._close_maps(key)
+        path = self._path(key, "." + tier)
+        self._rewrite_from(path, n_drop * self.ROLLUP.size)
+        os.replace(path + ".new", path)
+
+    def _map(self, key, ext, seg=""):
+        """mmap of one column file, remapped when it has grown. Call under _io_lock."""
+        path = self._path(key, ext, seg)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        cached = self._maps.get((key, ext, seg))
+        if cached and cached[1] == size:
+            return cached[0]
+        if cached:
+            cached[0].close()
+            del self._maps[(key, ext, seg)]
+        if not size:
+            return None
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        self._maps[(key, ext, seg)] = (mm, size)
+        return mm
+
+    def _read_raw(self, key, start=None, end=None, after=None, limit=None, segs=None):
+        """
+        Raw rows with start <= ts <= end (ts > after instead of start when
+        given), at most `limit`, across the day segments. Call under _io_lock.
+        """
+        out_ts, out_vals = array.array(self.TS), array.array(self.VAL)
+        low = after if after is not None else start
+        for seg in self._segments(key) if segs is None else segs:
+            span = self._seg_span(seg)
+            if span and low is not None and span[1] <= low:
+                continue
+            if span and end is not None and span[0] > end:
+                break
+            ts_map, val_map = self._map(key, self.TS_EXT, seg), self._map(key, self.VAL_EXT, seg)
+            if ts_map is None or val_map is None:
+                continue
+            with memoryview(ts_map) as raw_ts, memoryview(val_map) as raw_vals:
+                n = min(len(raw_ts) // out_ts.itemsize, len(raw_vals) // out_vals.itemsize)
+                with raw_ts[:n * out_ts.itemsize].cast(self.TS) as col_ts:
+                    if after is not None:
+                        lo = bisect.bisect_right(col_ts, after)
+                    else:
+                        lo = 0 if start is None else bisect.bisect_left(col_ts, start)
+                    hi = n if end is None else bisect.bisect_right(col_ts, end)
+                    if limit is not None:
+                        hi = min(hi, lo + limit - len(out_ts))
+                    if hi > lo:
+                        out_ts.frombytes(raw_ts[lo * out_ts.itemsize:hi * out_ts.itemsize])
+                        out_vals.frombytes(raw_vals[lo * out_vals.itemsize:hi * out_vals.itemsize])
+            if limit is not None and len(out_ts) >= limit:
+                break
+        return out_ts, out_vals
+
+    def window(self, sid, metric, start=None, end=None):
+        """(timestamps array('d'), values array('f')) with start <= ts <= end, from disk."""
+        key = (sid, metric)
+        out_ts, out_vals = array.array(self.TS), array.array(self.VAL)
+        with self._io_lock:
+            first = self.first_ts(key)
+            if start is None or first is None or start < first:
+                # Older than the raw columns: read through to the archive
+                arch_end = end if first is None else (first if end is None else min(end, first))
+                a_ts, a_vals = self.archive.read(sid, metric, start, arch_end)
+                n = len(a_ts) if first is None else bisect.bisect_left(a_ts, first)
+                out_ts += a_ts[:n]
+                out_vals += array.array(self.VAL, a_vals[:n])
+            if first is None:
+                return out_ts, out_vals
+            raw_ts, raw_vals = self._read_raw(key, start, end)
+        out_ts += raw_ts
+        out_vals += raw_vals
+        return out_ts, out_vals
+
+    def iter_window(self, sid, metric, start=None, end=None, chunk_rows=8192):
+        """
+        Like window(), but yields (ts, values) chunks: archive blocks first,
+        then raw rows `chunk_rows` at a time. The lock is held per chunk only,
+        and the raw cursor is a timestamp, so appends and compaction may run
+        in between.
+        """
+        key = (sid, metric)
+        with self._io_lock:
+            first = self.first_ts(key)
+        if start is None or first is None or start < first:
+            arch_end = end if first is None else (first if end is None else min(end, first))
+            for ts, vals in self.archive.blocks(sid, metric, start, arch_end):
+                lo = 0 if start is None else bisect.bisect_left(ts, start)
+                hi = len(ts) if arch_end is None else bisect.bisect_right(ts, arch_end)
+                if first is not None:
+                    hi = min(hi, bisect.bisect_left(ts, first))
+                if hi > lo:
+                    yield ts[lo:hi], vals[lo:hi]
+        if first is None:
+            return
+        after = None        # last timestamp yielded from the raw columns
+        while True:
+            with self._io_lock:
+                ts_out, vals_out = self._read_raw(key, start, end, after, chunk_rows)
+            if not ts_out:
+                return
+            after = ts_out[-1]
+            yield ts_out, vals_out
+
+def _downsample(chunks, seconds):
+    """(ts, values) chunks -> (bucket start, mean) pairs, one per `seconds` bucket."""
+    bucket, total, n = None, 0.0, 0
+    for ts, vals in chunks:
+        for t, v in zip(ts, vals):
+            b = t - t % seconds
+            if b != bucket:
+                if n:
+                    yield bucket, total / n
+                bucket, total, n = b, 0.0, 0
+            total += v
+            n += 1
+    if n:
+        yield bucket, total / n
+
+def _flatten(chunks):
+    for ts, vals in chunks:
+        yield from zip(ts, vals)
+
+def iter_export_rows(store, series, start=None, end=None, every=None, cancel=None):
+    """
+    (ts, sid, metric, value) for every requested series, merged in time
+    order. Each series is streamed chunk by chunk from the store, so memory
+    stays flat however long the range is. Raises InterruptedError at the
+    next chunk once `cancel` (threading.Event) is set.
+    """
+    def checked(chunks):
+        for chunk in chunks:
+            if cancel is not None and cancel.is_set():
+                raise InterruptedError
+            yield chunk
+
+    def rows(sid, metric):
+        chunks = checked(store.iter_window(sid, metric, start, end))
+        pairs = _downsample(chunks, every) if every else _flatten(chunks)
+        for t, v in pairs:
+            yield t, sid, metric, v
+    return heapq.merge(*(rows(sid, metric) for sid, metric in series))
+
+def export_history(store, path, series, start=None, end=None, fmt="csv", every=None,
+                   progress=None, cancel=None):
+    """
+    Stream history to CSV or JSON Lines (gzip when path ends in .gz).
+    Written to path.part and renamed on success. progress(rows) is called
+    every 50 000 rows; setting `cancel` (threading.Event) stops the export
+    at the next chunk read from the store.
+    Returns the number of rows written, or None if cancelled.
+    """
+    import csv
+    import gzip
+    tmp = path + ".part"
+    opener = gzip.open if path.endswith(".gz") else open
+    rows = 0
+    try:
+        with opener(tmp, "wt", newline="", encoding="utf-8") as f:
+            if fmt == "csv":
+                w = csv.writer(f)
+                w.writerow(["time", "unix", "sensor", "metric", "value"])
+            for t, sid, metric, v in iter_export_rows(store, series, start, end, every, cancel):
+                local = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(t))
+                if fmt == "csv":
+                    w.writerow([local, f"{t:.1f}", sid, metric, f"{v:.6g}"])
+                else:
+                    f.write(json.dumps({"time": local, "unix": round(t, 1), "sensor": sid,
+                                        "metric": metric, "value": float(f"{v:.6g}")}) + "\n")
+                rows += 1
+                if rows % 50000 == 0 and progress:
+                    progress(rows)
+        os.replace(tmp, path)
+        return rows
+    except InterruptedError:
+        return None
+    finally:
+        if os.path.exists(tmp):
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+def export_cli(argv):
+    """`SAM-Max.py export ...`: export recorded history without the GUI."""
+    import argparse
+    import datetime
+    import re
+
+    relative = re.compile(r"^(?:ago:|-)?(\d+(?:\.\d+)?)([hd])$")
+
+    def when(text):
+        text = text.strip()
+        m = relative.match(text)            # relative: 12h, 30d, ago:30d, -30d
+        if m:
+            return time.time() - float(m.group(1)) * (3600 if m.group(2) == "h" else 86400)
+        return datetime.datetime.fromisoformat(text).timestamp()
+
+    # argparse reads "--from -30d" as a missing value followed by an option:
+    # glue a dash-relative value onto its flag ("--from=-30d")
+    argv = list(argv)
+    for i in range(len(argv) - 1, 0, -1):
+        if argv[i - 1] in ("--from", "--to") and relative.match(argv[i]):
+            argv[i - 1:i + 1] = [f"{argv[i - 1]}={argv[i]}"]
+
+    ap = argparse.ArgumentParser(prog="SAM-Max.py export", description="Export recorded readings.")
+    ap.add_argument("-o", "--out", required=True, help="output file (.csv, .jsonl, optionally .gz)")
+    ap.add_argument("--from", dest="start", type=when, help="ISO date/time, or time ago: 30d / 12h (also ago:30d, -30d)")
+    ap.add_argument("--to", dest="end", type=when, help="ISO date/time, or time ago like 1d")
+    ap.add_argument("--series", help="comma list like A.level,D.ph (default: all)")
+    ap.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file name")
+    ap.add_argument("--every", type=float, help="downsample to the mean of each N-second bucket")
+    ap.add_argument("--history", default=HISTORY_DIR, help="history folder")
+    args = ap.parse_args(argv)
+
+    store = ColumnStore(args.history, readonly=True)
+    series = store.keys()
+    if args.series:
+        wanted = {tuple(s.strip().split(".", 1)) for s in args.series.split(",") if "." in s}
+        series = [k for k in series if k in wanted]
+    if not series:
+        print("No matching series in", os.path.abspath(args.history), file=sys.stderr)
+        return 1
+    fmt = args.format or ("jsonl" if ".jsonl" in args.out or ".json" in args.out else "csv")
+    t0 = time.monotonic()
+    rows = export_history(store, args.out, series, args.start, args.end, fmt, args.every,
+                          progress=lambda n: print(f"{n} rows...", file=sys.stderr))
+    print(f"Wrote {rows} rows to {args.out} in {time.monotonic() - t0:.1f} s", file=sys.stderr)
+    return 0
+
+# Pump on/off transitions are stored as a history series next to the
+# sensor that drives the pump: 0.0 when switched off, and when switched on
+# a code for why, so reports can tell real top-ups from keep-alive cycles
+# and hand toggles (rows written before the codes read as auto)
+PUMP_SERIES = {"RO Pump A": ("A", "pump"), "RO Pump B": ("B", "pump")}
+PUMP_ON_CAUSE = {"auto": 1.0, "keepalive": 2.0, "manual": 3.0, "ipc": 4.0}
+REPORT_GAP_S = 120.0    # a longer gap between samples is downtime, not time spent at a value
+
+def _report_columns(store, sid, metric, start, end, np):
+    """
+    (ts, values) with start <= ts < end as float64 arrays. With NumPy the
+    raw day segments are memory-mapped directly when they reach back to
+    `start`; otherwise (or for archived days) the rows come from
+    store.window().
+    """
+    key = (sid, metric)
+    if np is not None:
+        first = store.first_ts(key)
+        if first is not None and first <= start:
+            parts_ts, parts_vals = [], []
+            for seg in store._segments(key):
+                span = store._seg_span(seg)
+                if span and (span[1] <= start or span[0] >= end):
+                    continue
+                try:
+                    ts = np.memmap(store._path(key, store.TS_EXT, seg), dtype="<f8", mode="r")
+                    vals = np.memmap(store._path(key, store.VAL_EXT, seg), dtype="<f4", mode="r")
+                except (OSError, ValueError):       # missing or empty column
+                    continue
+                n = min(len(ts), len(vals))     # values are written before timestamps
+                lo, hi = np.searchsorted(ts[:n], (start, end))
+                parts_ts.append(ts[lo:hi])
+                parts_vals.append(vals[lo:hi].astype(np.float64))
+            if parts_ts:
+                return np.concatenate(parts_ts), np.concatenate(parts_vals)
+            return np.empty(0), np.empty(0)
+    ts, vals = store.window(sid, metric, start, end)
+    hi = bisect.bisect_left(ts, end)
+    if np is not None:
+        return np.frombuffer(ts, dtype=np.float64)[:hi], np.asarray(vals[:hi], dtype=np.float64)
+    return ts[:hi], vals[:hi]
+
+def _series_stats(ts, vals, end, band, np):
+    """min / max / mean / std, plus time spent outside `band` (lo, hi) when given."""
+    n = len(ts)
+    if not n:
+        return None
+    if np is not None:
+        # Each sample holds until the next one (capped at REPORT_GAP_S)
+        dt = np.minimum(np.diff(ts, append=max(end, ts[-1])), REPORT_GAP_S)
+        out = {"n": n, "min": float(vals.min()), "max": float(vals.max()),
+               "mean": float(vals.mean()), "std": float(vals.std()), "covered_s": float(dt.sum())}
+        if band:
+            lo, hi = band
+            out["outside_s"] = float(dt[(vals <= lo) | (vals >= hi)].sum())
+        return out
+    total = sq = covered = outside = 0.0
+    vmin = vmax = vals[0]
+    for i in range(n):
+        v = vals[i]
+        dt = min((ts[i + 1] if i + 1 < n else max(end, ts[i])) - ts[i], REPORT_GAP_S)
+        total += v
+        sq += v * v
+        covered += dt
+        if v < vmin: vmin = v
+        if v > vmax: vmax = v
+        if band and (v <= band[0] or v >= band[1]):
+            outside += dt
+    mean = total / n
+    out = {"n": n, "min": vmin, "max": vmax, "mean": mean,
+           "std": math.sqrt(max(sq / n - mean * mean, 0.0)), "covered_s": covered}
+    if band:
+        out["outside_s"] = outside
+    return out
+
+def _pump_stats(store, sid, metric, start, end):
+    """
+    Runtime (s), switch-ons and top-ups (automatic switch-ons only) in
+    [start, end) from the transition series.
+    """
+    ts, vals = store.window(sid, metric, None, end)     # a few rows per day
+    i = bisect.bisect_left(ts, start)
+    on = vals[i - 1] >= 0.5 if i else False            # state carried in from the day before
+    since, runtime, starts, top_ups = start, 0.0, 0, 0
+    for t, v in zip(ts[i:], vals[i:]):
+        if t >= end:
+            break
+        if v >= 0.5 and not on:
+            on, since, starts = True, t, starts + 1
+            if round(v) == PUMP_ON_CAUSE["auto"]:
+                top_ups += 1
+        elif v < 0.5 and on:
+            on, runtime = False, runtime + (t - since)
+    if on:
+        runtime += max(min(end, time.time()) - since, 0.0)
+    return {"runtime_s": runtime, "starts": starts, "top_ups": top_ups}
+
+def daily_report(store, day_start, day_end, bands=None, use_numpy=True):
+    """
+    Statistics for every recorded series over [day_start, day_end) as a
+    JSON-ready dict. Uses NumPy (vectorized over memory-mapped columns)
+    when it is installed, else plain loops over array('d'). Meant for a
+    worker process: see report_cli().
+    """
+    np = None
+    if use_numpy:
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+    bands = bands or {}
+    t0 = time.monotonic()
+    pump_keys = set(PUMP_SERIES.values())
+    series = {}
+    for sid, metric in store.keys():
+        if (sid, metric) in pump_keys:
+            continue
+        name = f"{sid}.{metric}"
+        ts, vals = _report_columns(store, sid, metric, day_start, day_end, np)
+        st = _series_stats(ts, vals, day_end, bands.get(name), np)
+        if st:
+            series[name] = st
+    pumps = {pump: _pump_stats(store, sid, metric, day_start, day_end)
+             for pump, (sid, metric) in PUMP_SERIES.items()}
+    return {
+        "start": day_start,
+        "end": day_end,
+        "engine": "numpy" if np is not None else "python",
+        "elapsed_s": round(time.monotonic() - t0, 3),
+        "bands": bands,
+        "series": series,
+        "pumps": pumps,
+    }
+
+def report_cli(argv):
+    """`SAM-Max.py report ...`: write one day's statistics as JSON (run by the GUI in a worker process)."""
+    import argparse
+    import datetime
+
+    ap = argparse.ArgumentParser(prog="SAM-Max.py report", description="Daily reading statistics.")
+    ap.add_argument("--day", help="YYYY-MM-DD (local time, default: yesterday)")
+    ap.add_argument("--bands", default="{}", help='alarm bands as JSON, e.g. {"D.ph": [7.6, 8.4]}')
+    ap.add_argument("--history", default=HISTORY_DIR, help="history folder")
+    ap.add_argument("-o", "--out", help=f"output file (default: {REPORT_DIR}/<day>.json)")
+    ap.add_argument("--no-numpy", action="store_true", help="use the pure-Python path")
+    args = ap.parse_args(argv)
+
+    day = (datetime.date.fromisoformat(args.day) if args.day
+           else datetime.date.today() - datetime.timedelta(days=1))
+    start = datetime.datetime.combine(day, datetime.time()).timestamp()
+    end = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time()).timestamp()
+    bands = {k: (float(v[0]), float(v[1])) for k, v in json.loads(args.bands).items()}
+
+    store = ColumnStore(args.history, readonly=True)
+    report = daily_report(store, start, end, bands, use_numpy=not args.no_numpy)
+    report["day"] = day.isoformat()
+    out = args.out or os.path.join(REPORT_DIR, f"{day.isoformat()}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out + ".tmp", "w") as f:
+        json.dump(report, f, separators=(",", ":"))
+    os.replace(out + ".tmp", out)
+    print(out)
+    return 0
+
+def bench_history(source=None, out=sys.stdout):
+    """
+    `SAM-Max.py --bench-history [history_dir]`: bytes per sample and
+    encode/decode throughput of the compressed archive, against the raw
+    columns. Uses a synthetic day of readings, plus the real series in
+    history_dir when given (read only).
+    """
+    import random
+    import tempfile
+
+    series = {}
+    rnd = random.Random(1)
+    n = 86400
+    t, ts = time.time() - n * 1.2, []
+    for _ in range(n):
+        t += 1.2 + rnd.gauss(0, 0.03)
+        ts.append(t)
+    walks = {"level": (250.0, 0.1, 0.1), "temperature": (25.0, 0.1, 0.02),
+             "ph": (7.8, 0.01, 0.2), "tds": (150.0, 1.0, 0.05)}
+    for metric, (v, step, p) in walks.items():
+        vals = []
+        for _ in range(n):
+            if rnd.random() < p:
+                v += step if rnd.random() < 0.5 else -step
+            vals.append(round(v / step) * step)
+        series[("synthetic", metric)] = (array.array("d", ts), array.array("d", vals))
+
+    if source:
+        # <sid>.<metric>[.<YYYYMMDD>].ts, read directly so nothing in source is touched
+        runs = {}
+        for name in os.listdir(source):
+            parts = name.split(".")
+            if name.endswith(ColumnStore.TS_EXT) and len(parts) in (3, 4):
+                runs.setdefault((parts[0], parts[1]), []).append(parts[2] if len(parts) == 4 else "")
+        for (sid, metric), segs in sorted(runs.items()):
+            rts, rvals = array.array("d"), array.array("f")
+            try:
+                for seg in sorted(segs):    # the unsegmented legacy file ("") is the oldest
+                    base = os.path.join(source, f"{sid}.{metric}.{seg}" if seg else f"{sid}.{metric}")
+                    part_ts, part_vals = array.array("d"), array.array("f")
+                    with open(base + ColumnStore.TS_EXT, "rb") as f:
+                        part_ts.frombytes(f.read())
+                    with open(base + ColumnStore.VAL_EXT, "rb") as f:
+                        part_vals.frombytes(f.read())
+                    k = min(len(part_ts), len(part_vals))
+                    rts += part_ts[:k]
+                    rvals += part_vals[:k]
+            except OSError:
+                continue
+            if rts:
+                series[(sid, metric)] = (rts, array.array("d", rvals))
+
+    raw_bytes = array.array(ColumnStore.TS).itemsize + array.array(ColumnStore.VAL).itemsize
+    print(f"{'series':<24}{'samples':>9}{'B/sample':>10}{'vs raw':>8}{'encode/s':>11}{'decode/s':>11}{'1 h read ms':>13}",
+          file=out)
+    with tempfile.TemporaryDirectory() as tmp:
+        arch = CompressedArchive(tmp)
+        for (sid, metric), (sts, svals) in series.items():
+            t0 = time.perf_counter()
+            count = arch.append(sid, metric, sts, svals)
+            enc = time.perf_counter() - t0
+            size = os.path.getsize(arch._path((sid, metric)))
+            t0 = time.perf_counter()
+            back_ts, back_vals = arch.read(sid, metric)
+            dec = time.perf_counter() - t0
+            mid = sts[len(sts) // 2]
+            t0 = time.perf_counter()
+            arch.read(sid, metric, mid, mid + 3600)
+            rng = time.perf_counter() - t0
+            per = size / count if count else 0.0
+            print(f"{sid + '.' + metric:<24}{count:>9}{per:>10.2f}{raw_bytes / per if per else 0:>7.1f}x"
+                  f"{count / enc if enc else 0:>11.0f}{len(back_ts) / dec if dec else 0:>11.0f}{rng * 1000:>13.1f}",
+                  file=out)
+
+class _StructColumn:
+    """First field of each fixed-size record in a buffer, as a sequence (for bisect)."""
+    __slots__ = ("buf", "fmt", "n")
+
+    def __init__(self, buf, fmt, n):
+        self.buf, self.fmt, self.n = buf, fmt, n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        return self.fmt.unpack_from(self.buf, i * self.fmt.size)[0]
+
+class EventJournal:
+    """
+    Pump, keep-alive, override, alarm and connectivity events in SQLite.
+
+    record() only puts a row on a queue, so the control path never waits
+    on the SD card. One writer thread owns the connection (WAL mode) and
+    commits whatever has queued up every `flush_s` seconds in a single
+    transaction. Readers open their own connection; WAL lets them run
+    alongside the writer.
+
+      events(id, ts, kind, entity, value, detail)
+        kind    pump | keepalive | override | alarm | sensor
+        entity  pump name, alarm key or sensor id
+        value   new state ("on", "off", "critical", "connected", ...)
+        detail  optional JSON object
+    """
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS events ("
+        " id INTEGER PRIMARY KEY, ts REAL NOT NULL, kind TEXT NOT NULL,"
+        " entity TEXT NOT NULL, value TEXT, detail TEXT)",
+        "CREATE INDEX IF NOT EXISTS events_ts ON events (ts)",
+        "CREATE INDEX IF NOT EXISTS events_entity_ts ON events (entity, ts)",
+    )
+
+    def __init__(self, path=EVENTS_PATH, flush_s=2.0):
+        self.path = path
+        self.flush_s = flush_s
+        self._q = queue.SimpleQueue()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def record(self, kind, entity, value=None, **detail):
+        """Queue one event (never blocks)."""
+        self._q.put((time.time(), kind, str(entity), None if value is None else str(value),
+                     json.dumps(detail) if detail else None))
+
+    def _run(self):
+        import sqlite3
+        try:
+            db = sqlite3.connect(self.path)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            for stmt in self.SCHEMA:
+                db.execute(stmt)
+            db.commit()
+        except Exception as e:
+            log_events.warning("[EVENTS] Journal disabled: %s", e)
+            return
+        finally:
+            self._ready.set()
+        while True:
+            row = self._q.get()
+            if row is None:
+                break
+            time.sleep(self.flush_s)    # let a burst collect into one transaction
+            rows, stop = [row], False
+            while True:
+                try:
+                    r = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if r is None:
+                    stop = True
+                    break
+                rows.append(r)
+            try:
+                with db:
+                    db.executemany("INSERT INTO events (ts, kind, entity, value, detail) VALUES (?, ?, ?, ?, ?)", rows)
+            except Exception as e:
+                log_events.error("[EVENTS] Write of %s events failed: %s", len(rows), e)
+            if stop:
+                break
+        db.close()
+
+    def close(self, timeout=5.0):
+        """Write what is queued and stop the writer."""
+        self._q.put(None)
+        self._thread.join(timeout)
+
+    def query(self, kind=None, entity=None, start=None, end=None, value=None, limit=500):
+        """Newest-first events matching every given filter, as dicts."""
+        import sqlite3
+        self._ready.wait(5.0)
+        where, args = [], []
+        for col, v in (("kind", kind), ("entity", entity), ("value", value)):
+            if v is not None:
+                where.append(f"{col} = ?")
+                args.append(str(v))
+        if start is not None:
+            where.append("ts >= ?")
+            args.append(float(start))
+        if end is not None:
+            where.append("ts <= ?")
+            args.append(float(end))
+        sql = "SELECT ts, kind, entity, value, detail FROM events"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC LIMIT ?"
+        args.append(int(limit))
+        db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            rows = db.execute(sql, args).fetchall()
+        finally:
+            db.close()
+        return [{"ts": ts, "kind": k, "entity": e, "value": v, "detail": json.loads(d) if d else None}
+                for ts, k, e, v, d in rows]
+
+class LocalIPCServer:
+    """
+    Unix domain socket endpoint so local tools can share SAM-Max's sensor
+    sessions instead of opening their own (the firmware only accepts one).
+
+    Protocol: newline-delimited JSON both ways.
+      server -> client: {"type": "snapshot", ...} on connect, then one
+                        {"type": "reading"|"pump", ...} line per update
+      client -> server: {"cmd": "snapshot"|"tare"|"pump"|"reset", ...}
+                        answered with {"type": "reply", "ok": bool, ...}
+    Updates are taken from the ReadingsTable, so serving clients never
+    touches the sensors.
+    """
+    MAX_CLIENTS = 8
+    CLIENT_QUEUE = 256
+
+    def __init__(self, path, readings, handler, poll_interval=0.2):
+        self.path = path
+        self.readings = readings
+        self.handler = handler              # callable(dict) -> dict (reply)
+        self.poll_interval = poll_interval
+        self._clients = {}                  # socket -> queue.Queue of bytes
+        self._clients_lock = threading.Lock()
+        self._sock = None
+        self._running = False
+
+    def start(self):
+        try:
+            if os.path.exists(self.path):
+                os.unlink(self.path)        # stale socket from a previous run
+        except Exception:
+            pass
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        try:
+            os.chmod(self.path, 0o660)
+        except Exception:
+            pass
+        self._sock.listen(self.MAX_CLIENTS)
+        self._running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._broadcast_loop, daemon=True).start()
+        log_ipc.info("[IPC] Listening on %s", self.path)
+
+    def stop(self):
+        self._running = False
+        try:
+            if self._sock:
+                self._sock.close()
+        except Exception:
+            pass
+        with self._clients_lock:
+            for c in list(self._clients):
+                try: c.close()
+                except Exception: pass
+            self._clients.clear()
+        try:
+            os.unlink(self.path)
+        except Exception:
+            pass
+
+    @staticmethod
+    def encode(obj) -> bytes:
+        # NaN means "no value" in the table; JSON has no NaN
+        def clean(v):
+            if isinstance(v, float) and v != v:
+                return None
+            if isinstance(v, dict):
+                return {k: clean(x) for k, x in v.items()}
+            return v
+        return (json.dumps(clean(obj), separators=(",", ":")) + "\n").encode()
+
+    @staticmethod
+    def sensor_event(sid, rec):
+        ev = {"type": "reading", "sensor": sid}
+        ev.update(rec)
+        ev["connected"] = bool(rec.get("connected"))
+        return ev
+
+    @staticmethod
+    def pump_event(name, rec):
+        ev = {"type": "pump", "pump": name}
+        ev.update({k: (bool(v) if k in ("on", "auto", "override", "keepalive") else v) for k, v in rec.items()})
+        return ev
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn, _ = self._sock.accept()
+            except Exception:
+                if self._running:
+                    time.sleep(0.5)
+                continue
+            with self._clients_lock:
+                if len(self._clients) >= self.MAX_CLIENTS:
+                    try: conn.close()
+                    except Exception: pass
+                    continue
+                q = queue.Queue(maxsize=self.CLIENT_QUEUE)
+                self._clients[conn] = q
+            snap = self.readings.snapshot()
+            q.put(self.encode({"type": "snapshot", **snap}))
+            threading.Thread(target=self._client_loop, args=(conn, q), daemon=True).start()
+
+    def _drop(self, conn):
+        with self._clients_lock:
+            self._clients.pop(conn, None)
+        try: conn.close()
+        except Exception: pass
+
+    def _client_loop(self, conn, q):
+        conn.settimeout(0.1)
+        buf = b""
+        try:
+            while self._running:
+                # Outgoing updates
+                while True:
+                    try:
+                        line = q.get_nowait()
+                    except queue.Empty:
+                        break
+                    if line is None:        # slow-client overflow marker
+                        return
+                    conn.sendall(line)
+
+                # Incoming commands
+                try:
+                    chunk = conn.recv(4096)
+                    if not chunk:
+                        return
+                    buf += chunk
+                except socket.timeout:
+                    continue
+                if len(buf) > 65536:
+                    return
+                while b"\n" in buf:
+                    raw, _, buf = buf.partition(b"\n")
+                    if not raw.strip():
+                        continue
+                    try:
+                        msg = json.loads(raw.decode("utf-8", "ignore"))
+                        if not isinstance(msg, dict):
+                            raise ValueError("command must be a JSON object")
+                        reply = self.handler(msg)
+                    except Exception as e:
+                        reply = {"ok": False, "error": str(e)}
+                    conn.sendall(self.encode({"type": "reply", **reply}))
+        except Exception:
+            pass
+        finally:
+            self._drop(conn)
+
+    def _publish(self, line):
+        with self._clients_lock:
+            clients = list(self._clients.items())
+        for conn, q in clients:
+            try:
+                q.put_nowait(line)
+            except queue.Full:
+                # Consumer is not keeping up: cut it loose rather than buffer forever
+                try:
+                    while True: q.get_nowait()
+                except queue.Empty:
+                    pass
+                q.put_nowait(None)
+
+    def _broadcast_loop(self):
+        last_seq = None
+        snap = self.readings.snapshot()
+        counts = {k: r["count"] for k, r in list(snap["sensors"].items()) + list(snap["pumps"].items())}
+        while self._running:
+            time.sleep(self.poll_interval)
+            if not self._clients:
+                last_seq = None
+                continue
+            try:
+                seq = self.readings.seq
+                if seq == last_seq:
+                    continue
+                last_seq = seq
+                snap = self.readings.snapshot()
+                for sid, rec in snap["sensors"].items():
+                    if counts.get(sid) != rec["count"]:
+                        counts[sid] = rec["count"]
+                        self._publish(self.encode(self.sensor_event(sid, rec)))
+                for name, rec in snap["pumps"].items():
+                    if counts.get(name) != rec["count"]:
+                        counts[name] = rec["count"]
+                        self._publish(self.encode(self.pump_event(name, rec)))
+            except Exception as e:
+                log_ipc.warning("[IPC] Broadcast error: %s", e)
+
+def ipc_request(msg, path=IPC_SOCKET_PATH, timeout=5.0):
+    """
+    Send one command to the LocalIPCServer at `path` and return its reply.
+    One connection per request: the server streams updates to every
+    client, and a connection that only lives for one reply never has to
+    keep up with them.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(path)
+        s.sendall(LocalIPCServer.encode(msg))
+        buf = b""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            buf += chunk
+            while b"\n" in buf:
+                line, _, buf = buf.partition(b"\n")
+                try:
+                    reply = json.loads(line)
+                except ValueError:
+                    continue
+                if reply.get("type") == "reply":
+                    return reply
+    raise TimeoutError(f"No reply to {msg.get('cmd')!r} from {path}")
+
+class ThemeRegistry:
+    """
+    Central dark/light styling for the (classic Tk) widgets.
+
+    The palette lives in the Tk option database, so widgets created after a
+    switch are born in the right colours and nobody has to visit them.
+    Existing windows are restyled once per palette change: each toplevel
+    remembers the palette it was last brought to, and styling a window that
+    is already current is a no-op. Widgets with the "accent" role (reading
+    values, status text) keep their own foreground and only follow the
+    background.
+    """
+    PALETTES = {
+        "light": {"bg": "#F0F0F0", "fg": "black", "entry_bg": "white", "entry_fg": "black"},
+        "dark": {"bg": "#2E2E2E", "fg": "#FFFFFF", "entry_bg": "#3C3C3C", "entry_fg": "#FFFFFF"},
+    }
+
+    def __init__(self, root):
+        self.root = root
+        self.name = None
+        self.palette = self.PALETTES["light"]
+        self._roles = {}     # widget path -> role
+        self._current = {}   # toplevel path -> palette name it was styled / born with
+
+    def select(self, dark):
+        """Make the dark or light palette current. Returns True if it changed."""
+        name = "dark" if dark else "light"
+        if name == self.name:
+            return False
+        self.name = name
+        p = self.palette = self.PALETTES[name]
+        for pattern, value in (
+            ("*background", p["bg"]),
+            ("*foreground", p["fg"]),
+            ("*activeBackground", p["bg"]),
+            ("*activeForeground", p["fg"]),
+            ("*selectColor", p["bg"]),
+            ("*insertBackground", p["fg"]),
+            ("*Entry.background", p["entry_bg"]),
+            ("*Entry.foreground", p["entry_fg"]),
+            ("*Button.relief", "raised"),
+            ("*Button.highlightThickness", 0),
+            ("*Button.borderWidth", 2),
+            ("*Radiobutton.highlightThickness", 0),
+        ):
+            self.root.option_add(pattern, value)
+        return True
+
+    def set_role(self, widget, role):
+        self._roles[str(widget)] = role
+
+    def adopt(self, window):
+        """Record a window built entirely under the current palette."""
+        self._current[str(window)] = self.name
+
+    def is_current(self, window):
+        return self._current.get(str(window)) == self.name
+
+    def _options(self, wclass, role):
+        p = self.palette
+        if role == "accent":
+            return {"bg": p["bg"]}
+        if wclass in ("Frame", "Canvas", "Scrollbar", "Toplevel", "Tk"):
+            return {"bg": p["bg"]}
+        if wclass in ("Label", "Labelframe", "LabelFrame"):
+            return {"bg": p["bg"], "fg": p["fg"]}
+        if wclass == "Button":
+            return {"bg": p["bg"], "fg": p["fg"], "activebackground": p["bg"], "activeforeground": p["fg"],
+                    "relief": tk.RAISED, "highlightthickness": 0, "borderwidth": 2}
+        if wclass == "Checkbutton":
+            return {"bg": p["bg"], "fg": p["fg"], "activebackground": p["bg"], "activeforeground": p["fg"],
+                    "selectcolor": p["bg"]}
+        if wclass == "Radiobutton":
+            return {"bg": p["bg"], "fg": p["fg"], "activebackground": p["bg"], "activeforeground": p["fg"],
+                    "selectcolor": p["bg"], "highlightthickness": 0}
+        if wclass == "Entry":
+            return {"bg": p["entry_bg"], "fg": p["entry_fg"], "insertbackground": p["fg"]}
+        return None
+
+    def style(self, window):
+        """
+        Bring window (and every toplevel below it) to the current palette.
+        Returns the number of widgets configured; 0 if it was already current.
+        """
+        if self.is_current(window):
+            return 0
+        count = 0
+        stack = [window]
+        while stack:
+            w = stack.pop()
+            path = str(w)
+            try:
+                wclass = w.winfo_class()
+                opts = self._options(wclass, self._roles.get(path))
+                if opts:
+                    w.configure(**opts)
+                    count += 1
+                if wclass in ("Toplevel", "Tk"):
+                    self._current[path] = self.name
+            except Exception as e:
+                log_ui.error("[THEME ERROR] %s: %s", path, e)
+            stack.extend(w.winfo_children())
+        return count
+
+class BlinkClock:
+    """
+    One shared Tk timer for every flashing indicator (auto top-up, alarms).
+
+    Elements are keyed (pump name / alarm key): starting a key again just
+    replaces it and stopping it only needs the key, so flash timers can
+    never stack or leak. All elements toggle together on the same tick and
+    the timer only runs while something is registered.
+    Tk-thread only; callers on other threads go through _call_ui.
+    """
+    PERIOD_MS = 500
+
+    def __init__(self, root):
+        self.root = root
+        self._elements = {}   # key -> (label, base colour, alternate colour)
+        self._phase = False
+        self._job = None
+        self._paused = False
+
+    def start(self, key, label, base_color, alt_color):
+        self._elements[key] = (label, base_color, alt_color)
+        label.config(fg=alt_color if self._phase else base_color)
+        self._arm()
+
+    def _arm(self):
+        if self._job is None and self._elements and not self._paused:
+            self._job = self.root.after(self.PERIOD_MS, self._tick)
+
+    def pause(self):
+        """Stop ticking (display blanked); registered flashes are kept."""
+        self._paused = True
+        if self._job is not None:
+            try:
+                self.root.after_cancel(self._job)
+            except Exception:
+                pass
+            self._job = None
+
+    def resume(self):
+        self._paused = False
+        self._arm()
+
+    def stop(self, key):
+        """Remove key; returns its label (or None if it was not flashing)."""
+        entry = self._elements.pop(key, None)
+        if not self._elements and self._job is not None:
+            try:
+                self.root.after_cancel(self._job)
+            except Exception:
+                pass
+            self._job = None
+        return entry[0] if entry else None
+
+    def is_active(self, key):
+        return key in self._elements
+
+    def _tick(self):
+        self._job = None
+        self._phase = not self._phase
+        for key, (label, base, alt) in list(self._elements.items()):
+            try:
+                label.config(fg=alt if self._phase else base)
+            except tk.TclError:
+                self._elements.pop(key, None)   # widget went away
+        self._arm()
+
+class SettingsWriter:
+    """
+    Background writer for settings.json.
+
+    submit() snapshots the settings as text and returns at once; a single
+    writer thread waits for the burst to settle (debounce), then writes the
+    newest version atomically: temp file, fsync, rename, fsync of the folder.
+    A write whose content hash matches the file on disk is skipped, so
+    repeated saves of unchanged settings cost no SD-card writes.
+    """
+    def __init__(self, path, debounce=1.0):
+        self.path = path
+        self.debounce = debounce
+        self._lock = threading.Lock()         # guards _pending only; submit() never waits on disk
+        self._write_lock = threading.Lock()   # one write at a time (writer thread vs flush on exit)
+        self._pending = None
+        self._wake = threading.Event()
+        self.last_hash = self._hash_file()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def content_hash(text):
+        import hashlib
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _hash_file(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return self.content_hash(f.read())
+        except Exception:
+            return None
+
+    def submit(self, data):
+        text = json.dumps(data, indent=4)
+        with self._lock:
+            self._pending = text
+        self._wake.set()
+
+    def flush(self):
+        """Write anything pending now (used on exit)."""
+        self._write_pending()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.debounce)   # let a burst of saves coalesce
+            self._wake.clear()
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._write_lock:
+            with self._lock:
+                text, self._pending = self._pending, None
+            if text is None:
+                return
+            digest = self.content_hash(text)
+            if digest == self.last_hash:
+                return
+            previous, self.last_hash = self.last_hash, digest   # set first: the watcher may look mid-write
+            try:
+                self._atomic_write(text)
+                log_settings.info("[SAVE] Threshold and graphics settings saved.")
+            except Exception as e:
+                self.last_hash = previous
+                log_settings.error("[SAVE ERROR] Failed to save settings: %s", e)
+
+    def _atomic_write(self, text):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        try:
+            dfd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            try:
+                os.fsync(dfd)
+            finally:
+                os.close(dfd)
+        except Exception:
+            pass
+
+class SettingsWatcher:
+    """
+    Watches settings.json for edits made outside the app (config pushes,
+    an editor over ssh) and hands the parsed content to on_change(data).
+
+    Uses inotify (Linux, via ctypes) on the file's folder so rename-style
+    replacements are seen too; falls back to polling the mtime elsewhere.
+    Content whose hash matches own_hash() -- our own last save -- is ignored.
+    """
+    IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE = 0x2, 0x8, 0x80, 0x100
+    SETTLE = 0.3   # editors often write in several steps
+
+    def __init__(self, path, on_change, own_hash=lambda: None, poll_interval=2.0):
+        self.path = os.path.abspath(path)
+        self.on_change = on_change
+        self.own_hash = own_hash
+        self.poll_interval = poll_interval
+        self._last_seen = SettingsWriter.content_hash(self._read() or "")
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return f.read()
+        except Exception:
+            return None
+
+    def _run(self):
+        try:
+            self._inotify_loop()
+        except Exception as e:
+            log_settings.warning("[SETTINGS WATCH] inotify unavailable (%s); polling every %g s", e, self.poll_interval)
+            self._poll_loop()
+
+    def _inotify_loop(self):
+        import ctypes, ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init()
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(fd, os.path.dirname(self.path).encode(), mask) < 0:
+            os.close(fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        name = os.path.basename(self.path).encode()
+        log_settings.info("[SETTINGS WATCH] Watching %s (inotify)", self.path)
+        while True:
+            buf = os.read(fd, 4096)
+            hit, pos = False, 0
+            while pos + 16 <= len(buf):
+                _wd, _mask, _cookie, length = struct.unpack_from("iIII", buf, pos)
+                if buf[pos + 16:pos + 16 + length].rstrip(b"\0") == name:
+                    hit = True
+                pos += 16 + length
+            if hit:
+                time.sleep(self.SETTLE)
+                self._check()
+
+    def _poll_loop(self):
+        last = None
+        while True:
+            try:
+                st = os.stat(self.path)
+                sig = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                sig = None
+            if last is not None and sig != last:
+                time.sleep(self.SETTLE)
+                self._check()
+            last = sig
+            time.sleep(self.poll_interval)
+
+    def _check(self):
+        text = self._read()
+        if text is None:
+            return
+        digest = SettingsWriter.content_hash(text)
+        if digest == self._last_seen:
+            return
+        self._last_seen = digest
+        if digest == self.own_hash():
+            return
+        try:
+            data = json.loads(text)
+            if not isinstance(data, dict):
+                raise ValueError("top level is not an object")
+        except Exception as e:
+            log_settings.warning("[SETTINGS WATCH] Ignoring unreadable %s: %s", self.path, e)
+            return
+        self.on_change(data)
+
+def _percentile(sorted_vals, q):
+    """q in 0..1 over an already sorted list (nearest rank)."""
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+class LoopMonitor:
+    """
+    How well the Tk main loop and the worker threads are keeping up.
+
+    Lag: a probe is scheduled with after(interval) and the difference
+    between when it should have fired and when it did is recorded.
+    CPU: each loop thread calls checkpoint(name) once per iteration; the
+    thread_time() delta since its previous checkpoint is that iteration's
+    CPU cost. thread_time() is per thread, so a name whose thread has been
+    replaced (a poll loop after a reconnect) starts over from the new
+    thread's first checkpoint. Both keep a bounded window of recent samples.
+    """
+    def __init__(self, root, interval_ms=250, window=480):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.window = window
+        self.lag_ms = collections.deque(maxlen=window)
+        self._threads = {}   # name -> {"last": (ident, wall, cpu), "samples": deque[(wall_dt, cpu_dt)]}
+        self._lock = threading.Lock()
+        self._due = None
+
+    def start(self):
+        self._due = time.monotonic() + self.interval_ms / 1000.0
+        self.root.after(self.interval_ms, self._probe)
+
+    def _probe(self):
+        now = time.monotonic()
+        self.lag_ms.append(max(0.0, (now - self._due) * 1000.0))
+        self.checkpoint("tk")
+        self._due = now + self.interval_ms / 1000.0
+        self.root.after(self.interval_ms, self._probe)
+
+    def checkpoint(self, name):
+        """Call from the thread being measured, once per loop iteration."""
+        ident, wall, cpu = threading.get_ident(), time.monotonic(), time.thread_time()
+        with self._lock:
+            t = self._threads.get(name)
+            if t is None:
+                self._threads[name] = {"last": (ident, wall, cpu), "samples": collections.deque(maxlen=self.window)}
+                return
+            li, lw, lc = t["last"]
+            t["last"] = (ident, wall, cpu)
+            if li == ident:     # else: a new thread under this name, its clock starts here
+                t["samples"].append((wall - lw, cpu - lc))
+
+    def stats(self):
+        lag = sorted(self.lag_ms)
+        out = {"lag_ms": {"p50": _percentile(lag, 0.50), "p95": _percentile(lag, 0.95),
+                          "max": lag[-1] if lag else 0.0, "n": len(lag)},
+               "threads": {}}
+        with self._lock:
+            items = [(n, list(t["samples"])) for n, t in self._threads.items()]
+        for name, samples in sorted(items):
+            if not samples:
+                continue
+            wall = sum(s[0] for s in samples)
+            cpu_ms = sorted(s[1] * 1000.0 for s in samples)
+            wall_ms = sorted(s[0] * 1000.0 for s in samples)
+            out["threads"][name] = {
+                "cpu_pct": 100.0 * sum(cpu_ms) / 1000.0 / wall if wall > 0 else 0.0,
+                "p50_ms": _percentile(cpu_ms, 0.50), "p95_ms": _percentile(cpu_ms, 0.95),
+                "max_ms": cpu_ms[-1], "n": len(cpu_ms),
+                "wall_p50_ms": _percentile(wall_ms, 0.50), "wall_p95_ms": _percentile(wall_ms, 0.95),
+            }
+        return out
+
+    def report(self):
+        s = self.stats()
+        lag = s["lag_ms"]
+        lines = [f"Tk loop lag (ms)  p50 {lag['p50']:.1f}  p95 {lag['p95']:.1f}  max {lag['max']:.1f}  ({lag['n']} samples)",
+                 "",
+                 f"{'thread':<12}{'CPU %':>7}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}"]
+        for name, t in s["threads"].items():
+            lines.append(f"{name:<12}{t['cpu_pct']:>7.1f}{t['p50_ms']:>9.2f}{t['p95_ms']:>9.2f}{t['max_ms']:>9.2f}")
+        return "\n".join(lines)
+
+    def log_line(self):
+        s = self.stats()
+        lag = s["lag_ms"]
+        cpu = ", ".join(f"{n} {t['cpu_pct']:.1f}%" for n, t in s["threads"].items())
+        return f"lag p50 {lag['p50']:.1f} / p95 {lag['p95']:.1f} / max {lag['max']:.1f} ms | CPU {cpu}"
+
+class AlarmEngine:
+    """
+    Settings-driven alarm rules, evaluated once per reading update.
+
+    Each rule watches one (sensor, metric) and, while active, holds its
+    alarm (a sensor id) at least at its severity:
+      {"sensor": "D", "metric": "ph", "kind": "below", "threshold": 7.6,
+       "severity": "critical", "hysteresis": 0.05, "hold_s": 10}
+      {"sensor": "A", "metric": "level", "kind": "rate_below", "threshold": -30,
+       "window_s": 900, "severity": "approaching"}     # units per hour
+    kind is below / above (the value) or rate_below / rate_above (its
+    least-squares slope over window_s, per hour). `scale` converts the
+    reading into the units the threshold is written in.
+
+    Hysteresis: an active rule only clears once the value is back past
+    its threshold by `hysteresis`. Hold: a rule changes (either way) only
+    after its new condition has held for hold_s, so one noisy sample can
+    neither raise nor clear anything. An alarm's state is the highest
+    severity among its active rules; on_change(alarm, state) is called,
+    outside the lock, only when that state actually changes.
+    """
+    SEVERITY = {"normal": 0, "approaching": 1, "critical": 2}
+    KINDS = ("below", "above", "rate_below", "rate_above")
+    RULE_KEYS = ("sensor", "metric", "kind", "threshold", "severity", "hysteresis",
+                 "hold_s", "window_s", "scale", "alarm")
+    RATE_MIN_SAMPLES = 5
+
+    class Rule:
+        __slots__ = ("alarm", "sensor", "metric", "kind", "threshold", "severity", "hysteresis",
+                     "hold_s", "window_s", "scale", "active", "pending_since", "fit")
+
+        def __init__(self, sensor, metric, kind, threshold, severity="critical", hysteresis=0.0,
+                     hold_s=0.0, window_s=600.0, scale=1.0, alarm=None):
+            self.alarm = alarm or sensor
+            self.sensor, self.metric, self.kind = sensor, metric, kind
+            self.threshold, self.severity = float(threshold), severity
+            self.hysteresis, self.hold_s = float(hysteresis), float(hold_s)
+            self.window_s, self.scale = float(window_s), float(scale)
+            self.active = False
+            self.pending_since = None
+            self.fit = SlidingFit(self.window_s, 256) if kind.startswith("rate") else None
+
+        def condition(self, x):
+            h = self.hysteresis if self.active else 0.0
+            if self.kind.endswith("below"):
+                return x <= self.threshold + h
+            return x >= self.threshold - h
+
+    def __init__(self, on_change):
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._rules = {}        # (sensor, metric) -> [Rule]
+        self.state = {}         # alarm -> severity name
+
+    @classmethod
+    def check_rule(cls, spec):
+        """Problem with one rule dict (as found in settings.json), or None."""
+        if not isinstance(spec, dict):
+            return "must be an object"
+        if spec.get("sensor") not in ReadingsTable.SENSORS or not isinstance(spec.get("metric"), str):
+            return "needs sensor A..E and a metric name"
+        if spec.get("kind") not in cls.KINDS:
+            return f"kind must be one of {', '.join(cls.KINDS)}"
+        if spec.get("severity", "critical") not in ("approaching", "critical"):
+            return "severity must be approaching or critical"
+        for key in ("threshold", "hysteresis", "hold_s", "window_s", "scale"):
+            v = spec.get(key, 0)
+            if not isinstance(v, (int, float)) or isinstance(v, bool):
+                return f"{key} must be a number"
+        if "threshold" not in spec:
+            return "needs a threshold"
+        if spec.get("hysteresis", 0) < 0 or spec.get("hold_s", 0) < 0 or spec.get("window_s", 600) <= 0:
+            return "hysteresis/hold_s must be >= 0 and window_s > 0"
+        return None
+
+    def load(self, specs):
+        """Replace the rule set. Alarms left without rules drop back to normal."""
+        rules = {}
+        for spec in specs:
+            rule = self.Rule(**{k: v for k, v in spec.items() if k in self.RULE_KEYS})
+            rules.setdefault((rule.sensor, rule.metric), []).append(rule)
+        with self._lock:
+            self._rules = rules
+            changes = self._settle({a for a in self.state if self.state[a] != "normal"})
+        self._notify(changes)
+
+    def update(self, sensor, values, now):
+        """Evaluate every rule watching `sensor` against one reading update {metric: value}."""
+        with self._lock:
+            touched = set()
+            for metric, value in values.items():
+                if value != value:
+                    continue        # NaN: no reading this cycle, keep every rule as it is
+                for rule in self._rules.get((sensor, metric), ()):
+                    x = value * rule.scale
+                    if rule.fit is not None:
+                        rule.fit.add(now, x)
+                        slope = rule.fit.slope()
+                        if slope is None or rule.fit.n < self.RATE_MIN_SAMPLES or rule.fit.span < rule.window_s / 3:
+                            continue
+                        x = slope * 3600.0
+                    want = rule.condition(x)
+                    if want == rule.active:
+                        rule.pending_since = None
+                        continue
+                    if rule.pending_since is None:
+                        rule.pending_since = now
+                    if now - rule.pending_since >= rule.hold_s:
+                        rule.active, rule.pending_since = want, None
+                        touched.add(rule.alarm)
+            changes = self._settle(touched) if touched else []
+        self._notify(changes)
+
+    def clear(self, sensor):
+        """Forget the state of every rule on `sensor` (it disconnected); returns the alarms reset."""
+        with self._lock:
+            alarms = set()
+            for (sid, _), rules in self._rules.items():
+                if sid != sensor:
+                    continue
+                for rule in rules:
+                    rule.active, rule.pending_since = False, None
+                    if rule.fit is not None:
+                        rule.fit.reset()
+                    alarms.add(rule.alarm)
+            for alarm in alarms:
+                self.state[alarm] = "normal"
+        return alarms
+
+    def _settle(self, alarms):
+        """Recompute the given alarms (under the lock); returns [(alarm, new state)] that changed."""
+        level = {}
+        for rules in self._rules.values():
+            for rule in rules:
+                if rule.active and rule.alarm in alarms:
+                    level[rule.alarm] = max(level.get(rule.alarm, 0), self.SEVERITY[rule.severity])
+        names = {v: k for k, v in self.SEVERITY.items()}
+        changes = []
+        for alarm in alarms:
+            new = names[level.get(alarm, 0)]
+            if self.state.get(alarm, "normal") != new:
+                self.state[alarm] = new
+                changes.append((alarm, new))
+        return changes
+
+    def _notify(self, changes):
+        for alarm, state in changes:
+            try:
+                self.on_change(alarm, state)
+            except Exception as e:
+                log_alarms.error("[ALARM] %s -> %s: %s", alarm, state, e)
+
+class TransportStats:
+    """
+    Per-sensor, per-command request latency and reply outcomes.
+
+    Each (sensor, command) pair owns a fixed array of histogram buckets
+    (upper edges in BUCKETS_MS, the last one open) and a fixed array of
+    outcome counters, so recording is a couple of integer increments and
+    memory never grows with uptime. record() is called from the poll
+    threads; readers take a copy under the lock.
+    """
+    BUCKETS_MS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+    OUTCOMES = ("ok", "timeout", "empty", "err", "unknown")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}   # (sid, cmd) -> {"kind", "hist", "outcomes", "sum_ms", "max_ms"}
+
+    @staticmethod
+    def classify(resp, elapsed_s, timeout_s):
+        """Outcome name for one reply (blank replies that used the whole timeout are timeouts)."""
+        if not resp:
+            return "timeout" if timeout_s and elapsed_s >= 0.9 * timeout_s else "empty"
+        if resp == "?":
+            return "unknown"
+        if resp.upper().startswith("ERR"):
+            return "err"
+        return "ok"
+
+    def record(self, sid, cmd, kind, elapsed_s, outcome):
+        ms = elapsed_s * 1000.0
+        i = 0
+        for edge in self.BUCKETS_MS:
+            if ms <= edge:
+                break
+            i += 1
+        with self._lock:
+            row = self._rows.get((sid, cmd))
+            if row is None:
+                row = self._rows[(sid, cmd)] = {
+                    "kind": kind,
+                    "hist": array.array("L", [0] * (len(self.BUCKETS_MS) + 1)),
+                    "outcomes": array.array("L", [0] * len(self.OUTCOMES)),
+                    "sum_ms": 0.0, "max_ms": 0.0,
+                }
+            row["kind"] = kind
+            row["hist"][i] += 1
+            row["outcomes"][self.OUTCOMES.index(outcome)] += 1
+            row["sum_ms"] += ms
+            if ms > row["max_ms"]:
+                row["max_ms"] = ms
+
+    def reset(self):
+        with self._lock:
+            self._rows.clear()
+
+    def _quantile(self, hist, n, q):
+        """Upper edge of the bucket holding the q-th request (ms); None past the last edge."""
+        target = q * n
+        seen = 0
+        for i, c in enumerate(hist):
+            seen += c
+            if seen >= target:
+                return self.BUCKETS_MS[i] if i < len(self.BUCKETS_MS) else None
+        return None
+
+    def stats(self):
+        with self._lock:
+            rows = {k: (r["kind"], list(r["hist"]), list(r["outcomes"]), r["sum_ms"], r["max_ms"])
+                    for k, r in self._rows.items()}
+        out = {}
+        for (sid, cmd), (kind, hist, outcomes, sum_ms, max_ms) in sorted(rows.items()):
+            n = sum(hist)
+            out.setdefault(sid, {})[cmd] = {
+                "transport": kind, "n": n,
+                "mean_ms": sum_ms / n if n else 0.0, "max_ms": max_ms, "sum_ms": sum_ms,
+                "p50_ms": self._quantile(hist, n, 0.50), "p95_ms": self._quantile(hist, n, 0.95),
+                "buckets_ms": list(self.BUCKETS_MS), "hist": hist,
+                **dict(zip(self.OUTCOMES, outcomes)),
+            }
+        return out
+
+    def report(self, stats=None):
+        """Table of stats(), or of a stats() dict fetched from another process."""
+        def edge(v):
+            return f"<={v}" if v is not None else f">{self.BUCKETS_MS[-1]}"
+        lines = [f"{'sensor/cmd':<12}{'link':<7}{'n':>6}{'mean':>7}{'p50':>7}{'p95':>7}{'max':>7}"
+                 f"{'tmo':>5}{'empty':>6}{'ERR':>5}{'?':>4}"]
+        for sid, cmds in (self.stats() if stats is None else stats).items():
+            for cmd, r in cmds.items():
+                lines.append(f"{sid + ' ' + cmd:<12}{r['transport']:<7}{r['n']:>6}{r['mean_ms']:>7.0f}"
+                             f"{edge(r['p50_ms']):>7}{edge(r['p95_ms']):>7}{r['max_ms']:>7.0f}"
+                             f"{r['timeout']:>5}{r['empty']:>6}{r['err']:>5}{r['unknown']:>4}")
+        if len(lines) == 1:
+            lines.append("(no requests yet)")
+        return "\n".join(lines)
+
+class MetricsServer:
+    """
+    Optional HTTP endpoint serving Prometheus text-format metrics on /metrics.
+
+    render() must only read cached state (readings table, counters), so a
+    scrape never talks to a sensor. Requests are served on their own
+    threads by ThreadingHTTPServer.
+    """
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, bind, port, render):
+        self.bind = bind
+        self.port = port
+        self.render = render        # callable() -> str
+        self._httpd = None
+
+    def start(self):
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        render = self.render
+        content_type = self.CONTENT_TYPE
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                try:
+                    body = render().encode()
+                except Exception as e:
+                    log_metrics.warning("[METRICS] Render failed: %s", e)
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                log_metrics.debug("[METRICS] %s " + fmt, self.client_address[0], *args)
+
+        self._httpd = ThreadingHTTPServer((self.bind, self.port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        log_metrics.info("[METRICS] Serving on http://%s:%s/metrics", self.bind, self.port)
+
+    def stop(self):
+        if self._httpd:
+            try:
+                self._httpd.shutdown()
+                self._httpd.server_close()
+            except Exception:
+                pass
+            self._httpd = None
+
+class ProfileSession:
+    """
+    One on-demand profiling run (SIGUSR1/SIGUSR2, Diagnostics popup or IPC).
+
+    For `seconds` it runs cProfile on the Tk thread and a sampling profiler
+    that reads every other thread's stack through sys._current_frames()
+    (cProfile only sees the thread it was enabled on). Optionally takes
+    tracemalloc snapshots at start and end. Results go to timestamped files
+    in out_dir. Nothing is imported or running outside a session.
+    """
+    SAMPLE_INTERVAL = 0.01
+
+    def __init__(self, root, out_dir, seconds=30, memory=False):
+        self.root = root
+        self.out_dir = out_dir
+        self.seconds = seconds
+        self.memory = memory
+        self.stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.files = []
+        self._stop = threading.Event()
+        self._samples = collections.Counter()   # (thread name, stack text) -> hits
+        self._leaves = collections.Counter()    # (thread name, function) -> hits
+        self._n_samples = 0
+
+    def start(self, on_done=None):
+        """Tk thread only."""
+        import cProfile
+        self._on_done = on_done
+        if self.memory:
+            import tracemalloc
+            tracemalloc.start(25)
+            self._mem_start = tracemalloc.take_snapshot()
+        self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self._sampler.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        self.root.after(int(self.seconds * 1000), self._finish)
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        main = threading.main_thread().ident
+        while not self._stop.wait(self.SAMPLE_INTERVAL):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident in (me, main):
+                    continue
+                stack = []
+                while frame is not None and len(stack) < 40:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                tname = names.get(ident, str(ident))
+                self._leaves[(tname, stack[0] if stack else "?")] += 1
+                self._samples[(tname, ";".join(reversed(stack)))] += 1
+            self._n_samples += 1
+
+    def _path(self, suffix):
+        path = os.path.join(self.out_dir, f"profile_{self.stamp}_{suffix}")
+        self.files.append(path)
+        return path
+
+    def _finish(self):
+        import io, pstats
+        self._profile.disable()
+        self._stop.set()
+        self._sampler.join(timeout=1.0)
+        try:
+            self._profile.dump_stats(self._path("tk.prof"))
+            buf = io.StringIO()
+            pstats.Stats(self._profile, stream=buf).sort_stats("cumulative").print_stats(60)
+            with open(self._path("tk.txt"), "w") as f:
+                f.write(f"cProfile of the Tk thread, {self.seconds:g} s\n\n{buf.getvalue()}")
+
+            with open(self._path("threads.txt"), "w") as f:
+                f.write(f"Sampled other threads every {self.SAMPLE_INTERVAL * 1000:g} ms, "
+                        f"{self._n_samples} samples\n\nHottest functions per thread:\n")
+                for (tname, leaf), hits in self._leaves.most_common(60):
+                    f.write(f"{hits:7d}  {tname:<20} {leaf}\n")
+                f.write("\nCollapsed stacks (flamegraph.pl input):\n")
+                for (tname, stack), hits in self._samples.most_common():
+                    f.write(f"{tname};{stack} {hits}\n")
+
+            if self.memory:
+                import tracemalloc
+                end = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                with open(self._path("memory.txt"), "w") as f:
+                    f.write("Top allocation growth over the session:\n")
+                    for stat in end.compare_to(self._mem_start, "lineno")[:40]:
+                        f.write(f"{stat}\n")
+                    f.write("\nTop allocations at end:\n")
+                    for stat in end.statistics("lineno")[:40]:
+                        f.write(f"{stat}\n")
+            log_diagnostics.info("[PROFILE] Wrote %s", ', '.join(os.path.basename(p) for p in self.files))
+        except Exception as e:
+            log_diagnostics.warning("[PROFILE] Failed to write results: %s", e)
+        if self._on_done:
+            self._on_done(self)
+
+class HeadlessRoot:
+    """
+    Stand-in for the Tk root in the acquisition process: Tk's after() /
+    after_cancel() timer API over a plain loop on the main thread. Keep-alive
+    restores, settings reloads and IPC pump commands are queued with
+    after() just as under Tk, so they still run one at a time on one
+    thread, with no display attached.
+    """
+    def __init__(self):
+        self._cv = threading.Condition()    # RLock: after() from a signal handler can't deadlock
+        self._jobs = []                     # heap of (due, n, func, args)
+        self._live = set()                  # n of jobs not yet run or cancelled
+        self._n = 0
+        self._running = True
+
+    def after(self, ms, func, *args):
+        with self._cv:
+            self._n += 1
+            self._live.add(self._n)
+            heapq.heappush(self._jobs, (time.monotonic() + ms / 1000.0, self._n, func, args))
+            self._cv.notify()
+            return f"after#{self._n}"
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, job):
+        with self._cv:
+            try:
+                self._live.discard(int(str(job).rpartition("#")[2]))
+            except ValueError:
+                pass
+
+    def winfo_exists(self):
+        return self._running
+
+    def quit(self):
+        with self._cv:
+            self._running = False
+            self._cv.notify()
+
+    destroy = quit
+
+    def mainloop(self):
+        while True:
+            with self._cv:
+                while self._running:
+                    wait = self._jobs[0][0] - time.monotonic() if self._jobs else None
+                    if wait is not None and wait <= 0:
+                        break
+                    self._cv.wait(wait)
+                if not self._running:
+                    return
+                _, n, func, args = heapq.heappop(self._jobs)
+                if n not in self._live:
+                    continue
+                self._live.discard(n)
+            try:
+                func(*args)
+            except Exception as e:
+                log_acquire.error("[ACQUIRE] %s failed: %s", getattr(func, '__name__', func), e)
+
+def acquire_cli(argv):
+    """
+    `SAM-Max.py acquire`: sensor sessions, pump control, history, alarms and
+    the IPC socket in a process of their own, with no display, so they get
+    their own core and GIL. The GUI starts it (start_acquisition) and draws
+    from its readings table; it can also run on its own, e.g. as a
+    service, and a GUI started later attaches to it.
+    """
+    import argparse
+    argparse.ArgumentParser(prog="SAM-Max.py acquire",
+                            description="Run acquisition and pump control without the display.").parse_args(argv)
+    log_listener = setup_logging(ACQUIRE_LOG_PATH)
+    root = HeadlessRoot()
+    try:
+        service = SensorGUI(root, role="acquire")
+    except ReadingsTableBusy as e:
+        log_acquire.error("[ACQUIRE] Not started: %s", e)
+        log_listener.stop()
+        return 1
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: root.quit())
+    log_acquire.info("[ACQUIRE] Running as pid %s", os.getpid())
+    try:
+        root.mainloop()
+    finally:
+        service.cleanup_on_exit()
+        log_acquire.info("[ACQUIRE] Stopped")
+        log_listener.stop()
+    return 0
+
+def start_acquisition(timeout=20.0):
+    """
+    Attach to the acquisition process's readings table, starting
+    `SAM-Max.py acquire` first if no live process owns one. Returns
+    (table, Popen or None when it was already running); raises if it
+    could not be brought up.
+    """
+    try:
+        table = ReadingsTable.attach()
+        pid = ReadingsTable._owner_pid(table.buf)
+        if pid and _pid_alive(pid):
+            log_acquire.info("[ACQUIRE] Attached to running acquisition process %s", pid)
+            return table, None
+        table.close()
+    except (FileNotFoundError, ValueError):
+        pass
+
+    t0 = time.monotonic()
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "acquire"],
+                            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, start_new_session=True)
+    while time.monotonic() - t0 < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"acquisition process exited with {proc.returncode} (see {ACQUIRE_LOG_PATH})")
+        try:
+            table = ReadingsTable.attach()
+            if ReadingsTable._owner_pid(table.buf) == proc.pid:
+                log_acquire.info("[ACQUIRE] Started acquisition process %s "
+                                 "in %s ms", proc.pid, int((time.monotonic() - t0) * 1000))
+                return table, proc
+            table.close()
+        except (FileNotFoundError, ValueError):
+            pass
+        time.sleep(0.1)
+    proc.terminate()
+    try:
+        proc.wait(5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+    raise TimeoutError(f"acquisition process did not publish a readings table within {timeout:g} s")
 
 class SensorGUI:
-    def __init__(self, root):
+    def __init__(self, root, role="all", readings=None, acquirer=None):
+        """
+        role "all":     poll, control and display in this one process (used
+                        when no acquisition process can be started).
+        role "acquire": no display; root is a HeadlessRoot (acquire_cli).
+        role "view":    display only. Draws from the acquisition process's
+                        readings table (`readings`, attached) and sends pump,
+                        tare and reset commands to it over the IPC socket;
+                        `acquirer` is its Popen when this process started it.
+        """
         self.root = root
-        # GUI Setup
-        self.root.title("Stork Aquatics Monitor Max V1.4.0")
+        self.role = role
+        self.acquires = role != "view"      # sensor sessions, GPIO, history writer, alarms, IPC
+        self.displays = role != "acquire"   # Tk widgets
+        self.acquirer = acquirer
+        self._acq_status = {}               # view: last "status" reply from the acquisition process
+        if self.acquires:
+            # Latest readings + pump states (shared memory, seqlock).
+            # Poll threads publish here; the GUI renders from it at its own frame rate.
+            # Claimed before the pins below: a second instance stops here
+            # (ReadingsTableBusy) instead of switching the running one's pumps off.
+            self.readings = ReadingsTable()
+        else:
+            self.readings = readings
+        if self.displays:
+            # Dark/light palette + widget roles; tiles and popups style through it
+            self.theme = ThemeRegistry(self.root)
+            # GUI Setup
+            self.root.title(f"Stork Aquatics Monitor Max V{__version__}")
         try:
             screen_h = self.root.winfo_screenheight()
         except Exception:
@@ -112,31 +3316,33 @@ class SensorGUI:
         self.sensor_firmware = {sid: "UNKNOWN" for sid in sensor_ids}
 
         self.fullscreen = True  # Track fullscreen on or off
-        self.root.bind("<Double-Button-1>", self.toggle_fullscreen)
-        self.root.bind("<F11>", self.toggle_fullscreen)
-        self.root.bind("<Escape>", self.exit_fullscreen)
-        # Configure resizing for various screen types
-        self.root.rowconfigure(0, weight=1)
-        self.root.rowconfigure(1, weight=1)
-        self.root.rowconfigure(2, weight=1)
-        self.root.columnconfigure(0, weight=1)
-        self.root.columnconfigure(1, weight=1)
-        self.root.columnconfigure(2, weight=1)
+        if self.displays:
+            self.root.bind("<Double-Button-1>", self.toggle_fullscreen)
+            self.root.bind("<F11>", self.toggle_fullscreen)
+            self.root.bind("<Escape>", self.exit_fullscreen)
+            # Configure resizing for various screen types
+            self.root.rowconfigure(0, weight=1)
+            self.root.rowconfigure(1, weight=1)
+            self.root.rowconfigure(2, weight=1)
+            self.root.columnconfigure(0, weight=1)
+            self.root.columnconfigure(1, weight=1)
+            self.root.columnconfigure(2, weight=1)
         
-        # GPIO setup for pumps
-        GPIO.setmode(GPIO.BCM)  
+        # GPIO setup for pumps (only the process that drives them)
         self.pump_gpio = {
             "RO Pump A": 4, # GPIO Assignment R1=4,R2=27,R3=22,R4=17
             "RO Pump B": 27,
         }
         # Auto Activate Relay 4 GPIO 17 when Pumps are active
         self.relay4_gpio = 17
-        GPIO.setup(self.relay4_gpio, GPIO.OUT)
-        GPIO.output(self.relay4_gpio, GPIO.LOW)
+        if self.acquires:
+            GPIO.setmode(GPIO.BCM)  
+            GPIO.setup(self.relay4_gpio, GPIO.OUT)
+            GPIO.output(self.relay4_gpio, GPIO.LOW)
         
-        for pin in self.pump_gpio.values():
-            GPIO.setup(pin, GPIO.OUT)
-            GPIO.output(pin, GPIO.LOW)  
+            for pin in self.pump_gpio.values():
+                GPIO.setup(pin, GPIO.OUT)
+                GPIO.output(pin, GPIO.LOW)  
 
         # Per-sensor water level thresholds
         self.thresholds = {
@@ -182,6 +3388,7 @@ class SensorGUI:
 
         self.visual_settings = {
              "dark_mode": False,
+             "trends": True,          # 24 h trend line on each sensor tile
              "colors": {
                  "water": "#0000FF",
                  "temp": "#FF0000",
@@ -201,13 +3408,12 @@ class SensorGUI:
             "E": {"port": None, "is_running": False},
         }
         self.sensor_firmware = {sid: None for sid in self.sensors}
-        self.root.after(3000, lambda: threading.Thread(target=self.sensor_watchdog, daemon=True).start())
-        print("[WATCHDOG] Started")
 
         # TCP RX TX Locking
         self.io_locks = {sid: threading.Lock() for sid in self.sensors.keys()}
 
         self.sensor_fail_counts = {sid: 0 for sid in self.sensors.keys()}
+        self.reconnect_counts = {sid: 0 for sid in self.sensors.keys()}   # since start, for metrics
         self.sensor_disabled_flags = {sid: False for sid in self.sensors.keys()}
         self.MAX_SENSOR_RETRIES = 5
 
@@ -252,21 +3458,86 @@ class SensorGUI:
             "RO Pump A": False,
             "RO Pump B": False,
         }
-       
-        self.flash_jobs = {
-            "RO Pump A": None,
-            "RO Pump B": None,
-        }
-       
-        self.alarm_flash_jobs = {}
-        self.current_status_text = {
-            "ro_tank": "",
-            "ph_sensor": "",
-            "tds_sensor": ""
+        self._override_logged = set()
+        # Plain mirror of each pump's Auto Mode checkbox so control decisions
+        # on the poll threads never have to touch a Tk variable
+        self.auto_modes = {
+            "RO Pump A": False,
+            "RO Pump B": False,
         }
-        self.flash_jobs = {}
-        self.flashing_labels = {}
-        
+
+        # Recent history of each reading (memory only), for trends and rates.
+        # Stays empty in a view: history_window() then reads the store alone.
+        self.history = ReadingRing()
+        # Evaporation / fill rate of the pumped tanks (fed by control_pumps)
+        self.level_rates = {"A": LevelRate(), "B": LevelRate()}
+        self.RATE_REFRESH_S = 30.0
+        self._rate_shown = {}
+        self.journal = EventJournal(EVENTS_PATH) if self.acquires else None
+        # Long-term history on disk (batched appends, mmap reads); a view
+        # only reads it, the acquisition process is its writer
+        try:
+            self.store = ColumnStore(HISTORY_DIR, readonly=not self.acquires)
+            if self.acquires:
+                self.store.start()
+                # Pumps always start OFF; close any run the last session left open
+                for sid, metric in PUMP_SERIES.values():
+                    self.store.append(sid, metric, time.time(), 0.0)
+        except Exception as e:
+            self.store = None
+            log_history.warning("[HISTORY] Disabled: %s", e)
+        self.RENDER_INTERVAL_MS = 200
+        self._rendered_counts = {}          # sensor id / pump name -> table update count drawn
+        self._shown_status = {}             # sensor id -> (connected, alarm state) on its tile
+        self._pump_notice = {}              # pump name -> notice on its tile (auto / keepalive / safety)
+        self._syncing_auto = False          # render pass is setting an Auto Mode checkbox
+        self.SAFETY_NOTICE_S = 10.0
+
+        # Tk loop lag + per-thread CPU (Diagnostics popup, logged every 5 min)
+        self.loop_monitor = LoopMonitor(self.root)
+        self.transport_stats = TransportStats()
+        self.LOOP_LOG_MS = 5 * 60 * 1000
+
+        # On-demand profiling: kill -USR1 <pid> (CPU), -USR2 (CPU + memory)
+        self.profile_session = None
+        try:
+            signal.signal(signal.SIGUSR1, lambda *_: self.root.after(0, self.start_profiling))
+            signal.signal(signal.SIGUSR2, lambda *_: self.root.after(0, lambda: self.start_profiling(memory=True)))
+        except (AttributeError, ValueError) as e:
+            log_diagnostics.warning("[PROFILE] Signal triggers unavailable: %s", e)
+
+        # settings.json is written off the Tk thread, debounced and atomically
+        self.settings_writer = SettingsWriter(SETTINGS_PATH)
+
+        # Nothing is drawn while the screen is blanked or the window hidden;
+        # polling, pump control and alarm sound carry on regardless.
+        self.DISPLAY_IDLE_MS = 1000
+        self._display_blanked = False
+        self._window_mapped = True
+        self._render_paused = False
+
+        # Settings popups are built on first open, then hidden and re-shown
+        self._popups = {}
+
+        # Optional Prometheus-style /metrics endpoint (settings.json "metrics")
+        self.metrics_settings = {"enabled": False, "bind": "127.0.0.1", "port": 9108}
+        # History retention (settings.json "history"); rollups at 1 h / 1 day are kept forever
+        self.history_settings = {"raw_days": 30, "rollup_1m_days": 365}
+        self.metrics_server = None
+
+        # Local IPC endpoint (NDJSON over a Unix socket) for other tools on the Pi;
+        # served by the acquisition process, which a view talks to as a client
+        self.ipc = None
+        if self.acquires:
+            self.ipc = LocalIPCServer(IPC_SOCKET_PATH, self.readings, self._handle_ipc_command)
+            try:
+                self.ipc.start()
+            except Exception as e:
+                log_ipc.warning("[IPC] Disabled: %s", e)
+
+        # Every flashing label (auto top-up, alarms) runs off this one timer
+        self.blink = BlinkClock(self.root) if self.displays else None
+
         # Alarm sound config (RPi / ALSA)
         self.sound_paths = {
             "approaching": os.path.join("MAIN", "approaching_limit.wav"),
@@ -279,10 +3550,17 @@ class SensorGUI:
         
         # Alarm bookkeeping (edge-triggered)
         self.alarm_state = {"A": "normal", "B": "normal", "C": "normal", "D": "normal", "E": "normal"}  # normal|approaching|critical
-        self.alarm_flash_jobs = {}           
         self.alarm_last_play = {}             
         self.alarm_sound_proc = {}            
-        self.current_status_text = {} 
+        # Alarm rules (settings.json "alarms"): the RO/pH/TDS limits from the
+        # sensor popups become rules, plus any extra rules listed there
+        self.alarm_settings = {
+            "hold_s": 5.0,          # a condition must last this long to raise or clear
+            "hysteresis": 0.25,     # fraction of the approach margin needed to clear
+            "margins": {"C": 50.0, "C_liters": 2.0, "C_gallons": 0.5, "D": 0.5, "E": 0.5},
+            "rules": [],
+        }
+        self.alarms = AlarmEngine(self._set_alarm_state)
         self._base_dir = os.path.dirname(os.path.abspath(__file__))
         self._wav_paths = {
             "approaching": os.path.join(self._base_dir, "MAIN", "approaching_limit.wav"),
@@ -304,28 +3582,229 @@ class SensorGUI:
         }
         self.use_frame_positions = True
  
-        # Main Grid Layout (position-driven)
-        p = self.frame_positions
-
-        self.aquarium_frame_1 = self.create_sensor_frame("Aquarium A", p["Aquarium A"]["row"], p["Aquarium A"]["col"],)
-        self.aquarium_frame_2 = self.create_sensor_frame("Aquarium B", p["Aquarium B"]["row"], p["Aquarium B"]["col"],)
-        self.ro_tank_frame     = self.create_ro_tank_frame("RO Tank", p["RO Tank"]["row"], p["RO Tank"]["col"])
-        self.ph_level_frame    = self.create_ph_level_frame("pH Sensor", p["pH Sensor"]["row"], p["pH Sensor"]["col"])
-        self.pump_frame_a      = self.create_pump_frame("RO Pump A", p["RO Pump A"]["row"], p["RO Pump A"]["col"])
-        self.pump_frame_b      = self.create_pump_frame("RO Pump B", p["RO Pump B"]["row"], p["RO Pump B"]["col"])
-        self.tds_level_frame   = self.create_tds_level_frame("TDS Sensor", p["TDS Sensor"]["row"], p["TDS Sensor"]["col"])
-        self.image_frame_b     = self.create_image_frame_b("", p["RPi Image"]["row"], p["RPi Image"]["col"], colspan=p["RPi Image"].get("colspan", 1))
-        self.image_frame_c     = self.create_image_frame_c("www.stork.solutions", p["www.stork.solutions"]["row"], p["www.stork.solutions"]["col"], colspan=p["www.stork.solutions"].get("colspan", 1))
-
-        # Apply optional visibility toggles
-        self.apply_frame_visibility()
+        if self.displays:
+            # Main Grid Layout (position-driven)
+            p = self.frame_positions
+
+            self.aquarium_frame_1 = self.create_sensor_frame("Aquarium A", p["Aquarium A"]["row"], p["Aquarium A"]["col"],)
+            self.aquarium_frame_2 = self.create_sensor_frame("Aquarium B", p["Aquarium B"]["row"], p["Aquarium B"]["col"],)
+            self.ro_tank_frame     = self.create_ro_tank_frame("RO Tank", p["RO Tank"]["row"], p["RO Tank"]["col"])
+            self.ph_level_frame    = self.create_ph_level_frame("pH Sensor", p["pH Sensor"]["row"], p["pH Sensor"]["col"])
+            self.pump_frame_a      = self.create_pump_frame("RO Pump A", p["RO Pump A"]["row"], p["RO Pump A"]["col"])
+            self.pump_frame_b      = self.create_pump_frame("RO Pump B", p["RO Pump B"]["row"], p["RO Pump B"]["col"])
+            self.tds_level_frame   = self.create_tds_level_frame("TDS Sensor", p["TDS Sensor"]["row"], p["TDS Sensor"]["col"])
+            self.image_frame_b     = self.create_image_frame_b("", p["RPi Image"]["row"], p["RPi Image"]["col"], colspan=p["RPi Image"].get("colspan", 1))
+            self.image_frame_c     = self.create_image_frame_c("www.stork.solutions", p["www.stork.solutions"]["row"], p["www.stork.solutions"]["col"], colspan=p["www.stork.solutions"].get("colspan", 1))
+
+            # Apply optional visibility toggles
+            self.apply_frame_visibility()
         self.load_threshold_settings()
-        self.apply_theme(self.root)
-        self.apply_reading_colors()
-        self.connect_to_sensors()
+        self.reload_alarm_rules()
+        if self.displays:
+            self._register_theme_roles()
+            self.apply_theme(self.root)
         self.sensor_failures = {"A": 0, "B": 0, "C": 0, "D": 0, "E": 0}
         self.sensor_active = {"A": True, "B": True, "C": True, "D": True, "E": True}
-        
+
+        # Non-blocking startup: show the last known readings (stale) straight away,
+        # connect in the background and let mainloop() put the window up now.
+        self._startup_trace = {"window_ms": None, "first_live_ms": None, "connected_ms": None}
+        if self.displays:
+            self.root.bind("<Map>", self._on_first_map, add="+")
+            self.root.bind("<Map>", self._on_window_map, add="+")
+            self.root.bind("<Unmap>", self._on_window_unmap, add="+")
+            self.show_warm_start_readings()
+            threading.Thread(target=self._display_blank_watcher, daemon=True).start()
+            self.root.after(self.RENDER_INTERVAL_MS, self._render_tick)
+        if self.acquires:
+            threading.Thread(target=self._background_connect, daemon=True).start()
+            threading.Thread(target=self._last_readings_saver, daemon=True).start()
+        else:
+            threading.Thread(target=self._acquisition_watch, daemon=True).start()
+        self.settings_watcher = SettingsWatcher(SETTINGS_PATH, self._on_settings_file_changed,
+                                                own_hash=lambda: self.settings_writer.last_hash)
+        self.settings_watcher.start()
+        self.loop_monitor.start()
+        self.root.after(self.LOOP_LOG_MS, self._log_loop_stats)
+        self._apply_metrics_settings()
+        self._apply_history_settings()
+
+    def _startup_ms(self):
+        return int((time.monotonic() - _STARTUP_T0) * 1000)
+
+    def _on_first_map(self, event=None):
+        if self._startup_trace["window_ms"] is None:
+            self._startup_trace["window_ms"] = self._startup_ms()
+            log.info("[STARTUP] Window shown after %s ms", self._startup_trace['window_ms'])
+
+    def _on_window_map(self, event):
+        if event.widget is self.root:
+            self._window_mapped = True
+
+    def _on_window_unmap(self, event):
+        if event.widget is self.root:   # iconified / withdrawn (child widgets unmap too)
+            self._window_mapped = False
+
+    def _probe_display_blanked(self):
+        """True if the panel backlight is off or X reports DPMS standby/suspend/off."""
+        base = "/sys/class/backlight"
+        try:
+            states = []
+            for name in os.listdir(base):
+                with open(os.path.join(base, name, "bl_power")) as f:
+                    states.append(f.read().strip() != "0")
+            if states:
+                return all(states)
+        except Exception:
+            pass
+
+        if os.environ.get("DISPLAY") and shutil.which("xset"):
+            try:
+                out = subprocess.run(["xset", "q"], capture_output=True, text=True, timeout=2).stdout
+                for state in ("Off", "Standby", "Suspend"):
+                    if f"Monitor is {state}" in out:
+                        return True
+            except Exception:
+                pass
+        return False
+
+    def _acquisition_watch(self, interval=5):
+        """
+        View: fetch the acquisition process's status (firmware, rates,
+        counters) for the popups, and start a new one if it has gone away,
+        since without it nothing polls the sensors or runs the pumps.
+        """
+        while True:
+            time.sleep(interval)
+            try:
+                if self.acquirer is not None and self.acquirer.poll() is not None:
+                    log_acquire.warning("[ACQUIRE] Acquisition process exited with %s", self.acquirer.returncode)
+                    self.acquirer = None
+                pid = ReadingsTable._owner_pid(self.readings.buf)
+                if not pid or not _pid_alive(pid):
+                    log_acquire.warning("[ACQUIRE] No acquisition process; starting one")
+                    table, self.acquirer = start_acquisition()
+                    self._call_ui(lambda: self._swap_readings(table))
+                    continue
+                reply = ipc_request({"cmd": "status"})
+                if reply.get("ok"):
+                    self._acq_status = reply
+                    self.sensor_firmware.update(reply.get("firmware") or {})
+            except Exception as e:
+                log_acquire.warning("[ACQUIRE] %s", e)
+
+    def _swap_readings(self, table):
+        """View: draw from a restarted acquisition process's table."""
+        old, self.readings = self.readings, table
+        self._rendered_counts.clear()
+        self._shown_status.clear()
+        self._pump_notice.clear()
+        old.close()
+
+    def _stop_acquisition(self, timeout=10.0):
+        """View: have the acquisition process exit (pumps off, history flushed) and wait for it."""
+        pid = ReadingsTable._owner_pid(self.readings.buf)
+        proc, self.acquirer = self.acquirer, None
+        try:
+            ipc_request({"cmd": "shutdown"}, timeout=timeout)
+        except Exception as e:
+            log_acquire.warning("[ACQUIRE] Shutdown request failed: %s", e)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if proc is not None and proc.poll() is not None:
+                break
+            if proc is None and not (pid and _pid_alive(pid)):
+                break
+            time.sleep(0.1)
+        else:
+            log_acquire.warning("[ACQUIRE] Acquisition process did not stop; terminating it")
+            try:
+                if proc is not None:
+                    proc.terminate()
+                elif pid:
+                    os.kill(pid, signal.SIGTERM)
+            except Exception as e:
+                log_acquire.warning("[ACQUIRE] %s", e)
+
+    def _display_blank_watcher(self, interval=5):
+        while True:
+            try:
+                blanked = self._probe_display_blanked()
+                if blanked != self._display_blanked:
+                    self._display_blanked = blanked
+                    log_ui.info("[DISPLAY] Screen %s", 'blanked' if blanked else 'on')
+            except Exception as e:
+                log_ui.warning("[DISPLAY] Probe error: %s", e)
+            time.sleep(interval)
+
+    def _background_connect(self):
+        """Connection phase off the Tk thread; the watchdog takes over afterwards."""
+        try:
+            self.connect_to_sensors()
+        except Exception as e:
+            log.warning("[STARTUP] Connect error: %s", e)
+        self._startup_trace["connected_ms"] = self._startup_ms()
+        log.info("[STARTUP] Connection phase finished after %s ms", self._startup_trace['connected_ms'])
+        threading.Thread(target=self.sensor_watchdog, daemon=True).start()
+        log_sensors.info("[WATCHDOG] Started")
+
+    def show_warm_start_readings(self):
+        """Fill the tiles from last_readings.json, clearly marked as stale."""
+        try:
+            if not os.path.exists(LAST_READINGS_PATH):
+                return
+            with open(LAST_READINGS_PATH, "r") as f:
+                saved = json.load(f).get("sensors", {})
+        except Exception as e:
+            log_readings.warning("[WARM START] Could not read %s: %s", LAST_READINGS_PATH, e)
+            return
+
+        nan = float("nan")
+        for sid, rec in saved.items():
+            frame = self.get_sensor_frame_by_id(sid)
+            if not frame or not isinstance(rec, dict):
+                continue
+            vals = {k: (nan if rec.get(k) is None else rec.get(k)) for k in ReadingsTable.FIELDS}
+            try:
+                self._render_sensor(sid, vals)
+                when = time.strftime("%d %b %H:%M", time.localtime(float(rec.get("ts") or 0)))
+                frame["connection_status"].config(text=f"Stale (last seen {when})", fg="orange")
+            except Exception as e:
+                log_readings.info("[WARM START] Sensor %s: %s", sid, e)
+        log_readings.info("[WARM START] Showing last known readings for %s", sorted(saved))
+
+    def save_last_readings(self):
+        """Persist the latest live value per sensor (merged with older entries)."""
+        snap = self.readings.snapshot()
+        try:
+            with open(LAST_READINGS_PATH, "r") as f:
+                out = json.load(f)
+        except Exception:
+            out = {"sensors": {}}
+        changed = False
+        for sid, rec in snap["sensors"].items():
+            if not rec["count"] or not rec["connected"]:
+                continue
+            out.setdefault("sensors", {})[sid] = {
+                k: (None if (isinstance(v, float) and v != v) else v)
+                for k, v in rec.items() if k in ReadingsTable.FIELDS
+            }
+            changed = True
+        if not changed:
+            return
+        tmp = LAST_READINGS_PATH + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(out, f)
+        os.replace(tmp, LAST_READINGS_PATH)
+
+    def _last_readings_saver(self, interval=60):
+        while True:
+            time.sleep(interval)
+            try:
+                self.save_last_readings()
+            except Exception as e:
+                log_readings.warning("[WARM START] Save failed: %s", e)
+
     def show_confirm(self, title, message, yes_text="Yes", no_text="Cancel"):
         import tkinter as tk
         popup = tk.Toplevel(self.root)
@@ -348,11 +3827,8 @@ class SensorGUI:
         tk.Button(btns, text=no_text, command=_no, width=10).pack(side="right", padx=(8, 0))
         tk.Button(btns, text=yes_text, command=_ok, width=12).pack(side="right")
 
-        # Apply your existing theme to THIS popup
-        try:
-            self.apply_theme(popup)
-        except Exception:
-            pass
+        # Born under the current palette (option database), nothing to restyle
+        self.theme.adopt(popup)
 
         # Center
         popup.update_idletasks()
@@ -390,6 +3866,18 @@ class SensorGUI:
         # Overlay it in the top-right corner with a little padding.
         btn.place(relx=1.0, rely=0.0, anchor="ne", x=-6, y=6)
         return btn
+
+    def attach_trend_chart(self, frame, color_key):
+        """
+        Trend line along the bottom of a tile. Packed to the bottom so the
+        readings above it can be hidden and re-packed freely.
+        """
+        color = self.visual_settings.get("colors", {}).get(color_key, "#0000FF")
+        trend = TrendChart(frame, color)
+        trend.color_key = color_key
+        if self.visual_settings.get("trends", True):
+            trend.canvas.pack(side="bottom", pady=(6, 0))
+        return trend
     
     # Auto GitHub Update
     def _version_tuple(self, v: str):
@@ -403,17 +3891,20 @@ class SensorGUI:
         return tuple(parts)
 
     def _http_get_json(self, url: str, timeout: int = 8):
+        import urllib.request   # only needed for the update check
         req = urllib.request.Request(url, headers={"User-Agent": "SAM-Max"})
         with urllib.request.urlopen(req, timeout=timeout) as resp:
             data = resp.read()
         return json.loads(data.decode("utf-8", "ignore"))
 
     def _http_get_bytes(self, url: str, timeout: int = 15) -> bytes:
+        import urllib.request
         req = urllib.request.Request(url, headers={"User-Agent": "SAM-Max"})
         with urllib.request.urlopen(req, timeout=timeout) as resp:
             return resp.read()
 
     def _sha256_hex(self, b: bytes) -> str:
+        import hashlib
         return hashlib.sha256(b).hexdigest().lower()
 
     def check_gui_update(self):
@@ -506,6 +3997,10 @@ class SensorGUI:
                 f"Updated to {latest}. Restarting now…"
             ))
 
+            # A view takes the acquisition process down too, so both run the new version
+            if not self.acquires:
+                self._stop_acquisition()
+
             # Restart process
             python = sys.executable or "python3"
             os.execv(python, [python] + sys.argv)
@@ -533,6 +4028,7 @@ class SensorGUI:
         water_gauge_label.pack(pady=10)
         temperature_label = tk.Label(frame, text="Temperature: --", font=("Arial", 14, "bold"), fg="red")
         temperature_label.pack(pady=10)
+        trend = self.attach_trend_chart(frame, "water")
        
         # Settings Cog (top-right)
         self.attach_settings_cog(frame, command=lambda sid=title.split()[-1]: self.open_settings_popup(sid))
@@ -542,6 +4038,7 @@ class SensorGUI:
             "connection_status": connection_status,
             "temperature_label": temperature_label,
             "water_gauge_label": water_gauge_label,
+            "trend": trend,
         }
 
     def create_ro_tank_frame(self, title, row, column, colspan=1):
@@ -562,6 +4059,7 @@ class SensorGUI:
         temperature_label.pack(pady=10)
         if self.display_units.get("C", {}).get("r2_temp_enabled", False):
             temperature_label.pack(pady=10)
+        trend = self.attach_trend_chart(frame, "water")
        
         # Settings Cog (top-right)
         settings_button = self.attach_settings_cog(frame, command=self.open_ro_settings_popup)
@@ -572,6 +4070,7 @@ class SensorGUI:
             "water_gauge_label": water_gauge_label,
             "temperature_label": temperature_label,
             "settings_button": settings_button, 
+            "trend": trend,
         }
    
     def create_ph_level_frame(self, title, row, column, colspan=1):
@@ -589,6 +4088,7 @@ class SensorGUI:
         ph_level_label.pack(pady=10)
         temperature_label = tk.Label(frame, text="Temperature: --", font=("Arial", 14, "bold"), fg="red")
         temperature_label.pack(pady=10)
+        trend = self.attach_trend_chart(frame, "ph")
        
         # Settings Cog (top-right)
         self.attach_settings_cog(frame, command=self.open_ph_settings_popup)
@@ -598,6 +4098,7 @@ class SensorGUI:
             "connection_status": connection_status,
             "ph_level_label": ph_level_label,
             "temperature_label": temperature_label,
+            "trend": trend,
         }
 
     def create_pump_frame(self, title, row, column):
@@ -614,6 +4115,7 @@ class SensorGUI:
 
         # Auto Mode Checkbox
         auto_mode_var = tk.BooleanVar(value=False)
+        auto_mode_var.trace_add("write", lambda *_: self._on_auto_mode_changed(title, auto_mode_var))
         auto_checkbox = tk.Checkbutton(
             frame,
             text="Enable Auto Mode",
@@ -625,15 +4127,20 @@ class SensorGUI:
 
         # Toggle Button
         toggle_button = tk.Button(frame, text="Turn On")
-        toggle_button.config(command=lambda: self.toggle_pump(title, pump_status, toggle_button))
+        toggle_button.config(command=lambda: self._on_pump_button(title))
         toggle_button.pack(pady=5)
 
+        # Evaporation / fill rate from the level history
+        rate_label = tk.Label(frame, text="", font=("Arial", 11), justify="center")
+        rate_label.pack(pady=(5, 0))
+
         return {
             "frame": frame,
             "pump_status": pump_status,
             "auto_top_up_label": auto_top_up_label,
             "toggle_button": toggle_button,
             "auto_mode_var": auto_mode_var,
+            "rate_label": rate_label,
         }
     def apply_frame_visibility(self):
         """Show/hide top-level frames based on self.frame_visibility.
@@ -803,44 +4310,35 @@ class SensorGUI:
                 pass
 
     def flash_auto_top_up(self, label, pump_name):
-        def toggle_color():
-            current_color = label.cget("fg")
-            label.config(fg="red" if current_color == "green" else "green")
-            self.flashing_labels[pump_name] = label.after(500, toggle_color)
-
-        # Cancel any existing flash before starting a new one
-        self.stop_flashing(pump_name)
-
-        label.config(text="AUTO TOP UP ACTIVE", fg="red")
-        toggle_color()
+        label.config(text="AUTO TOP UP ACTIVE")
+        self.blink.start(pump_name, label, "red", "green")
    
     def stop_flashing(self, pump_name):
-        if pump_name in self.flashing_labels:
-            try:
-                self.pump_frame_a["auto_top_up_label"].after_cancel(self.flashing_labels[pump_name])
-            except:
-                pass
-            self.flashing_labels.pop(pump_name, None)
+        self.blink.stop(pump_name)
 
         # Also clear the label visually
         if pump_name == "RO Pump A":
-            self.pump_frame_a["auto_top_up_label"].config(text="", fg="black")
+            self.pump_frame_a["auto_top_up_label"].config(text="", fg=self.theme.palette["fg"])
         elif pump_name == "RO Pump B":
-            self.pump_frame_b["auto_top_up_label"].config(text="", fg="black")
+            self.pump_frame_b["auto_top_up_label"].config(text="", fg=self.theme.palette["fg"])
         elif pump_name == "RO Tank":
-            self.ph_level_frame["connection_status"].config(text="Connected", fg="green")
+            self.ro_tank_frame["connection_status"].config(text="Connected", fg="green")
         elif pump_name == "pH Sensor":
             self.ph_level_frame["connection_status"].config(text="Connected", fg="green")
         elif pump_name == "TDS Sensor":
             self.tds_level_frame["connection_status"].config(text="Connected", fg="green")
 
     def control_pumps(self, sensor_id, water_level_mmwg):
+        """
+        Pump decisions for Sensor A/B. Runs on the poll thread: GPIO is driven
+        immediately and what the tile shows (auto top-up, keep-alive, safety
+        shutdown) goes into the readings table for the render pass, so a busy
+        or absent UI never delays a top-up or a safety shutdown.
+        """
         pump_name = "RO Pump A" if sensor_id == "A" else "RO Pump B"
-        pump_frame = self.pump_frame_a if sensor_id == "A" else self.pump_frame_b
-        pump_status_label = pump_frame["pump_status"]
-        auto_top_up_label = pump_frame["auto_top_up_label"]
-        auto_mode = pump_frame["auto_mode_var"].get()
-        toggle_button = pump_frame["toggle_button"]
+        # Rate fit sees the pump state this reading was taken under
+        self.level_rates[sensor_id].add(time.time(), water_level_mmwg, self.pump_states.get(pump_name, False))
+        auto_mode = self.auto_modes.get(pump_name, False)
 
         # Get raw mmWG thresholds
         on_threshold = self.thresholds.get(sensor_id, {}).get("on", 10)
@@ -860,10 +4358,8 @@ class SensorGUI:
                             pass
                         self.anti_idle_jobs[pump_name] = None
                     self.anti_idle_active[pump_name] = False
-                    try:
-                        auto_top_up_label.config(text="", fg="black")
-                    except Exception:
-                        pass
+                    self.readings.publish_pump(pump_name, keepalive=0)
+                    self.journal.record("keepalive", pump_name, "cancelled", reason="max level reached")
         except Exception as _e:
             # Non-fatal: keep existing logic running
             pass
@@ -871,28 +4367,32 @@ class SensorGUI:
         # If user has manually overridden auto mode
         if self.override_states[pump_name]:
             if water_level_mmwg < on_threshold:
-                print(f"[OVERRIDE RESET] Water level below threshold. Clearing manual override for {pump_name}.")
+                log_pumps.info("[OVERRIDE RESET] Water level below threshold. Clearing manual override for %s.", pump_name)
                 self.override_states[pump_name] = False
+                self._override_logged.discard(pump_name)
+                self.readings.publish_pump(pump_name, override=0)
+                self.journal.record("override", pump_name, "reset", level_mmwg=round(water_level_mmwg, 1))
             else:
-                print(f"[OVERRIDE ACTIVE] Manual override blocking auto for {pump_name}.")
+                # Logged once per override, not on every poll while it lasts
+                if pump_name not in self._override_logged:
+                    self._override_logged.add(pump_name)
+                    log_pumps.info("[OVERRIDE ACTIVE] Manual override blocking auto for %s.", pump_name)
+                    self.journal.record("override", pump_name, "active")
                 return
 
         if auto_mode:
             if water_level_mmwg <= on_threshold and not self.pump_states[pump_name]:
-                self.toggle_pump(pump_name, pump_status_label, toggle_button, force_state=True)
-                self.flash_auto_top_up(auto_top_up_label, pump_name)
+                self.toggle_pump(pump_name, force_state=True)
 
             elif water_level_mmwg >= off_threshold and self.pump_states[pump_name]:
-                self.toggle_pump(pump_name, pump_status_label, toggle_button, force_state=False)
-                auto_top_up_label.config(text="", fg="black")
+                self.toggle_pump(pump_name, force_state=False)
 
         else:
             # Manual mode active
             if water_level_mmwg >= off_threshold and self.pump_states[pump_name]:
-                print(f"[SAFETY] Manual mode overfill shutdown. Sensor: {sensor_id}, Reading: {water_level_mmwg:.2f}, Threshold: {off_threshold:.2f}")
-                self.toggle_pump(pump_name, pump_status_label, toggle_button, force_state=False, suppress_auto_disable=True)
-                auto_top_up_label.config(text="MAX LEVEL - SAFETY SHUTDOWN", fg="red")
-                self.root.after(10000, lambda: auto_top_up_label.config(text="", fg="black"))
+                log_pumps.info("[SAFETY] Manual mode overfill shutdown. Sensor: %s, Reading: %.2f, Threshold: %.2f", sensor_id, water_level_mmwg, off_threshold)
+                self.toggle_pump(pump_name, force_state=False, suppress_auto_disable=True, cause="safety")
+                self.readings.publish_pump(pump_name, safety=time.time())
         # KEEP-ALIVE: brief power cycle to avoid 12h main system auto power-off
         try:
             if auto_mode:
@@ -902,30 +4402,25 @@ class SensorGUI:
                     # Only cycle if pump is actually ON; otherwise there's nothing to "power cycle"
                     if self.pump_states.get(pump_name, False):
                         self.anti_idle_active[pump_name] = True
-                        try:
-                            auto_top_up_label.config(text="KEEP-ALIVE: cycling pump", fg="orange")
-                        except Exception:
-                            pass
+                        self.readings.publish_pump(pump_name, keepalive=1)
+                        self.journal.record("keepalive", pump_name, "start", off_s=self.KEEPALIVE_OFF_MS / 1000)
 
                         # Turn OFF briefly without disabling Auto Mode
-                        self.toggle_pump(pump_name, pump_status_label, toggle_button, force_state=False, suppress_auto_disable=True)
+                        self.toggle_pump(pump_name, force_state=False, suppress_auto_disable=True)
 
                         def _restore_power():
                             try:
                                 # Restore only if Auto Mode is still enabled
-                                frame = self.pump_frame_a if pump_name == "RO Pump A" else self.pump_frame_b
-                                if frame["auto_mode_var"].get():
+                                if self.auto_modes.get(pump_name, False):
                                     if not self.pump_states.get(pump_name, False):
-                                        self.toggle_pump(pump_name, pump_status_label, toggle_button, force_state=True, suppress_auto_disable=True)
+                                        self.toggle_pump(pump_name, force_state=True, suppress_auto_disable=True)
                             finally:
                                 # Reset timer and state either way
                                 self.last_max_reached[pump_name] = time.time()
                                 self.anti_idle_active[pump_name] = False
                                 self.anti_idle_jobs[pump_name] = None
-                                try:
-                                    auto_top_up_label.config(text="", fg="black")
-                                except Exception:
-                                    pass
+                                self.readings.publish_pump(pump_name, keepalive=0)
+                                self.journal.record("keepalive", pump_name, "end")
 
                         # Schedule power restore after 4 minutes
                         self.anti_idle_jobs[pump_name] = self.root.after(self.KEEPALIVE_OFF_MS, _restore_power)
@@ -934,9 +4429,15 @@ class SensorGUI:
             pass
 
 
-    def toggle_pump(self, pump_name, status_label=None, toggle_button=None, force_state=None, suppress_auto_disable=False):
+    def toggle_pump(self, pump_name, force_state=None, suppress_auto_disable=False, cause=None):
+        """
+        Switch a pump: force_state True/False, or None to flip it as the tile
+        button does (a manual override). Drives GPIO and publishes the new
+        state; any thread, no widgets.
+        """
         # Determine if this is a manual toggle
         user_override = force_state is None
+        was_on = self.pump_states[pump_name]
 
         if force_state is not None:
             self.pump_states[pump_name] = force_state
@@ -946,37 +4447,85 @@ class SensorGUI:
         pin = self.pump_gpio[pump_name]
         GPIO.output(pin, GPIO.HIGH if self.pump_states[pump_name] else GPIO.LOW)
 
-        if status_label:
-            status_label.config(
-                text="ON" if self.pump_states[pump_name] else "OFF",
-                fg="green" if self.pump_states[pump_name] else "red"
-            )
-
-        if toggle_button:
-            toggle_button.config(
-                text="Override" if self.pump_states[pump_name] else "Turn On"
-            )
-
         if user_override:
-            print(f"[OVERRIDE] User toggled pump '{pump_name}' manually, disabling auto mode.")
-   
-        # If manually turned OFF, disable auto mode checkbox
-        if user_override and not self.pump_states[pump_name] and not suppress_auto_disable:
-            print(f"[OVERRIDE] User cancelled pump '{pump_name}', disabling auto mode.")
-            if pump_name == "RO Pump A":
-                self.pump_frame_a["auto_mode_var"].set(False)
-            elif pump_name == "RO Pump B":
-                self.pump_frame_b["auto_mode_var"].set(False)
-        
+            log_pumps.info("[OVERRIDE] User toggled pump '%s' manually, disabling auto mode.", pump_name)
+            self.journal.record("override", pump_name, "manual toggle")
+
         # Turn relay 4 ON if either pump A or pump B is ON
         if self.pump_states.get("RO Pump A") or self.pump_states.get("RO Pump B"):
             GPIO.output(self.relay4_gpio, GPIO.HIGH)
         else:
             GPIO.output(self.relay4_gpio, GPIO.LOW)
 
-        # Stop flashing regardless of pump state
-        self.stop_flashing(pump_name)
-        
+        state = self.pump_states[pump_name]
+        published = {"on": 1 if state else 0}
+        if state != was_on:
+            if cause is None:
+                cause = "manual" if user_override else ("keepalive" if self.anti_idle_active.get(pump_name) else "auto")
+            self.journal.record("pump", pump_name, "on" if state else "off", cause=cause)
+            code = PUMP_ON_CAUSE.get(cause, PUMP_ON_CAUSE["manual"]) if state else 0.0
+            published["cause"] = code
+            if self.store and pump_name in PUMP_SERIES:
+                self.store.append(*PUMP_SERIES[pump_name], time.time(), code)
+        self.readings.publish_pump(pump_name, **published)
+
+        # If manually turned OFF, disable auto mode
+        if user_override and not state and not suppress_auto_disable:
+            log_pumps.info("[OVERRIDE] User cancelled pump '%s', disabling auto mode.", pump_name)
+            self.set_auto_mode(pump_name, False)
+
+    def set_auto_mode(self, pump_name, enabled):
+        """Auto Mode on/off for one pump; the tile's checkbox follows the table. Any thread."""
+        self.auto_modes[pump_name] = bool(enabled)
+        self.readings.publish_pump(pump_name, auto=1 if enabled else 0)
+
+    def _on_auto_mode_changed(self, pump_name, var):
+        """Trace on the Auto Mode checkbox: pass the user's change to pump control."""
+        if self._syncing_auto:
+            return      # the render pass showing the current state, not a user change
+        try:
+            enabled = bool(var.get())
+        except Exception:
+            return
+        if self.acquires:
+            self.set_auto_mode(pump_name, enabled)
+        else:
+            self._send_pump_command(pump_name, "auto" if enabled else "manual")
+
+    def _on_pump_button(self, pump_name):
+        """Tile button: flip the pump here, or have the acquisition process do it."""
+        if self.acquires:
+            self.toggle_pump(pump_name)
+        else:
+            self._send_pump_command(pump_name, "toggle")
+
+    def _ipc_async(self, msg, on_error=None):
+        """View: send msg to the acquisition process off the Tk thread; on_error(e) runs on the Tk thread."""
+        def worker():
+            try:
+                reply = ipc_request(msg)
+                if not reply.get("ok"):
+                    raise RuntimeError(reply.get("error", "refused"))
+            except Exception as e:
+                log_ipc.warning("[IPC] %s failed: %s", msg.get('cmd'), e)
+                if on_error:
+                    self._call_ui(lambda: on_error(e))
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _send_pump_command(self, pump_name, state):
+        def failed(e):
+            # Redraw the tile from the table (puts the checkbox back) and say why
+            self._rendered_counts.pop(pump_name, None)
+            messagebox.showerror("Pump", f"{pump_name}: the acquisition process did not respond ({e}).")
+        self._ipc_async({"cmd": "pump", "pump": pump_name, "state": state}, on_error=failed)
+
+    def _call_ui(self, func):
+        """Run func now if we are on the Tk thread, otherwise queue it there."""
+        if threading.current_thread() is threading.main_thread():
+            func()
+        else:
+            self.safe_gui_update(func)
+
     def create_tds_level_frame(self, title, row, column, colspan=1):
         frame = tk.LabelFrame(self.root, text=title, font=("Arial", 16, "bold"), padx=10, pady=10)
         frame.grid(row=row, column=column, padx=10, pady=10, sticky="nsew", columnspan=colspan)
@@ -999,6 +4548,7 @@ class SensorGUI:
   
         sal_level_label = tk.Label(frame, text="Salinity: -- PSU", font=("Arial", 14, "bold"), fg="orange")
         sal_level_label.pack(pady=6)
+        trend = self.attach_trend_chart(frame, "tds")
 
         # Settings Cog (top-right)
         self.attach_settings_cog(frame, command=self.open_tds_settings_popup)
@@ -1010,6 +4560,7 @@ class SensorGUI:
             "temperature_label": temperature_label,
             "cond_uScm_level_label": cond_uScm_level_label,
             "sal_level_label": sal_level_label,
+            "trend": trend,
         }
 
     def create_image_frame_b(self, title, row, column, colspan=1):
@@ -1080,19 +4631,19 @@ class SensorGUI:
 
         return {"frame": frame}
      
-    def open_settings_popup(self, sensor_id):
-
+    # Settings popups: built once, then hidden / re-shown
+    def _build_scroll_popup(self, title, pady=30):
+        """
+        Full-screen Toplevel with a drag / mouse-wheel scrolling canvas.
+        Returns (popup, canvas, container); content goes into container.
+        """
         popup = tk.Toplevel(self.root)
-        popup.title(f"Settings for Sensor {sensor_id}")
-        popup.attributes("-fullscreen", True)
+        popup.title(title)
+        popup.withdraw()
         popup.transient(self.root)
-        popup.grab_set()
-        popup.focus_set()
-        popup.lift()
-        popup.attributes('-topmost', True)
         popup.bind("<Double-Button-1>", lambda event: popup.attributes("-fullscreen", not popup.attributes("-fullscreen")))
+        popup.protocol("WM_DELETE_WINDOW", lambda: self._hide_popup(popup))
 
-    
         outer_frame = tk.Frame(popup)
         outer_frame.pack(fill="both", expand=True)
 
@@ -1113,10 +4664,7 @@ class SensorGUI:
         scrollable_frame.bind("<Configure>", on_frame_configure)
         canvas.bind("<Configure>", on_frame_configure)
 
-        # Mouse wheel / drag scroll
-        canvas.bind_all("<MouseWheel>", lambda e: canvas.yview_scroll(int(-1 * (e.delta / 120)), "units"))
-        canvas.bind_all("<Button-4>", lambda e: canvas.yview_scroll(-1, "units"))
-        canvas.bind_all("<Button-5>", lambda e: canvas.yview_scroll(1, "units"))
+        # Drag scroll (wheel bindings are global, see _show_popup)
         def drag_start(event): canvas.scan_mark(event.x, event.y)
         def drag_motion(event): canvas.scan_dragto(event.x, event.y, gain=1)
         scrollable_frame.bind("<ButtonPress-1>", drag_start)
@@ -1124,27 +4672,55 @@ class SensorGUI:
         canvas.bind("<ButtonPress-1>", drag_start)
         canvas.bind("<B1-Motion>", drag_motion)
 
-        # Content
         container = tk.Frame(scrollable_frame)
-        container.pack(pady=30, padx=40, anchor="center")
+        container.pack(pady=pady, padx=40, anchor="center")
+        return popup, canvas, container
 
-        tk.Label(container, text=f"Settings for Sensor {sensor_id}", font=("Arial", 16, "bold")).pack(pady=10)
+    def _show_popup(self, key, build):
+        """
+        Show the cached popup for key, building it on first use.
+        build() -> {"popup", "canvas", "refresh"}; refresh() reloads every
+        field from the current settings. Theming is a no-op unless dark mode
+        was switched while the popup was hidden.
+        """
+        entry = self._popups.get(key)
+        if entry is None or not entry["popup"].winfo_exists():
+            entry = build()
+            self.theme.adopt(entry["popup"])   # born under the current palette
+            self._popups[key] = entry
+
+        entry["refresh"]()
+        popup, canvas = entry["popup"], entry["canvas"]
+        self.apply_theme(popup)
 
-        fw = getattr(self, "sensor_firmware", {}).get(sensor_id, "UNKNOWN")
-        tk.Label(
-            container,
-            text=f"Sensor Firmware: {fw}",
-            font=("Arial", 12, "bold"),
-            fg="red"
-        ).pack(pady=(0, 12))
+        canvas.bind_all("<MouseWheel>", lambda e: canvas.yview_scroll(int(-1 * (e.delta / 120)), "units"))
+        canvas.bind_all("<Button-4>", lambda e: canvas.yview_scroll(-1, "units"))
+        canvas.bind_all("<Button-5>", lambda e: canvas.yview_scroll(1, "units"))
+        canvas.yview_moveto(0)
 
-        # Sensor Connection (Serial vs Wi-Fi TCP)
+        popup.deiconify()
+        popup.attributes("-fullscreen", True)
+        popup.grab_set()
+        popup.focus_set()
+        popup.lift()
+        popup.attributes('-topmost', True)
+        return popup
+
+    def _hide_popup(self, popup):
+        """Close a cached settings popup (kept for the next open)."""
+        try:
+            popup.grab_release()
+            popup.withdraw()
+        except Exception:
+            pass
+
+    def _add_connection_section(self, container, sensor_id):
+        """Serial vs Wi-Fi TCP selector shared by every sensor popup (fixed port 8888)."""
         conn_frame = tk.LabelFrame(container, text="Sensor Connection")
         conn_frame.pack(fill="x", pady=(10, 6))
 
-        ep = getattr(self, "endpoints", {}).get(sensor_id, {"type": "serial", "host": "", "port": 8888})
-        conn_type_var = tk.StringVar(value=ep.get("type", "serial"))
-        ip_var = tk.StringVar(value=ep.get("host", ""))  # fixed port 8888
+        conn_type_var = tk.StringVar(value="serial")
+        ip_var = tk.StringVar(value="")
 
         def toggle_ip_state(*_):
             state = tk.NORMAL if conn_type_var.get() == "tcp" else tk.DISABLED
@@ -1159,12 +4735,55 @@ class SensorGUI:
         ip_entry = tk.Entry(conn_frame, textvariable=ip_var, width=18)
         ip_entry.grid(row=1, column=1, sticky="w", padx=6)
 
-        toggle_ip_state()
+        def refresh():
+            ep = getattr(self, "endpoints", {}).get(sensor_id, {"type": "serial", "host": "", "port": 8888})
+            conn_type_var.set(ep.get("type", "serial"))
+            ip_var.set(ep.get("host", ""))
+            toggle_ip_state()
+
+        def save():
+            ct = conn_type_var.get()
+            host = ip_var.get().strip()
+            if ct == "tcp" and not host:
+                raise ValueError("Please enter an IP address for Wi-Fi TCP.")
+            self.endpoints[sensor_id] = {"type": ct, "host": host, "port": 8888}
+
+        return refresh, save
+
+    def _add_header(self, container, sensor_id, title):
+        tk.Label(container, text=title, font=("Arial", 16, "bold")).pack(pady=10)
+        fw_label = tk.Label(container, text="", font=("Arial", 12, "bold"), fg="red")
+        fw_label.pack(pady=(0, 12))
+
+        def refresh():
+            fw = getattr(self, "sensor_firmware", {}).get(sensor_id, "UNKNOWN")
+            fw_label.config(text=f"Sensor Firmware: {fw}")
+        return refresh
+
+    def _refresh_reset_button(self, button, sensor_id):
+        # Enable reset if the sensor is currently running (works for TCP/Serial)
+        button.config(state=tk.NORMAL if self._sensor_running(sensor_id) else tk.DISABLED)
+
+    def _sensor_running(self, sensor_id):
+        """Whether the sensor has a live session (in the acquisition process, for a view)."""
+        if self.acquires:
+            return bool(self.sensors.get(sensor_id, {}).get("is_running"))
+        rec = self.readings.snapshot()["sensors"].get(sensor_id)
+        return bool(rec and rec["count"] and rec["connected"])
+
+    def open_settings_popup(self, sensor_id):
+        self._show_popup(f"sensor_{sensor_id}", lambda: self._build_settings_popup(sensor_id))
+
+    def _build_settings_popup(self, sensor_id):
+        popup, canvas, container = self._build_scroll_popup(f"Settings for Sensor {sensor_id}")
+
+        refresh_header = self._add_header(container, sensor_id, f"Settings for Sensor {sensor_id}")
+        refresh_conn, save_conn = self._add_connection_section(container, sensor_id)
 
         # Units / thresholds
-        use_liters_var = tk.BooleanVar(value=self.display_units[sensor_id].get("use_liters", False))
-        use_gallons_var = tk.BooleanVar(value=self.display_units[sensor_id].get("use_gallons", False))
-        use_fahrenheit_var = tk.BooleanVar(value=self.display_units[sensor_id].get("use_fahrenheit", False))
+        use_liters_var = tk.BooleanVar(value=False)
+        use_gallons_var = tk.BooleanVar(value=False)
+        use_fahrenheit_var = tk.BooleanVar(value=False)
 
         tk.Checkbutton(container, text="Show Temperature in °F", variable=use_fahrenheit_var).pack(pady=5)
 
@@ -1207,36 +4826,48 @@ class SensorGUI:
         depth_entry = tk.Entry(container)
         depth_entry.pack(pady=2)
 
-        # Fill initial values
-        width = self.display_units[sensor_id].get("width", 0)
-        depth = self.display_units[sensor_id].get("depth", 0)
-        width_entry.insert(0, str(width))
-        depth_entry.insert(0, str(depth))
-
-        on_mmwg = float(self.thresholds[sensor_id].get("on", 315))
-        off_mmwg = float(self.thresholds[sensor_id].get("off", 336))
-
-        if use_liters_var.get() and width > 0 and depth > 0:
-            height_on_cm = on_mmwg / 10.0
-            height_off_cm = off_mmwg / 10.0
-            liters_on = height_on_cm * width * depth / 1000.0
-            liters_off = height_off_cm * width * depth / 1000.0
-            on_entry.insert(0, f"{liters_on:.2f}")
-            off_entry.insert(0, f"{liters_off:.2f}")
-        elif use_gallons_var.get() and width > 0 and depth > 0:
-            height_on_cm = on_mmwg / 10.0
-            height_off_cm = off_mmwg / 10.0
-            liters_on = height_on_cm * width * depth / 1000.0
-            liters_off = height_off_cm * width * depth / 1000.0
-            gallons_on = liters_on * 0.264172
-            gallons_off = liters_off * 0.264172
-            on_entry.insert(0, f"{gallons_on:.2f}")
-            off_entry.insert(0, f"{gallons_off:.2f}")
-        else:
-            on_entry.insert(0, f"{on_mmwg:.1f}")
-            off_entry.insert(0, f"{off_mmwg:.1f}")
+        def refresh():
+            refresh_header()
+            refresh_conn()
+            units = self.display_units[sensor_id]
+            use_liters_var.set(units.get("use_liters", False))
+            use_gallons_var.set(units.get("use_gallons", False))
+            use_fahrenheit_var.set(units.get("use_fahrenheit", False))
+
+            # Fill current values
+            width = units.get("width", 0)
+            depth = units.get("depth", 0)
+            for entry in (width_entry, depth_entry, on_entry, off_entry):
+                entry.config(state=tk.NORMAL)
+                entry.delete(0, tk.END)
+            width_entry.insert(0, str(width))
+            depth_entry.insert(0, str(depth))
+
+            on_mmwg = float(self.thresholds[sensor_id].get("on", 315))
+            off_mmwg = float(self.thresholds[sensor_id].get("off", 336))
+
+            if use_liters_var.get() and width > 0 and depth > 0:
+                height_on_cm = on_mmwg / 10.0
+                height_off_cm = off_mmwg / 10.0
+                liters_on = height_on_cm * width * depth / 1000.0
+                liters_off = height_off_cm * width * depth / 1000.0
+                on_entry.insert(0, f"{liters_on:.2f}")
+                off_entry.insert(0, f"{liters_off:.2f}")
+            elif use_gallons_var.get() and width > 0 and depth > 0:
+                height_on_cm = on_mmwg / 10.0
+                height_off_cm = off_mmwg / 10.0
+                liters_on = height_on_cm * width * depth / 1000.0
+                liters_off = height_off_cm * width * depth / 1000.0
+                gallons_on = liters_on * 0.264172
+                gallons_off = liters_off * 0.264172
+                on_entry.insert(0, f"{gallons_on:.2f}")
+                off_entry.insert(0, f"{gallons_off:.2f}")
+            else:
+                on_entry.insert(0, f"{on_mmwg:.1f}")
+                off_entry.insert(0, f"{off_mmwg:.1f}")
 
-        toggle_dim_fields()
+            toggle_dim_fields()
+            self._refresh_reset_button(reset_button, sensor_id)
 
         # Save handler (writes thresholds, units, and connection)
         def save_thresholds():
@@ -1278,6 +4909,9 @@ class SensorGUI:
                     mmwg_on = on_val
                     mmwg_off = off_val
 
+                # Persist connection choice (fixed port 8888)
+                save_conn()
+
                 # Persist thresholds / units
                 self.thresholds[sensor_id]["on"] = mmwg_on
                 self.thresholds[sensor_id]["off"] = mmwg_off
@@ -1287,41 +4921,31 @@ class SensorGUI:
                 self.display_units[sensor_id]["use_gallons"] = use_gallons_var.get()
                 self.display_units[sensor_id]["use_fahrenheit"] = use_fahrenheit_var.get()
 
-                # Persist connection choice (fixed port 8888)
-                ct = conn_type_var.get()
-                host = ip_var.get().strip()
-                if ct == "tcp" and not host:
-                     raise ValueError("Please enter an IP address for Wi-Fi TCP.")
-                self.endpoints[sensor_id] = {"type": ct, "host": host, "port": 8888}
-
                 self.save_threshold_settings()
                 self.show_success_popup(f"Sensor {sensor_id} Updated")
-                popup.destroy()
+                self._hide_popup(popup)
 
             except Exception as e:
                 messagebox.showerror("Invalid Input", str(e))
 
-   
         tk.Button(container, text="Submit", command=save_thresholds).pack(pady=20)
 
-        # Enable reset if the sensor is currently running (works for TCP/Serial)
-        tk.Button(
+        reset_button = tk.Button(
             container,
-             text="Reset Sensor",
-             state=tk.NORMAL if self.sensors.get(sensor_id, {}).get("is_running") else tk.DISABLED,
-             command=lambda: (self.reset_sensor(sensor_id), popup.destroy())
-        ).pack(pady=10)
+            text="Reset Sensor",
+            command=lambda: (self.reset_sensor(sensor_id), self._hide_popup(popup))
+        )
+        reset_button.pack(pady=10)
         # Tare Button
         tk.Button(container,
-                 text="Tare Level (Zero mmWG)",
-                 command=lambda sid=sensor_id, win=popup: self.tare_sensor(sid, win)
+                  text="Tare Level (Zero mmWG)",
+                  command=lambda sid=sensor_id, win=popup: self.tare_sensor(sid, win)
         ).pack(pady=8)
 
-        tk.Button(container, text="Graphics", command=lambda: (popup.destroy(), self.open_graphics_popup())).pack(pady=10)
+        tk.Button(container, text="Graphics", command=lambda: (self._hide_popup(popup), self.open_graphics_popup())).pack(pady=10)
+
+        return {"popup": popup, "canvas": canvas, "refresh": refresh}
 
-        if self.visual_settings.get("dark_mode"):
-            self.apply_theme(popup)
-       
     def toggle_dimension_fields():
         state = tk.NORMAL if use_liters_var.get() else tk.DISABLED
         width_entry.config(state=state)
@@ -1329,30 +4953,33 @@ class SensorGUI:
  
     # Main settings save
     def save_threshold_settings(self):
+        """Queue settings.json for the background writer (never blocks on disk)."""
         try:
-            with open("settings.json", "w") as f:
-                json.dump({
-                    "thresholds": self.thresholds,
-                    "display_units": self.display_units,
-                    #"graphics_settings": getattr(self, "graphics_settings", {})
-                    "visual_settings": self.visual_settings,
-                    "sensor_firmware": getattr(self, "sensor_firmware", {}),
-                    "endpoints": getattr(self, "endpoints", {}),
-                    "tare_offsets": getattr(self, "tare_offsets", {"A":0.0,"B":0.0,"C":0.0}),
-                    "frame_positions": getattr(self, "frame_positions", {}),
-                    "use_frame_positions": getattr(self, "use_frame_positions", True),
-                    "frame_visibility": getattr(self, "frame_visibility", {}),
-
-                }, f, indent=4)
-                print("[SAVE] Threshold and graphics settings saved.")
+            self.settings_writer.submit({
+                "thresholds": self.thresholds,
+                "display_units": self.display_units,
+                #"graphics_settings": getattr(self, "graphics_settings", {})
+                "visual_settings": self.visual_settings,
+                "sensor_firmware": getattr(self, "sensor_firmware", {}),
+                "endpoints": getattr(self, "endpoints", {}),
+                "tare_offsets": getattr(self, "tare_offsets", {"A":0.0,"B":0.0,"C":0.0}),
+                "frame_positions": getattr(self, "frame_positions", {}),
+                "use_frame_positions": getattr(self, "use_frame_positions", True),
+                "frame_visibility": getattr(self, "frame_visibility", {}),
+                "metrics": self.metrics_settings,
+                "history": self.history_settings,
+                "alarms": self.alarm_settings,
+
+            })
+            self.reload_alarm_rules()
         except Exception as e:
-            print(f"[SAVE ERROR] Failed to save settings: {e}")
+            log_settings.error("[SAVE ERROR] Failed to save settings: %s", e)
    
     # Main settings loading      
     def load_threshold_settings(self):
         try:
-            if os.path.exists("settings.json"):
-                with open("settings.json", "r") as f:
+            if os.path.exists(SETTINGS_PATH):
+                with open(SETTINGS_PATH, "r") as f:
                     data = json.load(f)
                     self.thresholds.update(data.get("thresholds", {}))
                     self.display_units.update(data.get("display_units", {}))
@@ -1363,6 +4990,9 @@ class SensorGUI:
                     self.frame_positions.update(data.get("frame_positions", {}))
                     self.use_frame_positions = data.get("use_frame_positions", True)
                     self.frame_visibility.update(data.get("frame_visibility", {}))
+                    self.metrics_settings.update(data.get("metrics", {}))
+                    self.history_settings.update(data.get("history", {}))
+                    self.alarm_settings.update(data.get("alarms", {}))
                     self.graphics_settings = data.get("graphics_settings", {
                         "dark_mode": False,
                         "color_water": "#0000FF",
@@ -1377,7 +5007,7 @@ class SensorGUI:
                         "E": {"type": "serial", "host": "", "port": 8888},
                     })
 
-                    print("[LOAD] Threshold and graphics settings loaded.")
+                    log_settings.info("[LOAD] Threshold and graphics settings loaded.")
             else:
                 self.graphics_settings = {
                     "dark_mode": False,
@@ -1386,103 +5016,188 @@ class SensorGUI:
                     "color_ph": "#800080",
                     "color_tds": "#800080"
                 }
-                print("[LOAD] No settings file found. Using defaults.")
+                log_settings.info("[LOAD] No settings file found. Using defaults.")
         except Exception as e:
-            print(f"[LOAD ERROR] Failed to load settings: {e}")
+            log_settings.error("[LOAD ERROR] Failed to load settings: %s", e)
+
+    # settings.json edited outside the app
+    def _validate_settings(self, data):
+        """Return a list of problems with an externally edited settings dict."""
+        errors = []
+        def is_num(v):
+            return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+        for section in ("thresholds", "display_units", "visual_settings", "endpoints",
+                        "tare_offsets", "frame_positions", "frame_visibility", "metrics", "history", "alarms"):
+            if section in data and not isinstance(data[section], dict):
+                errors.append(f"{section} must be an object")
+        if errors:
+            return errors
+
+        for sid, t in data.get("thresholds", {}).items():
+            if not isinstance(t, dict) or not is_num(t.get("on")) or not is_num(t.get("off")):
+                errors.append(f"thresholds.{sid} needs numeric on/off")
+            elif t["on"] >= t["off"]:
+                errors.append(f"thresholds.{sid}: on must be below off")
+        for sid, ep in data.get("endpoints", {}).items():
+            if not isinstance(ep, dict) or ep.get("type") not in ("serial", "tcp"):
+                errors.append(f"endpoints.{sid}.type must be serial or tcp")
+            elif ep.get("type") == "tcp" and not str(ep.get("host") or "").strip():
+                errors.append(f"endpoints.{sid}: tcp needs a host")
+            elif not isinstance(ep.get("port", 8888), int):
+                errors.append(f"endpoints.{sid}.port must be an integer")
+        for sid, v in data.get("tare_offsets", {}).items():
+            if not is_num(v):
+                errors.append(f"tare_offsets.{sid} must be a number")
+        for name, pos in data.get("frame_positions", {}).items():
+            if not isinstance(pos, dict) or not isinstance(pos.get("row"), int) or not isinstance(pos.get("col"), int):
+                errors.append(f"frame_positions.{name} needs integer row/col")
+        if "use_frame_positions" in data and not isinstance(data["use_frame_positions"], bool):
+            errors.append("use_frame_positions must be true/false")
+        m = data.get("metrics", {})
+        if "enabled" in m and not isinstance(m["enabled"], bool):
+            errors.append("metrics.enabled must be true/false")
+        if "port" in m and (not isinstance(m["port"], int) or not 0 < m["port"] < 65536):
+            errors.append("metrics.port must be an integer port number")
+        if "bind" in m and not isinstance(m["bind"], str):
+            errors.append("metrics.bind must be an address string")
+        for k, v in data.get("history", {}).items():
+            if k in ("raw_days", "rollup_1m_days") and not (is_num(v) and v >= 2):
+                errors.append(f"history.{k} must be a number of days (2 or more)")
+        a = data.get("alarms", {})
+        for k in ("hold_s", "hysteresis"):
+            if k in a and not (is_num(a[k]) and a[k] >= 0):
+                errors.append(f"alarms.{k} must be a number (0 or more)")
+        if not isinstance(a.get("margins", {}), dict) or not all(is_num(v) and v >= 0 for v in a.get("margins", {}).values()):
+            errors.append("alarms.margins must map sensors to numbers")
+        if not isinstance(a.get("rules", []), list):
+            errors.append("alarms.rules must be a list")
+        else:
+            for i, rule in enumerate(a.get("rules", [])):
+                problem = AlarmEngine.check_rule(rule)
+                if problem:
+                    errors.append(f"alarms.rules[{i}] {problem}")
+        return errors
+
+    def _on_settings_file_changed(self, data):
+        """Watcher thread: validate, then apply on the Tk thread."""
+        errors = self._validate_settings(data)
+        if errors:
+            log_settings.warning("[SETTINGS WATCH] Ignoring invalid settings.json: %s", '; '.join(errors))
+            return
+        self.safe_gui_update(lambda: self._apply_external_settings(data))
+
+    def _apply_external_settings(self, data):
+        """Apply only the sections that differ from what is running now."""
+        changed = []
+
+        if "thresholds" in data and data["thresholds"] != self.thresholds:
+            self.thresholds.update(data["thresholds"])
+            changed.append("thresholds")
+
+        rerender = False
+        if "display_units" in data and data["display_units"] != self.display_units:
+            self.display_units.update(data["display_units"])
+            changed.append("display_units")
+            rerender = True
+            self.layout_tds_tile()
+        if "tare_offsets" in data and data["tare_offsets"] != self.tare_offsets:
+            self.tare_offsets.update(data["tare_offsets"])
+            changed.append("tare_offsets")
+            rerender = True
+        if rerender:
+            self._rendered_counts.clear()   # redraw every tile with the new units/offsets
+
+        if "visual_settings" in data and data["visual_settings"] != self.visual_settings:
+            self.visual_settings.update(data["visual_settings"])
+            changed.append("visual_settings")
+            if self.displays:
+                self.apply_theme()
+
+        relayout = False
+        for key in ("frame_positions", "frame_visibility"):
+            if key in data and data[key] != getattr(self, key):
+                getattr(self, key).update(data[key])
+                changed.append(key)
+                relayout = True
+        if "use_frame_positions" in data and data["use_frame_positions"] != self.use_frame_positions:
+            self.use_frame_positions = data["use_frame_positions"]
+            changed.append("use_frame_positions")
+            relayout = True
+        if relayout and self.displays:
+            self.apply_frame_visibility()
+
+        for sid, ep in data.get("endpoints", {}).items():
+            old = self.endpoints.get(sid, {})
+            if (old.get("type"), old.get("host"), int(old.get("port", 8888))) == \
+               (ep.get("type"), ep.get("host"), int(ep.get("port", 8888))):
+                continue
+            self.endpoints[sid] = {"type": ep["type"], "host": str(ep.get("host") or "").strip(),
+                                   "port": int(ep.get("port", 8888))}
+            changed.append(f"endpoints.{sid}")
+            if self.acquires:
+                self._restart_sensor_session(sid)
+
+        if "metrics" in data and {**self.metrics_settings, **data["metrics"]} != self.metrics_settings:
+            self.metrics_settings.update(data["metrics"])
+            changed.append("metrics")
+            self._apply_metrics_settings()
+
+        if "history" in data and {**self.history_settings, **data["history"]} != self.history_settings:
+            self.history_settings.update(data["history"])
+            changed.append("history")
+            self._apply_history_settings()
+
+        if "alarms" in data and {**self.alarm_settings, **data["alarms"]} != self.alarm_settings:
+            self.alarm_settings.update(data["alarms"])
+            changed.append("alarms")
+        if any(k in changed for k in ("alarms", "display_units")):
+            self.reload_alarm_rules()
+
+        if changed:
+            log_settings.info("[SETTINGS WATCH] Applied external changes: %s", ', '.join(changed))
+
+    def _restart_sensor_session(self, sensor_id):
+        """Drop one sensor's session; the watchdog reconnects it using the current endpoint."""
+        sensor = self.sensors.get(sensor_id)
+        if not sensor:
+            return
+        port = sensor.get("port")
+        sensor["is_running"] = False
+        sensor["port"] = None
+        self.journal.record("sensor", sensor_id, "disconnected", reason="endpoint changed")
+        self.sensor_fail_counts[sensor_id] = 0
+        self.sensor_disabled_flags[sensor_id] = False
+        if port:
+            threading.Thread(target=port.close, daemon=True).start()
+        log_settings.info("[SETTINGS WATCH] Sensor %s endpoint changed; reconnecting", sensor_id)
 
     def open_ro_settings_popup(self):
-        popup = tk.Toplevel(self.root)
-        popup.title("RO Tank Settings (Sensor C)")
-        popup.attributes("-fullscreen", True)
-        popup.transient(self.root)
-        popup.grab_set()
-        popup.focus_set()
-        popup.lift()
-        popup.attributes('-topmost', True)
-        popup.bind("<Double-Button-1>", lambda event: popup.attributes("-fullscreen", not popup.attributes("-fullscreen")))
-
-        # Scrollable layout
-        outer_frame = tk.Frame(popup); outer_frame.pack(fill="both", expand=True)
-        canvas = tk.Canvas(outer_frame, highlightthickness=0); canvas.pack(side="left", fill="both", expand=True)
-        scrollbar = tk.Scrollbar(outer_frame, orient="vertical", command=canvas.yview); scrollbar.pack(side="right", fill="y")
-        canvas.configure(yscrollcommand=scrollbar.set)
-
-        scrollable_frame = tk.Frame(canvas)
-        window = canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-
-        def on_frame_configure(event):
-            canvas.configure(scrollregion=canvas.bbox("all"))
-            canvas.itemconfig(window, width=event.width)
-        scrollable_frame.bind("<Configure>", on_frame_configure)
-        canvas.bind("<Configure>", on_frame_configure)
-
-        canvas.bind_all("<MouseWheel>", lambda e: canvas.yview_scroll(int(-1 * (e.delta / 120)), "units"))
-        canvas.bind_all("<Button-4>", lambda e: canvas.yview_scroll(-1, "units"))
-        canvas.bind_all("<Button-5>", lambda e: canvas.yview_scroll(1, "units"))
-
-        def drag_start(event): canvas.scan_mark(event.x, event.y)
-        def drag_motion(event): canvas.scan_dragto(event.x, event.y, gain=1)
-        scrollable_frame.bind("<ButtonPress-1>", drag_start)
-        scrollable_frame.bind("<B1-Motion>", drag_motion)
-        canvas.bind("<ButtonPress-1>", drag_start)
-        canvas.bind("<B1-Motion>", drag_motion)
-
-        # Content
-        container = tk.Frame(scrollable_frame)
-        container.pack(pady=30, padx=40, anchor="center")
+        self._show_popup("sensor_C", self._build_ro_settings_popup)
 
+    def _build_ro_settings_popup(self):
         sensor_id = "C"
-        tk.Label(container, text=f"Settings for Sensor {sensor_id}", font=("Arial", 16, "bold")).pack(pady=10)
-
-        fw = getattr(self, "sensor_firmware", {}).get(sensor_id, "UNKNOWN")
-        tk.Label(
-            container,
-            text=f"Sensor Firmware: {fw}",
-            font=("Arial", 12, "bold"),
-            fg="red"
-        ).pack(pady=(0, 12))
-
-        # Sensor Connection (Serial vs Wi-Fi TCP)
-        conn_frame = tk.LabelFrame(container, text="Sensor Connection")
-        conn_frame.pack(fill="x", pady=(10, 6))
-
-        ep = getattr(self, "endpoints", {}).get(sensor_id, {"type": "serial", "host": "", "port": 8888})
-        conn_type_var = tk.StringVar(value=ep.get("type", "serial"))
-        ip_var = tk.StringVar(value=ep.get("host", ""))  # fixed port 8888
-
-        def toggle_ip_state(*_):
-            state = tk.NORMAL if conn_type_var.get() == "tcp" else tk.DISABLED
-            ip_entry.config(state=state)
-
-        tk.Radiobutton(conn_frame, text="Serial USB", value="serial", variable=conn_type_var,
-                       command=toggle_ip_state).grid(row=0, column=0, padx=6, pady=4, sticky="w")
-        tk.Radiobutton(conn_frame, text="Wi-Fi TCP", value="tcp", variable=conn_type_var,
-                       command=toggle_ip_state).grid(row=0, column=1, padx=6, pady=4, sticky="w")
+        popup, canvas, container = self._build_scroll_popup("RO Tank Settings (Sensor C)")
 
-        tk.Label(conn_frame, text="IP Address:").grid(row=1, column=0, sticky="e", padx=6)
-        ip_entry = tk.Entry(conn_frame, textvariable=ip_var, width=18)
-        ip_entry.grid(row=1, column=1, sticky="w", padx=6)
-
-        toggle_ip_state()
+        refresh_header = self._add_header(container, sensor_id, f"Settings for Sensor {sensor_id}")
+        refresh_conn, save_conn = self._add_connection_section(container, sensor_id)
 
-        # Existing RO settings
-        display_unit = self.display_units[sensor_id]
-        
-        r2_temp_var = tk.BooleanVar(value=display_unit.get("r2_temp_enabled", False))
+        # RO settings
+        r2_temp_var = tk.BooleanVar(value=False)
         tk.Checkbutton(
             container,
             text="Activate Temperature (R2 Sensors ONLY)",
             variable=r2_temp_var
         ).pack(pady=(6, 2))
-        
-        level_alarm_var = tk.BooleanVar(value=display_unit.get("level_alarm", False))
-        use_liters_var = tk.BooleanVar(value=display_unit.get("use_liters", False))
-        use_gallons_var = tk.BooleanVar(value=display_unit.get("use_gallons", False))
 
-        width_var = tk.StringVar(value=str(display_unit.get("width", "")))
-        depth_var = tk.StringVar(value=str(display_unit.get("depth", "")))
-        min_level_var = tk.StringVar(value=str(display_unit.get("min_alarm", "")))
-        max_level_var = tk.StringVar(value=str(display_unit.get("max_alarm", "")))
+        level_alarm_var = tk.BooleanVar(value=False)
+        use_liters_var = tk.BooleanVar(value=False)
+        use_gallons_var = tk.BooleanVar(value=False)
+
+        width_var = tk.StringVar()
+        depth_var = tk.StringVar()
+        min_level_var = tk.StringVar()
+        max_level_var = tk.StringVar()
 
         tk.Checkbutton(container, text="Display in Liters", variable=use_liters_var,
                        command=lambda: (use_gallons_var.set(False), toggle_unit_fields())).pack(pady=2)
@@ -1510,23 +5225,35 @@ class SensorGUI:
         def toggle_alarm_fields():
             state = tk.NORMAL if level_alarm_var.get() else tk.DISABLED
             for w in (min_label, min_entry, max_label, max_entry): w.config(state=state)
-        toggle_unit_fields(); toggle_alarm_fields()
+
+        def refresh():
+            refresh_header()
+            refresh_conn()
+            display_unit = self.display_units[sensor_id]
+            r2_temp_var.set(display_unit.get("r2_temp_enabled", False))
+            level_alarm_var.set(display_unit.get("level_alarm", False))
+            use_liters_var.set(display_unit.get("use_liters", False))
+            use_gallons_var.set(display_unit.get("use_gallons", False))
+            width_var.set(str(display_unit.get("width", "")))
+            depth_var.set(str(display_unit.get("depth", "")))
+            min_level_var.set(str(display_unit.get("min_alarm", "")))
+            max_level_var.set(str(display_unit.get("max_alarm", "")))
+            toggle_unit_fields(); toggle_alarm_fields()
+            self._refresh_reset_button(reset_button, sensor_id)
 
         def save_ro_alarm_settings():
             try:
+                display_unit = self.display_units[sensor_id]
+
                 # persist connection choice (fixed 8888)
-                ct = conn_type_var.get()
-                host = ip_var.get().strip()
-                if ct == "tcp" and not host:
-                    raise ValueError("Please enter an IP address for Wi-Fi TCP.")
-                self.endpoints[sensor_id] = {"type": ct, "host": host, "port": 8888}
+                save_conn()
 
                 # existing RO settings save
                 display_unit["level_alarm"] = level_alarm_var.get()
                 display_unit["use_liters"] = use_liters_var.get()
                 display_unit["use_gallons"] = use_gallons_var.get()
                 display_unit["r2_temp_enabled"] = r2_temp_var.get()
-                
+
                 # Show & Hide Label
                 temp_lbl = self.ro_tank_frame.get("temperature_label")
                 if temp_lbl:
@@ -1553,140 +5280,78 @@ class SensorGUI:
                     display_unit["min_alarm"] = min_val; display_unit["max_alarm"] = max_val
                 else:
                     display_unit["min_alarm"] = 0; display_unit["max_alarm"] = 0
-                    
-                # If the RO alarm was just turned OFF, stop sound/flash and return to green
-                if not level_alarm_var.get():
-                    self._set_alarm_state("ro_tank", "normal", self.ro_tank_frame["connection_status"])
 
                 self.save_threshold_settings()
                 self.show_success_popup(f"Sensor {sensor_id} Updated")
-                popup.destroy()
+                self._hide_popup(popup)
             except Exception as e:
                 messagebox.showerror("Invalid Input", str(e))
 
         tk.Button(container, text="Submit", command=save_ro_alarm_settings).pack(pady=20)
-        tk.Button(
+        reset_button = tk.Button(
             container,
-           text="Reset Sensor",
-            state=tk.NORMAL if self.sensors.get(sensor_id, {}).get("is_running") else tk.DISABLED,
-            command=lambda: (self.reset_sensor(sensor_id), popup.destroy())
-        ).pack(pady=10)
-        
+            text="Reset Sensor",
+            command=lambda: (self.reset_sensor(sensor_id), self._hide_popup(popup))
+        )
+        reset_button.pack(pady=10)
+
         # Tare Button
         tk.Button(container,
-                 text="Tare Level (Zero mmWG)",
-                 command=lambda win=popup: self.tare_sensor("C", win)
+                  text="Tare Level (Zero mmWG)",
+                  command=lambda win=popup: self.tare_sensor("C", win)
         ).pack(pady=8)
-        
-        tk.Button(container, text="Graphics", command=lambda: (popup.destroy(), self.open_graphics_popup())).pack(pady=10)
-
-        if self.visual_settings.get("dark_mode"):
-            self.apply_theme(popup)
-       
-    def open_ph_settings_popup(self):
-        popup = tk.Toplevel(self.root)
-        popup.title("Settings for Sensor D")
-        popup.attributes("-fullscreen", True)
-        popup.transient(self.root)
-        popup.grab_set()
-        popup.focus_set()
-        popup.lift()
-        popup.attributes('-topmost', True)
-        popup.bind("<Double-Button-1>", lambda event: popup.attributes("-fullscreen", not popup.attributes("-fullscreen")))
-
-        # Scrollable layout
-        outer_frame = tk.Frame(popup); outer_frame.pack(fill="both", expand=True)
-        canvas = tk.Canvas(outer_frame, highlightthickness=0); canvas.pack(side="left", fill="both", expand=True)
-        scrollbar = tk.Scrollbar(outer_frame, orient="vertical", command=canvas.yview); scrollbar.pack(side="right", fill="y")
-        canvas.configure(yscrollcommand=scrollbar.set)
-
-        scrollable_frame = tk.Frame(canvas)
-        window = canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
 
-        def on_frame_configure(event):
-            canvas.configure(scrollregion=canvas.bbox("all"))
-            canvas.itemconfig(window, width=event.width)
-        scrollable_frame.bind("<Configure>", on_frame_configure)
-        canvas.bind("<Configure>", on_frame_configure)
+        tk.Button(container, text="Graphics", command=lambda: (self._hide_popup(popup), self.open_graphics_popup())).pack(pady=10)
 
-        canvas.bind_all("<MouseWheel>", lambda e: canvas.yview_scroll(int(-1 * (e.delta / 120)), "units"))
-        canvas.bind_all("<Button-4>", lambda e: canvas.yview_scroll(-1, "units"))
-        canvas.bind_all("<Button-5>", lambda e: canvas.yview_scroll(1, "units"))
-        def drag_start(event): canvas.scan_mark(event.x, event.y)
-        def drag_motion(event): canvas.scan_dragto(event.x, event.y, gain=1)
-        scrollable_frame.bind("<ButtonPress-1>", drag_start)
-        scrollable_frame.bind("<B1-Motion>", drag_motion)
-        canvas.bind("<ButtonPress-1>", drag_start)
-        canvas.bind("<B1-Motion>", drag_motion)
+        return {"popup": popup, "canvas": canvas, "refresh": refresh}
 
-        # Content
-        container = tk.Frame(scrollable_frame)
-        container.pack(pady=40, padx=40, anchor="center")
+    def open_ph_settings_popup(self):
+        self._show_popup("sensor_D", self._build_ph_settings_popup)
 
+    def _build_ph_settings_popup(self):
         sensor_id = "D"
-        tk.Label(container, text="Settings for Sensor D", font=("Arial", 16, "bold")).pack(pady=10)
-
-        fw = getattr(self, "sensor_firmware", {}).get(sensor_id, "UNKNOWN")
-        tk.Label(
-            container,
-            text=f"Sensor Firmware: {fw}",
-            font=("Arial", 12, "bold"),
-            fg="red"
-        ).pack(pady=(0, 12))
-
-        # Sensor Connection (Serial vs Wi-Fi TCP)
-        conn_frame = tk.LabelFrame(container, text="Sensor Connection")
-        conn_frame.pack(fill="x", pady=(10, 6))
-
-        ep = getattr(self, "endpoints", {}).get(sensor_id, {"type": "serial", "host": "", "port": 8888})
-        conn_type_var = tk.StringVar(value=ep.get("type", "serial"))
-        ip_var = tk.StringVar(value=ep.get("host", ""))  # fixed 8888
+        popup, canvas, container = self._build_scroll_popup("Settings for Sensor D", pady=40)
 
-        def toggle_ip_state(*_):
-            state = tk.NORMAL if conn_type_var.get() == "tcp" else tk.DISABLED
-            ip_entry.config(state=state)
-
-        tk.Radiobutton(conn_frame, text="Serial USB", value="serial", variable=conn_type_var,
-                       command=toggle_ip_state).grid(row=0, column=0, padx=6, pady=4, sticky="w")
-        tk.Radiobutton(conn_frame, text="Wi-Fi TCP", value="tcp", variable=conn_type_var,
-                       command=toggle_ip_state).grid(row=0, column=1, padx=6, pady=4, sticky="w")
+        refresh_header = self._add_header(container, sensor_id, "Settings for Sensor D")
+        refresh_conn, save_conn = self._add_connection_section(container, sensor_id)
 
-        tk.Label(conn_frame, text="IP Address:").grid(row=1, column=0, sticky="e", padx=6)
-        ip_entry = tk.Entry(conn_frame, textvariable=ip_var, width=18)
-        ip_entry.grid(row=1, column=1, sticky="w", padx=6)
-
-        toggle_ip_state()
-
-        # Existing pH settings
-        settings = self.display_units.get(sensor_id, {})
-        use_fahrenheit_var = tk.BooleanVar(value=settings.get("use_fahrenheit", False))
+        # pH settings
+        use_fahrenheit_var = tk.BooleanVar(value=False)
         tk.Checkbutton(container, text="Show Temperature in °F", variable=use_fahrenheit_var).pack(pady=5)
 
-        enable_alarm_var = tk.BooleanVar(value=settings.get("ph_alarm_enabled", False))
+        enable_alarm_var = tk.BooleanVar(value=False)
         tk.Checkbutton(container, text="Enable pH Alarm", variable=enable_alarm_var,
                        command=lambda: toggle_fields(), font=("Arial", 12)).pack(pady=10)
 
         min_label = tk.Label(container, text="Minimum pH Level:"); min_label.pack()
-        min_ph_var = tk.StringVar(value=str(settings.get("ph_min", 0)))
+        min_ph_var = tk.StringVar()
         min_entry = tk.Entry(container, textvariable=min_ph_var); min_entry.pack()
 
         max_label = tk.Label(container, text="Maximum pH Level:"); max_label.pack()
-        max_ph_var = tk.StringVar(value=str(settings.get("ph_max", 0)))
+        max_ph_var = tk.StringVar()
         max_entry = tk.Entry(container, textvariable=max_ph_var); max_entry.pack()
 
         def toggle_fields():
             st = tk.NORMAL if enable_alarm_var.get() else tk.DISABLED
             for w in (min_label, min_entry, max_label, max_entry): w.config(state=st)
-        toggle_fields()
+
+        def refresh():
+            refresh_header()
+            refresh_conn()
+            settings = self.display_units.get(sensor_id, {})
+            use_fahrenheit_var.set(settings.get("use_fahrenheit", False))
+            enable_alarm_var.set(settings.get("ph_alarm_enabled", False))
+            min_ph_var.set(str(settings.get("ph_min", 0)))
+            max_ph_var.set(str(settings.get("ph_max", 0)))
+            toggle_fields()
+            self._refresh_reset_button(reset_button, sensor_id)
 
         def save_ph_settings():
             try:
+                settings = self.display_units.setdefault(sensor_id, {})
+
                 # persist connection choice (fixed 8888)
-                ct = conn_type_var.get()
-                host = ip_var.get().strip()
-                if ct == "tcp" and not host:
-                    raise ValueError("Please enter an IP address for Wi-Fi TCP.")
-                self.endpoints[sensor_id] = {"type": ct, "host": host, "port": 8888}
+                save_conn()
 
                 # existing pH settings save
                 if enable_alarm_var.get():
@@ -1699,10 +5364,6 @@ class SensorGUI:
 
                 settings["ph_alarm_enabled"] = enable_alarm_var.get()
                 settings["use_fahrenheit"] = use_fahrenheit_var.get()
-                
-                # If the alarm was just turned OFF, immediately normalize UI + sound/flash
-                if not settings["ph_alarm_enabled"]:
-                    self._set_alarm_state("ph_sensor", "normal", self.ph_level_frame["connection_status"])
 
                 # if alarm disabled, ensure UI not flashing
                 if not settings["ph_alarm_enabled"]:
@@ -1711,138 +5372,85 @@ class SensorGUI:
 
                 self.save_threshold_settings()
                 self.show_success_popup(f"Sensor {sensor_id} Updated")
-                popup.destroy()
+                self._hide_popup(popup)
             except Exception as e:
                 messagebox.showerror("Invalid Input", str(e))
 
         tk.Button(container, text="Submit", command=save_ph_settings).pack(pady=20)
-        tk.Button(
+        reset_button = tk.Button(
             container,
             text="Reset Sensor",
-            state=tk.NORMAL if self.sensors.get(sensor_id, {}).get("is_running") else tk.DISABLED,
-            command=lambda: (self.reset_sensor(sensor_id), popup.destroy())
-        ).pack(pady=10)
-        tk.Button(container, text="Graphics", command=lambda: (popup.destroy(), self.open_graphics_popup())).pack(pady=10)
-
-        if self.visual_settings.get("dark_mode"):
-            self.apply_theme(popup)
-                      
-    def open_tds_settings_popup(self):
-        popup = tk.Toplevel(self.root)
-        popup.title("Settings for Sensor E")
-        popup.attributes("-fullscreen", True)
-        popup.transient(self.root)
-        popup.grab_set()
-        popup.focus_set()
-        popup.lift()
-        popup.attributes('-topmost', True)
-        popup.bind("<Double-Button-1>", lambda event: popup.attributes("-fullscreen", not popup.attributes("-fullscreen")))
-
-        # Scrollable layout
-        outer_frame = tk.Frame(popup); outer_frame.pack(fill="both", expand=True)
-        canvas = tk.Canvas(outer_frame, highlightthickness=0); canvas.pack(side="left", fill="both", expand=True)
-        scrollbar = tk.Scrollbar(outer_frame, orient="vertical", command=canvas.yview); scrollbar.pack(side="right", fill="y")
-        canvas.configure(yscrollcommand=scrollbar.set)
-
-        scrollable_frame = tk.Frame(canvas)
-        window = canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-
-        def on_frame_configure(event):
-            canvas.configure(scrollregion=canvas.bbox("all"))
-            canvas.itemconfig(window, width=event.width)
-        scrollable_frame.bind("<Configure>", on_frame_configure)
-        canvas.bind("<Configure>", on_frame_configure)
+            command=lambda: (self.reset_sensor(sensor_id), self._hide_popup(popup))
+        )
+        reset_button.pack(pady=10)
+        tk.Button(container, text="Graphics", command=lambda: (self._hide_popup(popup), self.open_graphics_popup())).pack(pady=10)
 
-        canvas.bind_all("<MouseWheel>", lambda e: canvas.yview_scroll(int(-1 * (e.delta / 120)), "units"))
-        canvas.bind_all("<Button-4>", lambda e: canvas.yview_scroll(-1, "units"))
-        canvas.bind_all("<Button-5>", lambda e: canvas.yview_scroll(1, "units"))
-        def drag_start(event): canvas.scan_mark(event.x, event.y)
-        def drag_motion(event): canvas.scan_dragto(event.x, event.y, gain=1)
-        scrollable_frame.bind("<ButtonPress-1>", drag_start)
-        scrollable_frame.bind("<B1-Motion>", drag_motion)
-        canvas.bind("<ButtonPress-1>", drag_start)
-        canvas.bind("<B1-Motion>", drag_motion)
+        return {"popup": popup, "canvas": canvas, "refresh": refresh}
 
-        # Content
-        container = tk.Frame(scrollable_frame)
-        container.pack(pady=40, padx=40, anchor="center")
+    def open_tds_settings_popup(self):
+        self._show_popup("sensor_E", self._build_tds_settings_popup)
 
+    def _build_tds_settings_popup(self):
         sensor_id = "E"
-        tk.Label(container, text="Settings for Sensor E", font=("Arial", 16, "bold")).pack(pady=10)
-
-        fw = getattr(self, "sensor_firmware", {}).get(sensor_id, "UNKNOWN")
-        tk.Label(
-            container,
-            text=f"Sensor Firmware: {fw}",
-            font=("Arial", 12, "bold"),
-            fg="red"
-        ).pack(pady=(0, 12))
-
-        # Sensor Connection (Serial vs Wi-Fi TCP)
-        conn_frame = tk.LabelFrame(container, text="Sensor Connection")
-        conn_frame.pack(fill="x", pady=(10, 6))
-
-        ep = getattr(self, "endpoints", {}).get(sensor_id, {"type": "serial", "host": "", "port": 8888})
-        conn_type_var = tk.StringVar(value=ep.get("type", "serial"))
-        ip_var = tk.StringVar(value=ep.get("host", ""))  # fixed 8888
-
-        def toggle_ip_state(*_):
-            state = tk.NORMAL if conn_type_var.get() == "tcp" else tk.DISABLED
-            ip_entry.config(state=state)
-
-        tk.Radiobutton(conn_frame, text="Serial USB", value="serial", variable=conn_type_var,
-                       command=toggle_ip_state).grid(row=0, column=0, padx=6, pady=4, sticky="w")
-        tk.Radiobutton(conn_frame, text="Wi-Fi TCP", value="tcp", variable=conn_type_var,
-                       command=toggle_ip_state).grid(row=0, column=1, padx=6, pady=4, sticky="w")
+        popup, canvas, container = self._build_scroll_popup("Settings for Sensor E", pady=40)
 
-        tk.Label(conn_frame, text="IP Address:").grid(row=1, column=0, sticky="e", padx=6)
-        ip_entry = tk.Entry(conn_frame, textvariable=ip_var, width=18)
-        ip_entry.grid(row=1, column=1, sticky="w", padx=6)
-        toggle_ip_state()
+        refresh_header = self._add_header(container, sensor_id, "Settings for Sensor E")
+        refresh_conn, save_conn = self._add_connection_section(container, sensor_id)
 
-        settings = self.display_units.get(sensor_id, {})
-        use_fahrenheit_var = tk.BooleanVar(value=settings.get("use_fahrenheit", False))
+        use_fahrenheit_var = tk.BooleanVar(value=False)
         tk.Checkbutton(container, text="Show Temperature in °F", variable=use_fahrenheit_var).pack(pady=5)
 
-        enable_alarm_var = tk.BooleanVar(value=settings.get("tds_alarm_enabled", False))
+        enable_alarm_var = tk.BooleanVar(value=False)
         tk.Checkbutton(container, text="Enable TDS Alarm", variable=enable_alarm_var,
                        command=lambda: toggle_fields(), font=("Arial", 12)).pack(pady=10)
 
         min_label = tk.Label(container, text="Minimum TDS Level:"); min_label.pack()
-        min_tds_var = tk.StringVar(value=str(settings.get("tds_min", 0)))
+        min_tds_var = tk.StringVar()
         min_entry = tk.Entry(container, textvariable=min_tds_var); min_entry.pack()
 
         max_label = tk.Label(container, text="Maximum TDS Level:"); max_label.pack()
-        max_tds_var = tk.StringVar(value=str(settings.get("tds_max", 0)))
+        max_tds_var = tk.StringVar()
         max_entry = tk.Entry(container, textvariable=max_tds_var); max_entry.pack()
 
         def toggle_fields():
             st = tk.NORMAL if enable_alarm_var.get() else tk.DISABLED
             for w in (min_label, min_entry, max_label, max_entry): w.config(state=st)
-        toggle_fields()
 
         # Readings to show on the main tile (checkboxes)
         disp_grp = tk.LabelFrame(container, text="Readings to show on the main tile")
         disp_grp.pack(fill="x", padx=12, pady=10)
 
-        show_cfg = self.display_units.get("E", {}).get("show_fields", {})
-        tds_var   = tk.BooleanVar(value=show_cfg.get("tds_ppm", True))
-        uScm_var  = tk.BooleanVar(value=show_cfg.get("cond_uScm", False))
-        sal_var   = tk.BooleanVar(value=show_cfg.get("sal_psu", False))
+        tds_var   = tk.BooleanVar(value=True)
+        uScm_var  = tk.BooleanVar(value=False)
+        sal_var   = tk.BooleanVar(value=False)
 
         tk.Checkbutton(disp_grp, text="TDS (ppm)",            variable=tds_var).pack(anchor="w", padx=10, pady=3)
         tk.Checkbutton(disp_grp, text="Conductivity (µS/cm)", variable=uScm_var).pack(anchor="w", padx=10, pady=3)
         tk.Checkbutton(disp_grp, text="Salinity (PSU ≈ ppt)", variable=sal_var).pack(anchor="w", padx=10, pady=3)
 
+        def refresh():
+            refresh_header()
+            refresh_conn()
+            settings = self.display_units.get(sensor_id, {})
+            use_fahrenheit_var.set(settings.get("use_fahrenheit", False))
+            enable_alarm_var.set(settings.get("tds_alarm_enabled", False))
+            min_tds_var.set(str(settings.get("tds_min", 0)))
+            max_tds_var.set(str(settings.get("tds_max", 0)))
+            toggle_fields()
+
+            show_cfg = settings.get("show_fields", {})
+            tds_var.set(show_cfg.get("tds_ppm", True))
+            uScm_var.set(show_cfg.get("cond_uScm", False))
+            sal_var.set(show_cfg.get("sal_psu", False))
+            self._refresh_reset_button(reset_button, sensor_id)
+
         # Submit / Reset / Graphics
         def save_tds_settings():
             try:
+                settings = self.display_units.setdefault(sensor_id, {})
+
                 # persist connection choice (fixed port 8888)
-                ct = conn_type_var.get()
-                host = ip_var.get().strip()
-                if ct == "tcp" and not host:
-                    raise ValueError("Please enter an IP address for Wi-Fi TCP.")
-                self.endpoints[sensor_id] = {"type": ct, "host": host, "port": 8888}
+                save_conn()
 
                 # alarms & units
                 if enable_alarm_var.get():
@@ -1862,15 +5470,13 @@ class SensorGUI:
                 # if alarm is OFF, normalize UI immediately
                 if not settings["tds_alarm_enabled"]:
                     try:
-                        self._set_alarm_state("tds_sensor", "normal", self.tds_level_frame["connection_status"])
                         self.stop_flashing("TDS Sensor")
                         self.safe_gui_update(lambda: self.tds_level_frame["connection_status"].config(text="Connected", fg="green"))
                     except Exception:
                         pass
 
                 # visibility checkboxes: persist which readings to show on tile
-                du = self.display_units.setdefault("E", {})
-                du["show_fields"] = {
+                settings["show_fields"] = {
                     "tds_ppm":   bool(tds_var.get()),
                     "cond_uScm": bool(uScm_var.get()),
                     "sal_psu":   bool(sal_var.get()),
@@ -1888,7 +5494,7 @@ class SensorGUI:
                     pass
 
                 self.show_success_popup(f"Sensor {sensor_id} Updated")
-                popup.destroy()
+                self._hide_popup(popup)
 
             except ValueError as e:
                 messagebox.showerror("Invalid Input", str(e))
@@ -1896,77 +5502,38 @@ class SensorGUI:
                 messagebox.showerror("Error", f"Failed to save settings: {e}")
 
         tk.Button(container, text="Submit", command=save_tds_settings).pack(pady=20)
-        tk.Button(
+        reset_button = tk.Button(
             container,
             text="Reset Sensor",
-            state=tk.NORMAL if self.sensors.get(sensor_id, {}).get("is_running") else tk.DISABLED,
-            command=lambda: (self.reset_sensor(sensor_id), popup.destroy())
-        ).pack(pady=10)
-        tk.Button(container, text="Graphics", command=lambda: (popup.destroy(), self.open_graphics_popup())).pack(pady=10)
-
-        # Apply dark mode styling after successful build
-        if self.visual_settings.get("dark_mode"):
-            self.apply_theme(popup)
-        
-    def open_graphics_popup(self):
-        popup = tk.Toplevel(self.root)
-        popup.title("Graphics Settings")
-        popup.attributes("-fullscreen", True)
-        popup.transient(self.root)
-        popup.grab_set()
-        popup.focus_set()
-        popup.lift()
-        popup.attributes('-topmost', True)
-        popup.bind("<Double-Button-1>", lambda event: popup.attributes("-fullscreen", not popup.attributes("-fullscreen")))
-        dark_mode = self.visual_settings.get("dark_mode", False)
-
-        outer_frame = tk.Frame(popup)
-        outer_frame.pack(fill="both", expand=True)
-
-        canvas = tk.Canvas(outer_frame, highlightthickness=0)
-        canvas.pack(side="left", fill="both", expand=True)
-
-        scrollbar = tk.Scrollbar(outer_frame, orient="vertical", command=canvas.yview)
-        scrollbar.pack(side="right", fill="y")
-        canvas.configure(yscrollcommand=scrollbar.set)
-
-        scrollable_frame = tk.Frame(canvas)
-        canvas_window = canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-
-        def on_frame_configure(event):
-            canvas.configure(scrollregion=canvas.bbox("all"))
-            canvas.itemconfig(canvas_window, width=event.width)
-
-        scrollable_frame.bind("<Configure>", on_frame_configure)
-        canvas.bind("<Configure>", on_frame_configure)
+            command=lambda: (self.reset_sensor(sensor_id), self._hide_popup(popup))
+        )
+        reset_button.pack(pady=10)
+        tk.Button(container, text="Graphics", command=lambda: (self._hide_popup(popup), self.open_graphics_popup())).pack(pady=10)
 
-        canvas.bind_all("<MouseWheel>", lambda e: canvas.yview_scroll(int(-1 * (e.delta / 120)), "units"))
-        canvas.bind_all("<Button-4>", lambda e: canvas.yview_scroll(-1, "units"))
-        canvas.bind_all("<Button-5>", lambda e: canvas.yview_scroll(1, "units"))
+        return {"popup": popup, "canvas": canvas, "refresh": refresh}
 
-        def drag_start(event): canvas.scan_mark(event.x, event.y)
-        def drag_motion(event): canvas.scan_dragto(event.x, event.y, gain=1)
-        scrollable_frame.bind("<ButtonPress-1>", drag_start)
-        scrollable_frame.bind("<B1-Motion>", drag_motion)
-        canvas.bind("<ButtonPress-1>", drag_start)
-        canvas.bind("<B1-Motion>", drag_motion)
+    def open_graphics_popup(self):
+        self._show_popup("graphics", self._build_graphics_popup)
 
-        container = tk.Frame(scrollable_frame)
-        container.pack(pady=40, padx=40, anchor="center")
+    def _build_graphics_popup(self):
+        popup, canvas, container = self._build_scroll_popup("Graphics Settings", pady=40)
 
         tk.Label(container, text="Graphics Settings", font=("Arial", 18, "bold")).pack(pady=(10, 20))
 
-        self.dark_mode_var = tk.BooleanVar(value=self.visual_settings.get("dark_mode", False))
+        self.dark_mode_var = tk.BooleanVar(value=False)
         tk.Checkbutton(container, text="Enable Dark Mode", variable=self.dark_mode_var).pack(pady=5)
-
-        self.color_vars = {
-            "water": tk.StringVar(value=self.visual_settings.get("colors", {}).get("water", "#0000FF")),
-            "temp": tk.StringVar(value=self.visual_settings.get("colors", {}).get("temp", "#FF0000")),
-            "ph": tk.StringVar(value=self.visual_settings.get("colors", {}).get("ph", "#00FF00")),
-            "tds": tk.StringVar(value=self.visual_settings.get("colors", {}).get("tds", "#A52A2A")),
-            "cond": tk.StringVar(value=self.visual_settings.get("colors", {}).get("cond", "#00FF00")),
-            "sal": tk.StringVar(value=self.visual_settings.get("colors", {}).get("sal", "#FFA500")),
+        trends_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(container, text="Show 24 h Trends", variable=trends_var).pack(pady=5)
+
+        default_colors = {
+            "water": "#0000FF",
+            "temp": "#FF0000",
+            "ph": "#00FF00",
+            "tds": "#A52A2A",
+            "cond": "#00FF00",
+            "sal": "#FFA500",
         }
+        self.color_vars = {key: tk.StringVar(value=val) for key, val in default_colors.items()}
 
         palette_colors = [
             "#0000FF", "#00FFFF", "#00FF00", "#FFFF00",
@@ -1976,21 +5543,17 @@ class SensorGUI:
 
         button_refs = {"water": {}, "temp": {}, "ph": {}, "tds": {}, "cond": {}, "sal": {}}
 
-        def update_highlight(color_key):
-            selected = self.color_vars[color_key].get()
-            for color, btn in button_refs[color_key].items():
-                 btn.config(
-                    relief=tk.SUNKEN if color == selected else tk.RAISED,
-                    highlightthickness=3 if color == selected else 0
-                )
+        def update_highlight(c_key):
+            selected = self.color_vars[c_key].get()
+            for color, square in button_refs[c_key].items():
+                border_color = "red" if color == selected else ("white" if self.visual_settings.get("dark_mode") else "black")
+                square.configure(highlightbackground=border_color)
 
         def create_color_picker_section(label_text, color_key):
             tk.Label(container, text=label_text, font=("Arial", 12, "bold")).pack(pady=(20, 5))
             grid_frame = tk.Frame(container)
             grid_frame.pack(pady=4)
 
-            current_color = self.color_vars[color_key].get()
-
             def set_color(selected_color):
                 self.color_vars[color_key].set(selected_color)
                 update_highlight(color_key)
@@ -2013,26 +5576,18 @@ class SensorGUI:
 
                 square.bind("<Button-1>", make_click_handler())
 
-            def update_highlight(c_key):
-                selected = self.color_vars[c_key].get()
-                for color, square in button_refs[c_key].items():
-                    border_color = "red" if color == selected else ("white" if self.visual_settings.get("dark_mode") else "black")
-                    square.configure(highlightbackground=border_color)
-
-            update_highlight(color_key)
-
         create_color_picker_section("Water Reading Color", "water")
         create_color_picker_section("Temperature Reading Color", "temp")
         create_color_picker_section("pH Reading Color", "ph")
         create_color_picker_section("TDS Reading Color", "tds")
         create_color_picker_section("Conductivity Reading Color", "cond")
         create_color_picker_section("Salinity Reading Color", "sal")
-        
+
         # User Adjustable Frames
         layout_box = tk.LabelFrame(container, text="Frame Layout (Positions)")
         layout_box.pack(fill="x", padx=12, pady=(30, 10))
 
-        use_positions_var = tk.BooleanVar(value=getattr(self, "use_frame_positions", True))
+        use_positions_var = tk.BooleanVar(value=True)
         tk.Checkbutton(layout_box, text="Enable Custom Frame Layout", variable=use_positions_var).grid(
             row=0, column=0, columnspan=4, sticky="w", padx=10, pady=(8, 10)
         )
@@ -2047,12 +5602,11 @@ class SensorGUI:
         vis_vars = {}
         pos_vars = {}
         for i, name in enumerate(frame_names, start=1):
-            pos = self.frame_positions.get(name, {"row": 0, "col": 0})
-            r_var = tk.IntVar(value=int(pos.get("row", 0)))
-            c_var = tk.IntVar(value=int(pos.get("col", 0)))
+            r_var = tk.IntVar(value=0)
+            c_var = tk.IntVar(value=0)
             pos_vars[name] = (r_var, c_var)
-            
-            v_var = tk.BooleanVar(value=self.frame_visibility.get(name, True))
+
+            v_var = tk.BooleanVar(value=True)
             vis_vars[name] = v_var
 
             tk.Label(layout_box, text=name).grid(row=i, column=0, sticky="w", padx=10, pady=4)
@@ -2062,47 +5616,49 @@ class SensorGUI:
             tk.Spinbox(layout_box, from_=0, to=9, width=4, textvariable=c_var).grid(row=i, column=4, sticky="w", padx=(0, 10))
             tk.Checkbutton(layout_box, variable=v_var).grid(row=i, column=5, sticky="w", padx=(0, 10))
 
+        def refresh():
+            self.dark_mode_var.set(self.visual_settings.get("dark_mode", False))
+            trends_var.set(self.visual_settings.get("trends", True))
+            colors = self.visual_settings.get("colors", {})
+            for key, var in self.color_vars.items():
+                var.set(colors.get(key, default_colors[key]))
+                update_highlight(key)
+
+            use_positions_var.set(getattr(self, "use_frame_positions", True))
+            for name, (r_var, c_var) in pos_vars.items():
+                pos = self.frame_positions.get(name, {"row": 0, "col": 0})
+                r_var.set(int(pos.get("row", 0)))
+                c_var.set(int(pos.get("col", 0)))
+                vis_vars[name].set(self.frame_visibility.get(name, True))
+
         # BUTTON ROW
         buttons_frame = tk.Frame(container)
         buttons_frame.pack(pady=(30, 60), anchor="center")
 
+        def restore_defaults():
+            self.dark_mode_var.set(False)
+            trends_var.set(True)
+            for key, var in self.color_vars.items():
+                var.set(default_colors[key])
+                update_highlight(key)
+
         restore_btn = tk.Button(
             buttons_frame,
             text="Set Default",
             font=("Arial", 12, "bold"),
             width=9,
             height=1,
-            command=lambda: (
-                self.dark_mode_var.set(False),
-                self.color_vars["water"].set("#0000FF"),
-                self.color_vars["temp"].set("#FF0000"),
-                self.color_vars["ph"].set("#00FF00"),
-                self.color_vars["tds"].set("#A52A2A"),
-                self.color_vars["cond"].set("#00FF00"),
-                self.color_vars["sal"].set("#FFA500"),
-                update_highlight("water"),
-                update_highlight("temp"),
-                update_highlight("ph"),
-                update_highlight("tds"),
-                update_highlight("cond"),
-                update_highlight("sal")
-            )
+            command=restore_defaults
         )
         restore_btn.grid(row=0, column=0, padx=(0, 20))
 
         def apply_graphics_changes():
             self.visual_settings.update({
                 "dark_mode": self.dark_mode_var.get(),
-                "colors": {
-                    "water": self.color_vars["water"].get(),
-                    "temp": self.color_vars["temp"].get(),
-                    "ph": self.color_vars["ph"].get(),
-                    "tds": self.color_vars["tds"].get(),
-                    "cond": self.color_vars["cond"].get(),
-                    "sal": self.color_vars["sal"].get(),
-                }
+                "trends": trends_var.get(),
+                "colors": {key: var.get() for key, var in self.color_vars.items()},
             })
-            
+
             # Apply frame layout choices
             self.use_frame_positions = use_positions_var.get()
 
@@ -2114,7 +5670,7 @@ class SensorGUI:
                 self.frame_positions[name].setdefault("colspan", 1)
             for name, vvar in vis_vars.items():
                 self.frame_visibility[name] = bool(vvar.get())
-                
+
             self.save_threshold_settings()
             self.apply_theme()
             # Re-apply layout immediately so changes are visible
@@ -2126,7 +5682,7 @@ class SensorGUI:
             except Exception:
                 pass
 
-            popup.destroy()
+            self._hide_popup(popup)
 
         submit_btn = tk.Button(
             buttons_frame,
@@ -2138,7 +5694,7 @@ class SensorGUI:
         )
 
         submit_btn.grid(row=0, column=1)
-        
+
         # Check updates button
         update_btn = tk.Button(
             buttons_frame,
@@ -2152,16 +5708,63 @@ class SensorGUI:
         update_btn.grid(
             row=1,
             column=0,
-            columnspan=2,      
+            columnspan=2,
             padx=5,
             pady=(10, 0)
         )
 
-        self.apply_theme(popup)
-   
+        diag_btn = tk.Button(
+            buttons_frame,
+            text="Diagnostics",
+            font=("Arial", 12, "bold"),
+            width=19,
+            height=1,
+            command=lambda: (self._hide_popup(popup), self.open_diagnostics_popup())
+        )
+        diag_btn.grid(row=2, column=0, columnspan=2, padx=5, pady=(10, 0))
+
+        export_btn = tk.Button(
+            buttons_frame,
+            text="Export Data",
+            font=("Arial", 12, "bold"),
+            width=19,
+            height=1,
+            command=lambda: (self._hide_popup(popup), self.open_export_popup())
+        )
+        export_btn.grid(row=3, column=0, columnspan=2, padx=5, pady=(10, 0))
+
+        report_btn = tk.Button(
+            buttons_frame,
+            text="Daily Report",
+            font=("Arial", 12, "bold"),
+            width=19,
+            height=1,
+            command=lambda: (self._hide_popup(popup), self.open_report_popup())
+        )
+        report_btn.grid(row=4, column=0, columnspan=2, padx=5, pady=(10, 0))
+
+        return {"popup": popup, "canvas": canvas, "refresh": refresh}
+
+    def _register_theme_roles(self):
+        """Reading values and status text keep their own colours when the theme changes."""
+        accent_keys = ("connection_status", "pump_status", "auto_top_up_label", "water_gauge_label",
+                       "temperature_label", "ph_level_label", "tds_level_label",
+                       "cond_uScm_level_label", "sal_level_label")
+        for frame in (self.aquarium_frame_1, self.aquarium_frame_2, self.ro_tank_frame, self.ph_level_frame,
+                      self.tds_level_frame, self.pump_frame_a, self.pump_frame_b):
+            for key in accent_keys:
+                if frame.get(key) is not None:
+                    self.theme.set_role(frame[key], "accent")
+
     def apply_reading_colors(self):
         try:
             colors = self.visual_settings.get("colors", {})
+            # Only recolour when the colour choice or the palette actually changed
+            key = (tuple(sorted(colors.items())), self.theme.name,
+                   self.visual_settings.get("trends", True))
+            if key == getattr(self, "_reading_colors_key", None):
+                return
+            self._reading_colors_key = key
             water_color = colors.get("water", "#0000FF")
             temp_color = colors.get("temp", "#FF0000")
             ph_color = colors.get("ph", "#800080")
@@ -2191,6 +5794,8 @@ class SensorGUI:
             if "sal_level_label" in self.tds_level_frame:
                 self.tds_level_frame["sal_level_label"].config(fg=sal_color)
 
+            self.apply_trend_settings()
+
             for frame in [
                 self.aquarium_frame_1,
                 self.aquarium_frame_2,
@@ -2209,86 +5814,48 @@ class SensorGUI:
                         lbl.config(fg="red")
                     elif "connected" in status_text:
                         lbl.config(fg="green")
+                    elif "stale" in status_text:
+                        lbl.config(fg="orange")
                     else:
                         # fallback to theme text colour
-                        lbl.config(fg=self.text_color)
+                        lbl.config(fg=self.theme.palette["fg"])
 
                 except Exception:
                     pass
 
         except Exception as e:
-            print(f"[COLOR ERROR] Failed to apply updated colors: {e}")
+            log_ui.error("[COLOR ERROR] Failed to apply updated colors: %s", e)
        
+    def apply_trend_settings(self):
+        """Show/hide the tile trend lines and recolour them to match their readings."""
+        show = self.visual_settings.get("trends", True)
+        colors = self.visual_settings.get("colors", {})
+        for sid in self.TREND_METRICS:
+            trend = (self.get_sensor_frame_by_id(sid) or {}).get("trend")
+            if not trend:
+                continue
+            trend.set_color(colors.get(trend.color_key, "#0000FF"))
+            mapped = bool(trend.canvas.winfo_manager())
+            if show and not mapped:
+                trend.canvas.pack(side="bottom", pady=(6, 0))
+                trend.last_draw = 0.0
+            elif not show and mapped:
+                trend.canvas.pack_forget()
+
     def apply_theme(self, target=None):
+        """
+        Style target (or the main window and every popup) for the current
+        dark/light setting. Windows already in that palette are skipped.
+        """
         try:
-            dark = self.visual_settings.get("dark_mode", False)
-
-            bg = "#2E2E2E" if dark else "#F0F0F0"
-            fg = "#FFFFFF" if dark else "black"
-            entry_bg = "#3C3C3C" if dark else "white"
-            entry_fg = "#FFFFFF" if dark else "black"
-
-            def style_widget(w):
-                try:
-                    wtype = w.winfo_class()
-
-                    if wtype in ["Frame", "LabelFrame"]:
-                        w.configure(bg=bg)
-                    elif wtype == "Canvas":
-                        w.configure(bg=bg)
-                    elif wtype == "Label":
-                        w.configure(bg=bg, fg=fg)
-                    elif wtype == "Button":
-                        w.configure(
-                            bg=bg,
-                            fg=fg,
-                            activebackground=bg,
-                            activeforeground=fg,
-                            relief=tk.RAISED,
-                            highlightthickness=0,
-                            borderwidth=2
-                        )
-                    elif wtype == "Checkbutton":
-                        w.configure(
-                            bg=bg,
-                            fg=fg,
-                            activebackground=bg,
-                            activeforeground=fg,
-                            selectcolor=bg
-                        )
-                    elif wtype == "Radiobutton":
-                        w.configure(
-                            bg=bg, fg=fg,
-                            activebackground=bg, activeforeground=fg,
-                            selectcolor=bg,        
-                            highlightthickness=0   
-                        )
-                    elif wtype == "Entry":
-                        w.configure(bg=entry_bg, fg=entry_fg, insertbackground=fg)
-                    elif wtype == "Scrollbar":
-                        w.configure(bg=bg)
-                    elif wtype == "Labelframe" or wtype == "LabelFrame":
-                        w.configure(bg=bg, fg=fg)
-                       
-                except Exception as e:
-                    print(f"[THEME ERROR] {w.winfo_class()}: {e}")
-
-                for child in w.winfo_children():
-                    style_widget(child)
-
-            targets = [target] if target else [self.root] + self.root.winfo_children()
-            for win in targets:
-                try:
-                    win.configure(bg=bg)
-                    style_widget(win)
-                except Exception as e:
-                    print(f"[WINDOW ERROR] {e}")
-            self.update_all_pump_status_colors()
+            self.theme.select(self.visual_settings.get("dark_mode", False))
+            count = self.theme.style(target if target is not None else self.root)
             self.apply_reading_colors()
-            print(f"[THEME] {'Dark' if dark else 'Light'} mode applied.")
+            if count:
+                log_ui.info("[THEME] %s mode applied (%s widgets).", self.theme.name.capitalize(), count)
         except Exception as e:
-            print(f"[THEME ERROR] {e}")
-    
+            log_ui.error("[THEME ERROR] %s", e)
+
     def show_success_popup(self, message):
         """Show a themed 'Success' popup depending on dark mode setting."""
         if self.visual_settings.get("dark_mode", False):
@@ -2336,14 +5903,8 @@ class SensorGUI:
         else:
             messagebox.showinfo("Success", message)
            
-    def update_all_pump_status_colors(self):
-        for pump_name, frame in [("RO Pump A", self.pump_frame_a), ("RO Pump B", self.pump_frame_b)]:
-            state = self.pump_states.get(pump_name, False)
-            label = frame["pump_status"]
-            label.config(fg="green" if state else "red")
-
     def connect_to_sensors(self):
-        print("Connecting to sensors (TCP first, then serial fallback)…")
+        log_sensors.info("Connecting to sensors (TCP first, then serial fallback)…")
         connected_any = False
         need_serial = set(self.sensors.keys())  # A/B/C/D&E
 
@@ -2356,15 +5917,15 @@ class SensorGUI:
             host = (ep.get("host") or "").strip()
             port = int(ep.get("port", 8888))
             if not host:
-                 print(f"[TCP] Sensor {sid}: host not set; skipping.")
+                 log_sensors.warning("[TCP] Sensor %s: host not set; skipping.", sid)
                  continue
             try:
-                print(f"[TCP] Connecting {sid} at {host}:{port} …")
+                log_sensors.debug("[TCP] Connecting %s at %s:%s …", sid, host, port)
                 t = TransportTCP(host, port, timeout=2.0)
                 t.open()
                 t.write("RX800\n")
                 got = t.readline().strip()
-                print(f"[TCP] {sid} ID reply: {got}")
+                log_sensors.debug("[TCP] %s ID reply: %s", sid, got)
                 if got != sid:
                     raise IOError(f"ID mismatch (expected {sid}, got {got!r})")
                 
@@ -2387,14 +5948,14 @@ class SensorGUI:
                     raise IOError("no data on probe")
                 self.sensors[sid]["port"] = t
                 self.sensors[sid]["is_running"] = True
+                self.journal.record("sensor", sid, "connected", transport="tcp", host=host)
                 self.update_sensor_firmware(sid)
                 connected_any = True
                 threading.Thread(target=self.read_sensor_data, args=(sid,), daemon=True).start()
-                self.setup_sensor_ui(self.get_sensor_frame_by_id(sid), t)
-                print(f"[TCP] Sensor {sid} connected.")
+                log_sensors.info("[TCP] Sensor %s connected.", sid)
                 need_serial.discard(sid)
             except Exception as e:
-                print(f"[TCP] Sensor {sid} error: {e}")
+                log_sensors.warning("[TCP] Sensor %s error: %s", sid, e)
 
         # Serial fallback for remaining
         if not need_serial:
@@ -2402,7 +5963,7 @@ class SensorGUI:
 
         ports = list(serial.tools.list_ports.comports())
            
-        print("Scanning COM ports for:", sorted(need_serial))
+        log_sensors.info("[SER] Scanning COM ports for: %s", sorted(need_serial))
         for p in ports:
             try:
                 ser = serial.Serial(p.device, baudrate=9600, timeout=2)
@@ -2410,7 +5971,7 @@ class SensorGUI:
                 ts.open()
                 ts.write("RX800\n")
                 sid = ts.readline()
-                print(f"[SER] {p.device} -> {sid}")
+                log_sensors.debug("[SER] %s -> %s", p.device, sid)
                 if sid in need_serial:
                     probe_commands = {
                         "A": "RX203\n",
@@ -2431,13 +5992,13 @@ class SensorGUI:
                         ts.close(); continue
                     self.sensors[sid]["port"] = ts
                     self.sensors[sid]["is_running"] = True
+                    self.journal.record("sensor", sid, "connected", transport="serial", device=p.device)
                     connected_any = True
                     threading.Thread(target=self.read_sensor_data, args=(sid,), daemon=True).start()
-                    self.setup_sensor_ui(self.get_sensor_frame_by_id(sid), ts)
-                    print(f"[SER] Sensor {sid} connected on {p.device}")
+                    log_sensors.info("[SER] Sensor %s connected on %s", sid, p.device)
                     need_serial.discard(sid)
             except Exception as e:
-                print(f"[SER] {p.device} - {e}")
+                log_sensors.debug("[SER] %s - %s", p.device, e)
                
     def is_valid_response(self, response: str) -> bool:
         if response is None:
@@ -2455,12 +6016,25 @@ class SensorGUI:
 
         return response.replace(".", "", 1).isdigit()
 
-    def setup_sensor_ui(self, frame, serial_port):
-        def update_ui():
-            frame["connection_status"].config(text="Connected", fg="green")
-        self.root.after(0, update_ui)  
-   
-    def set_sensor_disconnected(self, frame, sensor_id=None):
+    def set_sensor_disconnected(self, sensor_id):
+        """Mark a sensor disconnected in the table (its tile follows) and drop its alarms."""
+        if sensor_id in ReadingsTable.SENSORS:
+            self.readings.publish(sensor_id, connected=0.0)
+
+        # Stop any alarms/sounds tied to this sensor
+        try:
+            self.clear_alarms(sensor_id)
+        except Exception as _e:
+            log_alarms.warning("[ALARM STOP] on disconnect: %s", _e)
+
+        # Always ensure sound state is reset (no overlapping playback)
+        try:
+            self._reset_alarm_sound_state()
+        except Exception as _e:
+            log_alarms.warning("[SOUND RESET] on disconnect: %s", _e)
+
+    def _show_disconnected(self, sensor_id, frame):
+        self.blink.stop(sensor_id)
         try:
             # Status
             frame["connection_status"].config(text="Disconnected", fg="red")
@@ -2475,36 +6049,12 @@ class SensorGUI:
             if "tds_level_label" in frame and frame["tds_level_label"]:
                 frame["tds_level_label"].config(text="TDS: --")
 
-            # Stop any flashing/sounds tied to this sensor
-            try:
-                if sensor_id == "C":
-                    # RO tank alarm visuals/sound
-                    self.stop_alarm_flash("ro_tank")
-                elif sensor_id == "D":
-                    # pH alarm visuals/sound
-                    self.stop_alarm_flash("ph_sensor")
-                elif sensor_id == "E":
-                    # TDS alarm visuals/sound
-                    self.stop_alarm_flash("tds_sensor")
-                else:
-                    # A/B don't use those keys, but ensure visuals are sane
-                    pass
-            except Exception as _e:
-                print("[ALARM STOP] on disconnect:", _e)
-
-            # Always ensure sound state is reset (no overlapping playback)
-            try:
-                if hasattr(self, "_reset_alarm_sound_state"):
-                    self._reset_alarm_sound_state()
-            except Exception as _e:
-                print("[SOUND RESET] on disconnect:", _e)
-
             # Disable reset button if you have it
             if "reset_button" in frame and frame["reset_button"]:
                 frame["reset_button"].config(state=tk.DISABLED)
 
         except Exception as e:
-            print(f"[UI ERROR] Failed to update disconnected status: {e}")
+            log_ui.error("[UI ERROR] Failed to update disconnected status: %s", e)
 
     # Sensor Serial & TCP RX & TX Locking 
     def _query_sensor(self, sensor_id: str, cmd: str, timeout: float = 3.0) -> str:
@@ -2517,7 +6067,9 @@ class SensorGUI:
             return ""
 
         line = cmd if cmd.endswith("\n") else (cmd + "\n")
+        kind = "tcp" if hasattr(t, "sock") else "serial"
         with self.io_locks[sensor_id]:
+            t0 = time.monotonic()
             try:
                 if hasattr(t, "sock"):
                     try:
@@ -2534,8 +6086,9 @@ class SensorGUI:
                     try: t.write(line)
                     except TypeError: t.write(line.encode())
 
-                    resp = t.readline()
-                    return (resp or "").strip()
+                    resp = (t.readline() or "").strip()
+                    self._record_transport(sensor_id, cmd, kind, t0, resp, timeout)
+                    return resp
 
                 else:
                     try: t.write(line)                
@@ -2549,11 +6102,57 @@ class SensorGUI:
                     resp = t.readline()
                     if isinstance(resp, bytes):
                         resp = resp.decode(errors="ignore")
-                    return (resp or "").strip()
+                    resp = (resp or "").strip()
+                    self._record_transport(sensor_id, cmd, kind, t0, resp, timeout)
+                    return resp
 
             except Exception as e:
-                print(f"[QUERY ERR] {sensor_id} {cmd}: {e}")
+                self._record_transport(sensor_id, cmd, kind, t0, "", timeout)
+                log_sensors.warning("[QUERY ERR] %s %s: %s", sensor_id, cmd, e)
                 return ""
+
+    def _record_transport(self, sensor_id, cmd, kind, t0, resp, timeout):
+        elapsed = time.monotonic() - t0
+        self.transport_stats.record(sensor_id, cmd.strip(), kind, elapsed,
+                                    TransportStats.classify(resp, elapsed, timeout))
+    def fetch_sensor_log(self, sensor_id: str, max_lines: int = 200, timeout: float = 3.0):
+        """
+        Read the sensor firmware's in-RAM log (RX249): one entry per line,
+        terminated by END. Returns the lines (oldest first); [] if unsupported.
+        """
+        t = self.sensors.get(sensor_id, {}).get("port")
+        if not t:
+            return []
+        lines = []
+        with self.io_locks[sensor_id]:
+            try:
+                t.write("RX249\n")
+                end = time.time() + timeout
+                done = False
+                while len(lines) < max_lines and time.time() < end:
+                    resp = t.readline()
+                    if isinstance(resp, bytes):
+                        resp = resp.decode(errors="ignore")
+                    resp = (resp or "").strip()
+                    if not resp or resp == "END":
+                        done = True
+                        break
+                    if resp == "?":   # older firmware without a log ring
+                        return []
+                    lines.append(resp)
+                # Cut short by max_lines/timeout: pull the rest of the dump off
+                # the wire so it doesn't land in the next RX reply on this port
+                end = time.time() + timeout
+                while not done and time.time() < end:
+                    resp = t.readline()
+                    if isinstance(resp, bytes):
+                        resp = resp.decode(errors="ignore")
+                    resp = (resp or "").strip()
+                    done = not resp or resp == "END"
+            except Exception as e:
+                log_sensors.warning("[SENSOR LOG] %s: %s", sensor_id, e)
+        return lines
+
     # Update Sensor Firmware Settings Menu Display    
     def update_sensor_firmware(self, sensor_id: str):
         """
@@ -2573,10 +6172,10 @@ class SensorGUI:
 
             if r:
                 self.sensor_firmware[sensor_id] = r
-                print(f"[FW] Sensor {sensor_id}: {r}")
+                log_sensors.info("[FW] Sensor %s: %s", sensor_id, r)
 
         except Exception as e:
-            print(f"[FW] Sensor {sensor_id} read failed: {e}")
+            log_sensors.warning("[FW] Sensor %s read failed: %s", sensor_id, e)
 
     def tare_sensor(self, sensor_id: str, parent_popup=None):
         # Themed confirm
@@ -2589,35 +6188,208 @@ class SensorGUI:
         if not proceed:
             return
 
-        # Read current level...
+        if not self._tare_now(sensor_id):
+            from tkinter import messagebox
+            messagebox.showerror("Tare Failed", f"Could not read a valid level from Sensor {sensor_id}.")
+            return
+
+        # Close the settings popup that launched us
+        if parent_popup and parent_popup.winfo_exists():
+            self._hide_popup(parent_popup)
+
+        # Your existing themed success toast is fine here
+        self.show_success_popup(f"Sensor {sensor_id} tared to 0 mmWG.")
+  
+    def _tare_now(self, sensor_id: str) -> bool:
+        """Zero a level sensor at its current reading (no prompts). Any thread."""
+        if not self.acquires:
+            # The acquisition process holds the session; it also saves the offset
+            try:
+                reply = ipc_request({"cmd": "tare", "sensor": sensor_id}, timeout=10.0)
+            except Exception as e:
+                log_sensors.warning("[TARE] Sensor %s: %s", sensor_id, e)
+                return False
+            if not reply.get("ok"):
+                return False
+            self.tare_offsets[sensor_id] = reply["offset"]
+            self._rendered_counts.pop(sensor_id, None)
+            return True
         try:
             resp = self._query_sensor(sensor_id, "RX203", timeout=3.0)
             wl = float(str(resp).replace("mmWG","").replace("mBar","").strip())
         except Exception:
-            from tkinter import messagebox
-            messagebox.showerror("Tare Failed", f"Could not read a valid level from Sensor {sensor_id}.")
-            return
+            return False
 
         # Save offset so (raw + offset) == 0
         if not hasattr(self, "tare_offsets"):
             self.tare_offsets = {"A": 0.0, "B": 0.0, "C": 0.0}
         self.tare_offsets[sensor_id] = -wl
-        self.save_threshold_settings()
-
-        # Refresh GUI label
-        frame = self.get_sensor_frame_by_id(sensor_id)
-        try:
-            self.update_water_level_label(frame, resp)
-        except Exception:
-            pass
-
-        # Close the settings popup that launched us
-        if parent_popup and parent_popup.winfo_exists():
-            parent_popup.destroy()
+        self._call_ui(self.save_threshold_settings)
+
+        # Redraw the tile with the new offset on the next render pass
+        self._rendered_counts.pop(sensor_id, None)
+        return True
+
+    def _run_on_ui(self, func, timeout=5.0):
+        """Run func on the Tk thread and wait for its result (for worker threads)."""
+        if threading.current_thread() is threading.main_thread():
+            return func()
+        done = threading.Event()
+        box = {}
+        def _wrapped():
+            try:
+                box["value"] = func()
+            except Exception as e:
+                box["error"] = e
+            finally:
+                done.set()
+        self.safe_gui_update(_wrapped)
+        if not done.wait(timeout):
+            raise TimeoutError("GUI did not respond")
+        if "error" in box:
+            raise box["error"]
+        return box.get("value")
+
+    def _handle_ipc_command(self, msg):
+        """
+        Commands from the local IPC socket. Runs on the client's thread.
+          {"cmd": "snapshot"}
+          {"cmd": "tare",  "sensor": "A"|"B"|"C"}
+          {"cmd": "pump",  "pump": "RO Pump A"|"RO Pump B", "state": "on"|"off"|"auto"|"manual"|"toggle"}
+          {"cmd": "reset", "sensor": "A".."E"}
+          {"cmd": "profile", "seconds": 30, "memory": false}
+          {"cmd": "sensor_log", "sensor": "A".."E"}
+          {"cmd": "transport_stats", "reset": false}
+          {"cmd": "rates"}
+          {"cmd": "status"}       firmware, rates, counters, loop report (the GUI's popups)
+          {"cmd": "flush"}        history buffers to disk, before reading the files
+          {"cmd": "shutdown"}     acquisition process only: pumps off, history flushed, exit
+          {"cmd": "events", "kind": "pump", "entity": "RO Pump A", "seconds": 86400, "limit": 100}
+          {"cmd": "history", "sensor": "A".."E", "metric": "level", "seconds": 3600,
+           "tier": "raw"|"1m"|"1h"|"1d" (optional, default raw)}
+        """
+        cmd = str(msg.get("cmd", "")).lower()
+
+        if cmd == "snapshot":
+            return {"ok": True, "cmd": cmd, "data": self.readings.snapshot()}
+
+        if cmd == "tare":
+            sid = str(msg.get("sensor", "")).upper()
+            if sid not in ("A", "B", "C"):
+                return {"ok": False, "cmd": cmd, "error": "tare needs sensor A, B or C"}
+            if not self.sensors.get(sid, {}).get("is_running"):
+                return {"ok": False, "cmd": cmd, "error": f"sensor {sid} not connected"}
+            ok = self._tare_now(sid)
+            log_ipc.info("[IPC] Tare sensor %s: %s", sid, 'ok' if ok else 'failed')
+            return {"ok": ok, "cmd": cmd, "sensor": sid,
+                    "offset": self.tare_offsets.get(sid) if ok else None}
+
+        if cmd == "pump":
+            name = str(msg.get("pump", ""))
+            state = str(msg.get("state", "")).lower()
+            if name not in self.pump_gpio or state not in ("on", "off", "auto", "manual", "toggle"):
+                return {"ok": False, "cmd": cmd,
+                        "error": "pump needs pump='RO Pump A|B' and state on|off|auto|manual|toggle"}
+
+            if state in ("auto", "manual"):
+                self.set_auto_mode(name, state == "auto")
+            elif state == "toggle":
+                # The tile button of a display process
+                self.toggle_pump(name)
+            else:
+                # Manual override: same as using the tile, auto mode off
+                self.set_auto_mode(name, False)
+                self.toggle_pump(name, force_state=(state == "on"), suppress_auto_disable=True, cause="ipc")
+            log_ipc.info("[IPC] Pump override %s -> %s", name, state)
+            return {"ok": True, "cmd": cmd, "pump": name, "state": state}
+
+        if cmd == "reset":
+            sid = str(msg.get("sensor", "")).upper()
+            t = self.sensors.get(sid, {}).get("port")
+            if not t:
+                return {"ok": False, "cmd": cmd, "error": f"sensor {sid} not connected"}
+            with self.io_locks[sid]:
+                t.write("r\n")
+            log_ipc.info("[IPC] Reset sent to sensor %s", sid)
+            return {"ok": True, "cmd": cmd, "sensor": sid}
+
+        if cmd == "history":
+            sid = str(msg.get("sensor", "")).upper()
+            metric = str(msg.get("metric", ""))
+            try:
+                seconds = float(msg.get("seconds", 3600))
+            except (TypeError, ValueError):
+                return {"ok": False, "cmd": cmd, "error": "seconds must be a number"}
+            tier = str(msg.get("tier", "raw"))
+            if tier in ("1m", "1h", "1d"):
+                if self.store is None:
+                    return {"ok": False, "cmd": cmd, "error": "history store disabled"}
+                rows = self.store.rollups(sid, metric, tier, time.time() - seconds)
+                return {"ok": True, "cmd": cmd, "sensor": sid, "metric": metric, "tier": tier,
+                        "columns": ["start", "min", "max", "mean", "count"], "rows": rows}
+            ts, vals = self.history_window(sid, metric, time.time() - seconds)
+            return {"ok": True, "cmd": cmd, "sensor": sid, "metric": metric,
+                    "ts": ts.tolist(), "values": vals.tolist()}
+
+        if cmd == "events":
+            try:
+                seconds = msg.get("seconds")
+                start = time.time() - float(seconds) if seconds is not None else None
+                rows = self.journal.query(kind=msg.get("kind"), entity=msg.get("entity"), value=msg.get("value"),
+                                          start=start, limit=int(msg.get("limit", 100)))
+            except (TypeError, ValueError) as e:
+                return {"ok": False, "cmd": cmd, "error": str(e)}
+            return {"ok": True, "cmd": cmd, "events": rows}
+
+        if cmd == "transport_stats":
+            if msg.get("reset"):
+                self.transport_stats.reset()
+            return {"ok": True, "cmd": cmd, "data": self.transport_stats.stats()}
+
+        if cmd == "status":
+            return {"ok": True, "cmd": cmd, "pid": os.getpid(), "role": self.role,
+                    "firmware": self.sensor_firmware,
+                    "running": {sid: bool(s.get("is_running")) for sid, s in self.sensors.items()},
+                    "rates": {sid: self.level_rate(sid) for sid in self.level_rates},
+                    "transport": self.transport_stats.stats(),
+                    "loop": self.loop_monitor.report()}
+
+        if cmd == "flush":
+            if self.store is None:
+                return {"ok": False, "cmd": cmd, "error": "history store disabled"}
+            self.store.flush()
+            return {"ok": True, "cmd": cmd}
+
+        if cmd == "shutdown":
+            if self.role != "acquire":
+                return {"ok": False, "cmd": cmd, "error": "only the acquisition process stops over IPC"}
+            log_ipc.info("[IPC] Shutdown requested")
+            self.safe_gui_update(self.root.quit)
+            return {"ok": True, "cmd": cmd}
+
+        if cmd == "rates":
+            return {"ok": True, "cmd": cmd, "data": {sid: self.level_rate(sid) for sid in self.level_rates}}
+
+        if cmd == "sensor_log":
+            sid = str(msg.get("sensor", "")).upper()
+            if not self.sensors.get(sid, {}).get("is_running"):
+                return {"ok": False, "cmd": cmd, "error": f"sensor {sid} not connected"}
+            return {"ok": True, "cmd": cmd, "sensor": sid, "lines": self.fetch_sensor_log(sid)}
+
+        if cmd == "profile":
+            try:
+                seconds = max(1.0, min(600.0, float(msg.get("seconds", 30))))
+            except (TypeError, ValueError):
+                return {"ok": False, "cmd": cmd, "error": "seconds must be a number"}
+            memory = bool(msg.get("memory", False))
+            started = self._run_on_ui(lambda: self.start_profiling(seconds, memory))
+            if not started:
+                return {"ok": False, "cmd": cmd, "error": "profiling already running or failed to start"}
+            return {"ok": True, "cmd": cmd, "seconds": seconds, "memory": memory,
+                    "dir": os.path.dirname(os.path.abspath(SETTINGS_PATH))}
+
+        return {"ok": False, "cmd": cmd, "error": "unknown command"}
 
-        # Your existing themed success toast is fine here
-        self.show_success_popup(f"Sensor {sensor_id} tared to 0 mmWG.")
-  
     def read_sensor_data(self, sensor_id):
         """
         Continuous poll loop with buffer DRains before/after each command to stop
@@ -2688,48 +6460,39 @@ class SensorGUI:
                 return ""
 
         def _txrx(port, cmd: str, settle: float = 0.0, timeout_s=2.5) -> str:
-            # Drain any leftover bytes from previous command(s)
-            _drain(port)
-            _send(port, cmd)
-            if settle > 0:
-                time.sleep(settle)
-            val = _read(port, timeout_s=timeout_s)
-            # Drain anything coalesced after the newline (second line in same packet)
-            _drain(port)
-            return val
-
+            # Same lock as _query_sensor / fetch_sensor_log so their replies can't interleave
+            with self.io_locks[sensor_id]:
+                # Drain any leftover bytes from previous command(s)
+                _drain(port)
+                t0 = time.monotonic()
+                _send(port, cmd)
+                if settle > 0:
+                    time.sleep(settle)
+                val = _read(port, timeout_s=timeout_s)
+                self._record_transport(sensor_id, cmd, "tcp" if hasattr(port, "sock") else "serial",
+                                       t0 + settle, val, timeout_s)
+                # Drain anything coalesced after the newline (second line in same packet)
+                _drain(port)
+                return val
+
+        session_port = self.sensors.get(sensor_id, {}).get("port")
         while self.sensors.get(sensor_id, {}).get("is_running", False):
+            self.loop_monitor.checkpoint(f"poll-{sensor_id}")
             try:
                 port = self.sensors.get(sensor_id, {}).get("port")
-                if not port:
-                    break
+                if not port or port is not session_port:
+                    break   # session closed or replaced by a reconnect
 
-                if sensor_id == "A":
+                if sensor_id in ("A", "B"):
                     # Temp then Level
                     temperature = _txrx(port, "RX201", settle=0.10, timeout_s=3.0)
                     water_level = _txrx(port, "RX203", settle=0.00, timeout_s=3.0)
 
-                    self.safe_gui_update(lambda: self.update_sensor_ui(
-                        self.aquarium_frame_1, temperature, water_level, None, None, None
-                    ))
-
-                    try:
-                        wl = float(str(water_level).replace("mmWG","").replace("mBar","").strip())
-                        self.control_pumps("A", self.tared_mmwg("A", wl))
-                    except Exception:
-                        pass
+                    self._publish_reading(sensor_id, temperature=temperature, level=water_level)
 
-                elif sensor_id == "B":
-                    temperature = _txrx(port, "RX201", settle=0.10, timeout_s=3.0)
-                    water_level = _txrx(port, "RX203", settle=0.00, timeout_s=3.0)
-
-                    self.safe_gui_update(lambda: self.update_sensor_ui(
-                        self.aquarium_frame_2, temperature, water_level, None, None, None
-                    ))
- 
                     try:
                         wl = float(str(water_level).replace("mmWG","").replace("mBar","").strip())
-                        self.control_pumps("B", self.tared_mmwg("B", wl))
+                        self.control_pumps(sensor_id, self.tared_mmwg(sensor_id, wl))
                     except Exception:
                         pass
 
@@ -2744,27 +6507,15 @@ class SensorGUI:
 
                     water_level = _txrx(port, "RX203", settle=0.00, timeout_s=3.0)
 
-                    self.safe_gui_update(lambda: self.update_sensor_ui(
-                        self.ro_tank_frame, temperature, water_level, None, None, None
-                    ))
-
-                    try:
-                        wl_mmwg = float(str(water_level).replace("mmWG","").replace("mBar","").strip())
-                        self.check_ro_tank_alarm("C", self.tared_mmwg("C", wl_mmwg))
-                    except Exception:
-                        pass
+                    self._publish_reading("C", temperature=temperature, level=water_level)
 
                 elif sensor_id == "D":
                     # pH sensor: temp then pH (give pH a bit more time)
                     temperature = _txrx(port, "RX201", settle=0.20, timeout_s=3.0)
                     ph_level    = _txrx(port, "RX205", settle=0.00, timeout_s=4.0)
 
-                    self.safe_gui_update(lambda: self.update_sensor_ui(
-                        self.ph_level_frame, temperature, None, ph_level, None, None, None
-                    ))
-                    if ph_level:
-                        self.check_ph_alarm("D", ph_level)
-                        
+                    self._publish_reading("D", temperature=temperature, ph=ph_level)
+
                 elif sensor_id == "E":
                     # TDS sensor: temp then metrics
                     temperature      = _txrx(port, "RX201", settle=0.20, timeout_s=3.0)   # °C as string
@@ -2772,48 +6523,12 @@ class SensorGUI:
                     tds_level        = _txrx(port, "RX207", settle=0.00, timeout_s=4.0)   # ppm (string)
                     sal_level        = _txrx(port, "RX208", settle=0.00, timeout_s=4.0)   # PSU ≈ ppt (string)
 
-                    # Normalize text
-                    def good(x): return bool(x) and x not in ("ERR", "--")
-                    t_text   = f"{temperature} °C" if good(temperature) else "--"
-                    tds_text = f"{tds_level} ppm"  if good(tds_level)    else "--"
-                    cu_text  = f"{cond_uScm_level} µS/cm" if good(cond_uScm_level) else "--"
-                    s_text   = f"{sal_level} PSU"  if good(sal_level)    else "--"
-
-                    mode = self.display_units.get("E", {}).get("display_mode", "tds_ppm")
-
-                    def _apply():
-                        # connection + temp
-                        self.tds_level_frame["connection_status"].config(text="Connected", fg="green")
-                        self.tds_level_frame["temperature_label"].config(text=f"Temperature: {t_text}")
-
-                        # update all sublabels so user can switch mode and see something
-                        self.tds_level_frame["tds_level_label"].config(text=f"TDS: {tds_text}")
-                        self.tds_level_frame["cond_uScm_level_label"].config(text=f"Conductivity: {cu_text}")
-                        self.tds_level_frame["sal_level_label"].config(text=f"Salinity: {s_text}")
-
-                        # reset fonts
-                        base = ("Arial", 14, "bold")
-                        self.tds_level_frame["tds_level_label"].config(font=base)
-                        self.tds_level_frame["cond_uScm_level_label"].config(font=base)
-                        self.tds_level_frame["sal_level_label"].config(font=base)
-                        # make selected one a touch bigger
-                        bigger = ("Arial", 15, "bold")
-                        if   mode == "tds_ppm":  self.tds_level_frame["tds_level_label"].config(font=bigger)
-                        elif mode == "cond_uScm": self.tds_level_frame["cond_uScm_level_label"].config(font=bigger)
-                        elif mode == "sal_psu":   self.tds_level_frame["sal_level_label"].config(font=bigger)
-
-                    self.safe_gui_update(lambda: (
-                        # existing updates you already do…
-                       self.tds_level_frame["connection_status"].config(text="Connected", fg="green"),
-                       self.tds_level_frame["temperature_label"].config(text=f"Temperature: {t_text}"),
-                       self.tds_level_frame["tds_level_label"].config(text=f"TDS: {tds_text}"),
-                       self.tds_level_frame["cond_uScm_level_label"].config(text=f"Conductivity: {cu_text}"),
-                       self.tds_level_frame["sal_level_label"].config(text=f"Salinity: {s_text}"),
-                       self.safe_gui_update(self.layout_tds_tile)
-                    ))
+                    self._publish_reading("E", temperature=temperature, tds=tds_level,
+                                          cond=cond_uScm_level, sal=sal_level)
 
             except Exception as e:
-                print(f"[ERROR] read_sensor_data({sensor_id}): {e}")
+                log_sensors.error("[ERROR] read_sensor_data(%s): %s", sensor_id, e)
+                self.journal.record("sensor", sensor_id, "disconnected", error=str(e))
                 try:
                     self.sensors[sensor_id]["is_running"] = False
                 except Exception:
@@ -2822,8 +6537,736 @@ class SensorGUI:
 
             time.sleep(0.4)
 
+    def _publish_reading(self, sensor_id, **raw):
+        """
+        Store one poll cycle's raw replies in the readings table.
+        Blank / ERR / -- replies are stored as NaN ("no value this cycle").
+        """
+        values = {"connected": 1.0, "ts": time.time()}
+        for key, text in raw.items():
+            if text is None:
+                continue
+            s = str(text).replace("mmWG", "").replace("mBar", "")
+            v = self._num(s)
+            values[key] = float("nan") if v is None else v
+        self.readings.publish(sensor_id, **values)
+        for key in raw:
+            if key in values:
+                self.history.append(sensor_id, key, values["ts"], values[key])
+                if self.store:
+                    self.store.append(sensor_id, key, values["ts"], values[key])
+        readings = {k: values[k] for k in raw if k in values}
+        if "level" in readings:
+            readings["level"] = self.tared_mmwg(sensor_id, readings["level"])
+        self.alarms.update(sensor_id, readings, values["ts"])
+
+    def history_window(self, sid, metric, start, end=None):
+        """
+        Readings with start <= ts <= end: the in-memory ring where it reaches,
+        the on-disk store for anything older. Returns (ts, values) arrays ('d').
+        """
+        ts, vals = self.history.window(sid, metric, start, end)
+        if self.store is None or (ts and ts[0] <= start):
+            return ts, vals
+        cutoff = ts[0] if ts else end
+        old_ts, old_vals = self.store.window(sid, metric, start, cutoff)
+        n = bisect.bisect_left(old_ts, cutoff) if (ts and cutoff is not None) else len(old_ts)
+        return old_ts[:n] + ts, array.array("d", old_vals[:n]) + vals
+
+    def _render_tick(self):
+        """GUI frame: copy the readings table once and redraw only what changed."""
+        if self._display_blanked or not self._window_mapped:
+            if not self._render_paused:
+                self._render_paused = True
+                self.blink.pause()
+                log_ui.info("[DISPLAY] Not visible, rendering paused")
+            self.root.after(self.DISPLAY_IDLE_MS, self._render_tick)
+            return
+        if self._render_paused:
+            # Wake: redraw every tile in this one pass and restart the flashers
+            self._render_paused = False
+            self._rendered_counts.clear()
+            self.blink.resume()
+            log_ui.info("[DISPLAY] Visible again, rendering resumed")
+        try:
+            snap = self.readings.snapshot()
+            for sid, rec in snap["sensors"].items():
+                if rec["count"] == self._rendered_counts.get(sid):
+                    continue
+                self._rendered_counts[sid] = rec["count"]
+                self._render_status(sid, rec)
+                if rec["connected"]:
+                    self._render_sensor(sid, rec)
+                    if self._startup_trace["first_live_ms"] is None:
+                        self._startup_trace["first_live_ms"] = self._startup_ms()
+                        log.info("[STARTUP] First live reading (Sensor %s) after "
+                              "%s ms", sid, self._startup_trace['first_live_ms'])
+            for name, rec in snap["pumps"].items():
+                if rec["count"] == self._rendered_counts.get(name):
+                    continue
+                self._rendered_counts[name] = rec["count"]
+                self._render_pump(name, rec)
+        except Exception as e:
+            log_ui.warning("[RENDER] %s", e)
+        finally:
+            try:
+                self.root.after(self.RENDER_INTERVAL_MS, self._render_tick)
+            except Exception:
+                pass
+
+    ALARM_NAMES = {v: k for k, v in AlarmEngine.SEVERITY.items()}
+
+    def _render_status(self, sensor_id, rec):
+        """Status line of a sensor tile (Connected / Disconnected / alarm) from its table row."""
+        if not rec["count"]:
+            return      # nothing from this run yet: keep the warm-start "Stale" text
+        frame = self.get_sensor_frame_by_id(sensor_id)
+        if not frame:
+            return
+        connected = bool(rec["connected"])
+        alarm = rec.get("alarm")
+        state = self.ALARM_NAMES.get(int(alarm), "normal") if alarm == alarm else "normal"   # NaN: never raised
+        shown = (connected, state if connected else None)
+        if self._shown_status.get(sensor_id) == shown:
+            return
+        self._shown_status[sensor_id] = shown
+        if not connected:
+            self._show_disconnected(sensor_id, frame)
+            return
+        label = frame["connection_status"]
+        self.blink.stop(sensor_id)
+        if state == "normal":
+            label.config(text="Connected", fg="green")
+            return
+        text, base = ("APPROACHING LIMIT", "orange") if state == "approaching" else ("LEVEL CRITICAL", "red")
+        label.config(text=text)
+        self.start_alarm_flash(label, sensor_id, base)
+
+    def _render_pump(self, pump_name, rec):
+        """Pump tile from its table row: ON/OFF, Auto Mode and the notice line."""
+        frame = {"RO Pump A": self.pump_frame_a, "RO Pump B": self.pump_frame_b}.get(pump_name)
+        if not frame:
+            return
+        on = bool(rec["on"])
+        frame["pump_status"].config(text="ON" if on else "OFF", fg="green" if on else "red")
+        frame["toggle_button"].config(text="Override" if on else "Turn On")
+        auto = bool(rec["auto"])
+        if frame["auto_mode_var"].get() != auto:
+            self._syncing_auto = True
+            try:
+                frame["auto_mode_var"].set(auto)
+            finally:
+                self._syncing_auto = False
+
+        if rec["keepalive"]:
+            notice = "keepalive"
+        elif on and round(rec["cause"]) == PUMP_ON_CAUSE["auto"]:
+            notice = "auto"
+        elif not on and rec["safety"] and time.time() - rec["safety"] < self.SAFETY_NOTICE_S:
+            notice = "safety"
+        else:
+            notice = None
+        if notice == self._pump_notice.get(pump_name):
+            return
+        self._pump_notice[pump_name] = notice
+        label = frame["auto_top_up_label"]
+        if notice == "auto":
+            self.flash_auto_top_up(label, pump_name)
+            return
+        self.stop_flashing(pump_name)
+        if notice == "keepalive":
+            label.config(text="KEEP-ALIVE: cycling pump", fg="orange")
+        elif notice == "safety":
+            label.config(text="MAX LEVEL - SAFETY SHUTDOWN", fg="red")
+            # Redraw once the notice has had its time
+            self.root.after(int(self.SAFETY_NOTICE_S * 1000), lambda: self._rendered_counts.pop(pump_name, None))
+
+    def _log_loop_stats(self):
+        try:
+            log_diagnostics.info("[LOOP] %s", self.loop_monitor.log_line())
+        except Exception as e:
+            log_diagnostics.info("[LOOP] %s", e)
+        self.root.after(self.LOOP_LOG_MS, self._log_loop_stats)
+
+    def _apply_history_settings(self):
+        if self.store:
+            self.store.raw_days = self.history_settings.get("raw_days", 30)
+            self.store.rollup_days["1m"] = self.history_settings.get("rollup_1m_days", 365)
+
+    def _apply_metrics_settings(self):
+        """(Re)start or stop the /metrics endpoint to match metrics_settings."""
+        if not self.acquires:
+            return      # served by the acquisition process, which has the sessions
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        m = self.metrics_settings
+        if not m.get("enabled"):
+            return
+        server = MetricsServer(m.get("bind") or "127.0.0.1", int(m.get("port", 9108)), self.render_metrics)
+        try:
+            server.start()
+            self.metrics_server = server
+        except Exception as e:
+            log_metrics.warning("[METRICS] Disabled: %s", e)
+
+    # Reading field -> (metric name, help)
+    METRIC_READINGS = {
+        "temperature": ("sam_max_temperature_celsius", "Probe temperature as reported by the sensor."),
+        "level":       ("sam_max_level_raw",           "Raw level reading (mmWG/mBar), before tare."),
+        "ph":          ("sam_max_ph",                  "pH reading."),
+        "tds":         ("sam_max_tds_ppm",             "Total dissolved solids (ppm)."),
+        "cond":        ("sam_max_conductivity_us_cm",  "Conductivity (uS/cm)."),
+        "sal":         ("sam_max_salinity_psu",        "Salinity (PSU)."),
+    }
+    ALARM_LEVELS = AlarmEngine.SEVERITY
+
+    def render_metrics(self):
+        """Prometheus text exposition from cached state only (no sensor I/O)."""
+        out = []
+
+        def esc(v):
+            return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        def family(name, kind, help_text, samples):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lbl = ",".join(f'{k}="{esc(v)}"' for k, v in labels.items())
+                out.append(f"{name}{{{lbl}}} {value!r}" if lbl else f"{name} {value!r}")
+
+        snap = self.readings.snapshot()
+        sensors = snap["sensors"]
+        family("sam_max_sensor_connected", "gauge", "1 while the sensor session is live.",
+               [({"sensor": sid}, 1.0 if self.sensors.get(sid, {}).get("is_running") else 0.0) for sid in sensors])
+        family("sam_max_sensor_last_reading_timestamp_seconds", "gauge", "Unix time of the last poll cycle.",
+               [({"sensor": sid}, rec["ts"]) for sid, rec in sensors.items() if rec["count"]])
+        for field, (name, help_text) in self.METRIC_READINGS.items():
+            samples = [({"sensor": sid}, rec[field]) for sid, rec in sensors.items()
+                       if rec["count"] and rec[field] == rec[field]]   # skip NaN
+            if samples:
+                family(name, "gauge", help_text, samples)
+
+        for field in ("on", "auto", "override", "keepalive"):
+            family(f"sam_max_pump_{field}", "gauge", f"Pump {field} flag (1/0).",
+                   [({"pump": name}, rec[field]) for name, rec in snap["pumps"].items()])
+
+        rates = {sid: self.level_rate(sid) for sid in self.level_rates}
+        family("sam_max_level_rate_mm_per_day", "gauge",
+               "Level change fitted over recent readings: evaporation (pump off) and fill (pump on).",
+               [({"sensor": sid, "regime": regime}, est[f"{regime}_mm_day"])
+                for sid, est in rates.items() for regime in ("evaporation", "fill")
+                if est[f"{regime}_mm_day"] is not None])
+
+        family("sam_max_alarm_state", "gauge", "0 normal, 1 approaching, 2 critical.",
+               [({"alarm": k}, float(self.ALARM_LEVELS.get(v, 0))) for k, v in sorted(dict(self.alarm_state).items())])
+        family("sam_max_sensor_reconnects_total", "counter", "Reconnect attempts by the watchdog since start.",
+               [({"sensor": sid}, float(n)) for sid, n in sorted(dict(self.reconnect_counts).items())])
+        family("sam_max_sensor_disabled", "gauge", "1 once the watchdog has given up on a sensor.",
+               [({"sensor": sid}, 1.0 if v else 0.0) for sid, v in sorted(dict(self.sensor_disabled_flags).items())])
+
+        loop = self.loop_monitor.stats()
+        # Percentiles over a sliding window are gauges, one family each; a
+        # summary's _sum/_count would have to be cumulative, which these aren't
+        for k in ("p50", "p95", "max"):
+            family(f"sam_max_tk_loop_lag_{k}_seconds", "gauge",
+                   f"Tk main loop scheduling lag, {k} over the recent window.",
+                   [({}, loop["lag_ms"][k] / 1000.0)])
+        polls = [(n[5:], t) for n, t in loop["threads"].items() if n.startswith("poll-")]
+        for k in ("p50", "p95"):
+            family(f"sam_max_poll_cycle_{k}_seconds", "gauge",
+                   f"Wall time of one poll cycle (including the inter-poll sleep), {k} over the recent window.",
+                   [({"sensor": sid}, t[f"wall_{k}_ms"] / 1000.0) for sid, t in polls])
+        family("sam_max_thread_cpu_percent", "gauge", "CPU use of each monitored loop over the recent window.",
+               [({"thread": n}, t["cpu_pct"]) for n, t in loop["threads"].items()])
+
+        transport = self.transport_stats.stats()
+        name = "sam_max_transport_request_seconds"
+        out.append(f"# HELP {name} Sensor command round-trip time.")
+        out.append(f"# TYPE {name} histogram")
+        replies = []
+        for sid, cmds in transport.items():
+            for cmd, r in cmds.items():
+                lbl = f'sensor="{esc(sid)}",cmd="{esc(cmd)}",transport="{esc(r["transport"])}"'
+                cum = 0
+                for edge, c in zip(r["buckets_ms"], r["hist"]):
+                    cum += c
+                    out.append(f'{name}_bucket{{{lbl},le="{edge / 1000.0!r}"}} {cum}')
+                out.append(f'{name}_bucket{{{lbl},le="+Inf"}} {r["n"]}')
+                out.append(f"{name}_sum{{{lbl}}} {r['sum_ms'] / 1000.0!r}")
+                out.append(f"{name}_count{{{lbl}}} {r['n']}")
+                replies += [({"sensor": sid, "cmd": cmd, "outcome": o}, float(r[o])) for o in TransportStats.OUTCOMES]
+        family("sam_max_transport_replies_total", "counter", "Sensor replies by outcome.", replies)
+
+        return "\n".join(out) + "\n"
+
+    def start_profiling(self, seconds=30, memory=False):
+        """Profile for `seconds`; results land next to settings.json. Tk thread only."""
+        if self.profile_session is not None:
+            log_diagnostics.warning("[PROFILE] Already running")
+            return None
+        out_dir = os.path.dirname(os.path.abspath(SETTINGS_PATH))
+        session = ProfileSession(self.root, out_dir, seconds=seconds, memory=memory)
+        self.profile_session = session
+        try:
+            session.start(on_done=lambda s: setattr(self, "profile_session", None))
+        except Exception as e:
+            self.profile_session = None
+            log_diagnostics.warning("[PROFILE] Could not start: %s", e)
+            return None
+        log_diagnostics.info("[PROFILE] Profiling for %g s%s", seconds, ' with memory snapshots' if memory else '')
+        return session
+
+    def _export_target_dir(self):
+        """First writable USB mount (/media/<user>/<label>), else EXPORT_DIR."""
+        import glob
+        for mount in sorted(glob.glob("/media/*/*")):
+            if os.path.ismount(mount) and os.access(mount, os.W_OK):
+                return mount
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        return os.path.abspath(EXPORT_DIR)
+
+    def open_export_popup(self):
+        self._show_popup("export", self._build_export_popup)
+
+    def _build_export_popup(self):
+        popup, canvas, container = self._build_scroll_popup("Export Data", pady=40)
+
+        tk.Label(container, text="Export Data", font=("Arial", 18, "bold")).pack(pady=(10, 20))
+
+        ranges = (("Last 24 hours", 1), ("Last 7 days", 7), ("Last 30 days", 30), ("Last year", 365), ("Everything", None))
+        range_var = tk.StringVar(value=ranges[1][0])
+        range_box = tk.LabelFrame(container, text="Time range")
+        range_box.pack(fill="x", pady=6)
+        for label, _ in ranges:
+            tk.Radiobutton(range_box, text=label, variable=range_var, value=label).pack(anchor="w", padx=10)
+
+        series_box = tk.LabelFrame(container, text="Readings")
+        series_box.pack(fill="x", pady=6)
+        series_vars = {}
+
+        opts = tk.LabelFrame(container, text="Options")
+        opts.pack(fill="x", pady=6)
+        fmt_var = tk.StringVar(value="csv")
+        every_var = tk.StringVar(value="0")
+        gzip_var = tk.BooleanVar(value=True)
+        row = tk.Frame(opts); row.pack(anchor="w", padx=10, pady=2)
+        tk.Radiobutton(row, text="CSV", variable=fmt_var, value="csv").pack(side="left")
+        tk.Radiobutton(row, text="JSON Lines", variable=fmt_var, value="jsonl").pack(side="left", padx=(12, 0))
+        row = tk.Frame(opts); row.pack(anchor="w", padx=10, pady=2)
+        for text, val in (("Every reading", "0"), ("1 min average", "60"), ("1 hour average", "3600")):
+            tk.Radiobutton(row, text=text, variable=every_var, value=val).pack(side="left", padx=(0, 12))
+        tk.Checkbutton(opts, text="Compress (.gz)", variable=gzip_var).pack(anchor="w", padx=10, pady=2)
+
+        status = tk.Label(container, text="", justify="left", anchor="w", wraplength=520)
+        status.pack(fill="x", pady=(12, 4))
+        job = {"cancel": None}
+
+        def refresh():
+            for w in series_box.winfo_children():
+                w.destroy()
+            keys = self.store.keys() if self.store else []
+            for key in keys:
+                var = series_vars.setdefault(key, tk.BooleanVar(value=True))
+                tk.Checkbutton(series_box, text=f"Sensor {key[0]} {key[1]}", variable=var).pack(anchor="w", padx=10)
+            if not keys:
+                tk.Label(series_box, text="Nothing recorded yet").pack(anchor="w", padx=10)
+
+        def run_export():
+            if job["cancel"] is not None or not self.store:
+                return
+            series = [k for k, v in series_vars.items() if v.get()]
+            if not series:
+                status.config(text="Select at least one reading")
+                return
+            days = dict(ranges)[range_var.get()]
+            start = time.time() - days * 86400 if days else None
+            every = float(every_var.get()) or None
+            fmt = fmt_var.get()
+            try:
+                out_dir = self._export_target_dir()
+            except OSError as e:
+                status.config(text=f"No place to write the export: {e}")
+                return
+            name = f"sam-max-{time.strftime('%Y%m%d-%H%M%S')}.{fmt}" + (".gz" if gzip_var.get() else "")
+            path = os.path.join(out_dir, name)
+            cancel = job["cancel"] = threading.Event()
+            status.config(text=f"Exporting to {path} ...")
+
+            def worker():
+                try:
+                    try:
+                        self._flush_history()
+                    except Exception as e:
+                        log_history.warning("[EXPORT] Flush failed, exporting what is on disk: %s", e)
+                    rows = export_history(self.store, path, series, start, None, fmt, every,
+                                          progress=lambda n: self._call_ui(lambda: status.config(text=f"Exporting... {n} rows")),
+                                          cancel=cancel)
+                    msg = "Export cancelled" if rows is None else f"Wrote {rows} rows to {path}"
+                    log_history.info("[EXPORT] %s", msg)
+                except Exception as e:
+                    msg = f"Export failed: {e}"
+                    log_history.error("[EXPORT] %s", msg)
+                job["cancel"] = None
+                self._call_ui(lambda: status.config(text=msg))
+
+            threading.Thread(target=worker, daemon=True).start()
+
+        def cancel_export():
+            if job["cancel"] is not None:
+                job["cancel"].set()
+
+        buttons = tk.Frame(container)
+        buttons.pack(pady=(20, 60))
+        tk.Button(buttons, text="Export", font=("Arial", 12, "bold"), width=9, command=run_export).grid(row=0, column=0, padx=5)
+        tk.Button(buttons, text="Cancel", font=("Arial", 12, "bold"), width=9, command=cancel_export).grid(row=0, column=1, padx=5)
+        tk.Button(buttons, text="Close", font=("Arial", 12, "bold"), width=9,
+                  command=lambda: self._hide_popup(popup)).grid(row=0, column=2, padx=5)
+
+        return {"popup": popup, "canvas": canvas, "refresh": refresh}
+
+    def report_bands(self):
+        """
+        Alarm band (lo, hi) per series for the daily report, in stored units:
+        A/B level the pump on/off thresholds, C level / pH / TDS their alarm
+        limits when those alarms are enabled. Pumps and alarms act on tared
+        levels but history stores the raw mmWG, so level bands are moved
+        back up by each sensor's tare offset.
+        """
+        bands = {}
+        for sid in ("A", "B"):
+            th = self.thresholds.get(sid, {})
+            if "on" in th and "off" in th:
+                bands[f"{sid}.level"] = (float(th["on"]), float(th["off"]))
+        c = self.display_units.get("C", {})
+        lo, hi = self._num(c.get("min_alarm")), self._num(c.get("max_alarm"))
+        if c.get("level_alarm") and lo is not None and hi is not None and lo < hi:
+            if c.get("use_liters") or c.get("use_gallons"):
+                # Alarm limits are in litres / gallons; the history holds mmWG
+                area = (self._num(c.get("width")) or 0) * (self._num(c.get("depth")) or 0)
+                per_mm = area / 10000.0 * (1.0 if c.get("use_liters") else 0.264172)
+                band = (lo / per_mm, hi / per_mm) if per_mm > 0 else None
+            else:
+                band = (lo, hi)
+            if band:
+                bands["C.level"] = band
+        for sid in ("A", "B", "C"):
+            name = f"{sid}.level"
+            if name in bands:
+                off = self._num(self.tare_offsets.get(sid)) or 0.0
+                bands[name] = (bands[name][0] + off, bands[name][1] + off)
+        for sid, metric, flag, lo_key, hi_key in (("D", "ph", "ph_alarm_enabled", "ph_min", "ph_max"),
+                                                  ("E", "tds", "tds_alarm_enabled", "tds_min", "tds_max")):
+            cfg = self.display_units.get(sid, {})
+            lo, hi = self._num(cfg.get(lo_key)), self._num(cfg.get(hi_key))
+            if cfg.get(flag) and lo is not None and hi is not None and lo < hi:
+                bands[f"{sid}.{metric}"] = (lo, hi)
+        return bands
+
+    def run_daily_report(self, day, on_done):
+        """
+        Compute the report for `day` (YYYY-MM-DD) in a separate process
+        (`SAM-Max.py report`), so neither the Tk loop nor the poll threads
+        share a CPU slice or the GIL with it. on_done(report, error) runs on
+        the Tk thread.
+        """
+        if not self.store:
+            on_done(None, "History is disabled")
+            return
+        out = os.path.join(REPORT_DIR, f"{day}.json")
+        cmd = [sys.executable, os.path.abspath(__file__), "report", "--day", day,
+               "--history", HISTORY_DIR, "--bands", json.dumps(self.report_bands()), "-o", out]
+
+        def worker():
+            report, error = None, None
+            try:
+                self._flush_history()   # the worker reads the files, not our buffers
+                proc = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+                if proc.returncode != 0:
+                    raise RuntimeError((proc.stderr.strip().splitlines() or [f"exit {proc.returncode}"])[-1])
+                with open(out) as f:
+                    report = json.load(f)
+                log_history.info("[REPORT] %s: %s series in "
+                                 "%.2f s (%s) -> %s", day, len(report['series']), report['elapsed_s'], report['engine'], out)
+            except Exception as e:
+                error = str(e)
+                log_history.error("[REPORT] %s: %s", day, e)
+            self._call_ui(lambda: on_done(report, error))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _flush_history(self):
+        """Get buffered samples onto disk (worker threads; a view asks the acquisition process)."""
+        if self.acquires:
+            self.store.flush()
+        else:
+            ipc_request({"cmd": "flush"}, timeout=30.0)
+
+    @staticmethod
+    def format_report(report):
+        def hm(seconds):
+            m = int(seconds // 60)
+            return f"{m // 60}h{m % 60:02d}"
+
+        lines = [f"{'Reading':<14}{'Min':>9}{'Max':>9}{'Mean':>9}{'Std':>8}{'Outside':>9}"]
+        for name, st in sorted(report["series"].items()):
+            outside = hm(st["outside_s"]) if "outside_s" in st else "-"
+            lines.append(f"{name:<14}{st['min']:>9.2f}{st['max']:>9.2f}{st['mean']:>9.2f}"
+                         f"{st['std']:>8.2f}{outside:>9}")
+        lines.append("")
+        lines.append(f"{'Pump':<14}{'Runtime':>9}{'Top-ups':>9}{'Starts':>8}")
+        for pump, st in sorted(report["pumps"].items()):
+            lines.append(f"{pump:<14}{hm(st['runtime_s']):>9}{st.get('top_ups', st['starts']):>9}{st['starts']:>8}")
+        return "\n".join(lines)
+
+    def open_report_popup(self):
+        self._show_popup("report", self._build_report_popup)
+
+    def _build_report_popup(self):
+        import datetime
+        popup, canvas, container = self._build_scroll_popup("Daily Report", pady=40)
+
+        tk.Label(container, text="Daily Report", font=("Arial", 18, "bold")).pack(pady=(10, 20))
+        status = tk.Label(container, text="", justify="left", anchor="w", wraplength=520)
+        status.pack(fill="x", pady=(0, 6))
+        table = tk.Label(container, text="", font=("Courier", 11), justify="left", anchor="w")
+        table.pack(fill="x", pady=6)
+        busy = {"day": None}
+
+        def show(day, report, error):
+            busy["day"] = None
+            if error:
+                status.config(text=f"{day}: report failed: {error}")
+                return
+            status.config(text=f"{day}  ({report['engine']}, {report['elapsed_s']:.2f} s)")
+            table.config(text=self.format_report(report))
+
+        def generate(offset):
+            if busy["day"]:
+                return
+            day = (datetime.date.today() - datetime.timedelta(days=offset)).isoformat()
+            busy["day"] = day
+            status.config(text=f"Computing {day} ...")
+            self.run_daily_report(day, lambda report, error: show(day, report, error))
+
+        def refresh():
+            # Show the newest saved report until asked for another
+            if busy["day"]:
+                return
+            try:
+                names = sorted(n for n in os.listdir(REPORT_DIR) if n.endswith(".json"))
+                with open(os.path.join(REPORT_DIR, names[-1])) as f:
+                    report = json.load(f)
+                show(report.get("day", names[-1][:-5]), report, None)
+            except (OSError, IndexError, ValueError, KeyError):
+                status.config(text="No report yet")
+                table.config(text="")
+
+        buttons = tk.Frame(container)
+        buttons.pack(pady=(20, 60))
+        tk.Button(buttons, text="Yesterday", font=("Arial", 12, "bold"), width=9,
+                  command=lambda: generate(1)).grid(row=0, column=0, padx=5)
+        tk.Button(buttons, text="Today", font=("Arial", 12, "bold"), width=9,
+                  command=lambda: generate(0)).grid(row=0, column=1, padx=5)
+        tk.Button(buttons, text="Close", font=("Arial", 12, "bold"), width=9,
+                  command=lambda: self._hide_popup(popup)).grid(row=0, column=2, padx=5)
+
+        return {"popup": popup, "canvas": canvas, "refresh": refresh}
+
+    def open_diagnostics_popup(self):
+        self._show_popup("diagnostics", self._build_diagnostics_popup)
+
+    def _build_diagnostics_popup(self):
+        popup, canvas, container = self._build_scroll_popup("Diagnostics", pady=40)
+
+        tk.Label(container, text="Diagnostics", font=("Arial", 18, "bold")).pack(pady=(10, 20))
+        loop_label = tk.Label(container, font=("Courier", 12), justify="left", anchor="w")
+        loop_label.pack(fill="x", pady=6)
+
+        tk.Label(container, text="Sensor requests (ms)", font=("Arial", 14, "bold")).pack(anchor="w", pady=(16, 4))
+        transport_label = tk.Label(container, font=("Courier", 11), justify="left", anchor="w")
+        transport_label.pack(fill="x", pady=6)
+        tk.Button(container, text="Reset counters", font=("Arial", 12),
+                  command=lambda: (reset_counters(), refresh())).pack(anchor="w", pady=(0, 6))
+
+        def reset_counters():
+            if self.acquires:
+                self.transport_stats.reset()
+            else:
+                self._ipc_async({"cmd": "transport_stats", "reset": True})
+                self._acq_status.pop("transport", None)
+
+        def refresh():
+            if self.acquires:
+                loop_label.config(text=self.loop_monitor.report())
+                transport_label.config(text=self.transport_stats.report())
+                return
+            # Sensor requests run in the acquisition process: show its figures too
+            remote = self._acq_status.get("loop", "(waiting for status)")
+            loop_label.config(text=f"{self.loop_monitor.report()}\n\nAcquisition process\n{remote}")
+            transport_label.config(text=self.transport_stats.report(self._acq_status.get("transport", {})))
+
+        job = {"id": None}
+
+        def auto_refresh():
+            # Live while shown; stops by itself once the popup is hidden
+            job["id"] = None
+            if popup.winfo_exists() and popup.winfo_viewable():
+                refresh()
+                job["id"] = popup.after(1000, auto_refresh)
+
+        def show():
+            refresh()
+            if job["id"] is None:
+                job["id"] = popup.after(1000, auto_refresh)
+
+        prof_frame = tk.LabelFrame(container, text="Profiling")
+        prof_frame.pack(fill="x", pady=(20, 6))
+        memory_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(prof_frame, text="Include memory snapshots", variable=memory_var).pack(anchor="w", padx=10, pady=4)
+        prof_status = tk.Label(prof_frame, text="", justify="left", anchor="w")
+        prof_status.pack(fill="x", padx=10, pady=4)
+
+        def run_profile():
+            if self.start_profiling(memory=memory_var.get()):
+                prof_status.config(text="Profiling 30 s… results are written next to settings.json")
+            else:
+                prof_status.config(text="A profiling run is already in progress")
+
+        tk.Button(prof_frame, text="Profile 30 s", font=("Arial", 12, "bold"),
+                  command=run_profile).pack(anchor="w", padx=10, pady=(4, 10))
+
+        tk.Button(container, text="Close", font=("Arial", 12, "bold"), width=9,
+                  command=lambda: self._hide_popup(popup)).pack(pady=(30, 60))
+
+        return {"popup": popup, "canvas": canvas, "refresh": show}
+
+    # Decimals the firmware reports each reading with (pH "7.00", TDS "152", ...)
+    DISPLAY_DECIMALS = {"temperature": 1, "level": 1, "ph": 2, "tds": 0, "cond": 0, "sal": 2}
+
+    def _fmt_num(self, v, metric):
+        """Table value -> display string at the metric's fixed precision (None when the sensor gave no value)."""
+        if v is None or v != v:   # NaN
+            return None
+        return f"{v:.{self.DISPLAY_DECIMALS.get(metric, 2)}f}"
+
+    def level_rate(self, sensor_id):
+        """Evaporation / fill estimate for tank A or B, in L/day when its width and depth are set."""
+        if not self.acquires and sensor_id in self._acq_status.get("rates", {}):
+            return self._acq_status["rates"][sensor_id]     # fitted where the readings are
+        units = self.display_units.get(sensor_id, {})
+        width, depth = self._num(units.get("width")) or 0, self._num(units.get("depth")) or 0
+        # Same conversion as the level display: litres = mm * width * depth / 10000
+        per_mm = width * depth / 10000.0 if width > 0 and depth > 0 else None
+        return self.level_rates[sensor_id].estimate(per_mm)
+
+    def _render_level_rate(self, sensor_id):
+        """Pump tile rate line, refreshed at most every RATE_REFRESH_S."""
+        now = time.time()
+        if now - self._rate_shown.get(sensor_id, 0.0) < self.RATE_REFRESH_S:
+            return
+        self._rate_shown[sensor_id] = now
+        frame = self.pump_frame_a if sensor_id == "A" else self.pump_frame_b
+        est = self.level_rate(sensor_id)
+        unit = "L/day" if "evaporation_l_day" in est else "mm/day"
+        suffix = "l_day" if unit == "L/day" else "mm_day"
+
+        def fmt(value):
+            return "--" if value is None else f"{value:.1f} {unit}"
+        frame["rate_label"].config(text=f"Evaporation: {fmt(est['evaporation_' + suffix])}\n"
+                                        f"Fill: {fmt(est['fill_' + suffix])}")
+
+    # Metric drawn by each tile's trend line
+    TREND_METRICS = {"A": "level", "B": "level", "C": "level", "D": "ph", "E": "tds"}
+
+    def _render_trend(self, sensor_id, frame):
+        """
+        Fold new history samples into the tile's trend line, at most once
+        every TrendChart.REFRESH_S. Runs from the render pass, so it is
+        paused along with everything else while the display is blanked.
+        The first pass hands the whole span (memory ring, then the on-disk
+        store for anything from before this start) to _load_trend() on a
+        worker; later passes only read the samples since the last one drawn.
+        """
+        trend = frame.get("trend")
+        metric = self.TREND_METRICS.get(sensor_id)
+        if not trend or not metric or not trend.canvas.winfo_manager():
+            return
+        now = time.time()
+        if not trend.due(now):
+            return
+        try:
+            if not trend.loaded:
+                # After a restart the span comes from disk and LTTB runs over
+                # ~200k points: keep that off the Tk thread
+                if not trend.loading:
+                    trend.loading = True
+                    threading.Thread(target=self._load_trend, args=(sensor_id, metric, trend),
+                                     daemon=True).start()
+                return
+            if self.acquires:
+                trend.extend(*self.history.window(sensor_id, metric, trend.last_ts))
+            else:
+                # A view's ring stays empty: new samples come from the store,
+                # as far as the acquisition process has flushed it
+                start = trend.last_ts if trend.last_ts is not None else now - trend.span_s
+                trend.extend(*self.history_window(sensor_id, metric, start))
+            trend.draw(now)
+        except Exception as e:
+            trend.last_draw = now
+            log_ui.warning("[TREND] Sensor %s: %s", sensor_id, e)
+
+    def _load_trend(self, sensor_id, metric, trend):
+        """Worker: read and reduce a tile's first trend span, then apply it on the Tk thread."""
+        try:
+            reduced = trend.reduce(*self.history_window(sensor_id, metric, time.time() - trend.span_s))
+        except Exception as e:
+            log_ui.warning("[TREND] Sensor %s: %s", sensor_id, e)
+
+            def _retry_later():
+                trend.loading = False
+                trend.last_draw = time.time()
+            self._call_ui(_retry_later)
+            return
+
+        def _apply():
+            trend.apply(reduced)
+            trend.draw(time.time())
+        self._call_ui(_apply)
+
+    def _render_sensor(self, sensor_id, rec):
+        frame = self.get_sensor_frame_by_id(sensor_id)
+        if not frame:
+            return
+        self._render_trend(sensor_id, frame)
+        if sensor_id in self.level_rates:
+            self._render_level_rate(sensor_id)
+        temperature = self._fmt_num(rec.get("temperature"), "temperature")
+
+        if sensor_id in ("A", "B", "C"):
+            self.update_sensor_ui(frame, temperature, self._fmt_num(rec.get("level"), "level"), None, None, None)
+
+        elif sensor_id == "D":
+            self.update_sensor_ui(frame, temperature, None, self._fmt_num(rec.get("ph"), "ph"), None, None, None)
+
+        elif sensor_id == "E":
+            tds = self._fmt_num(rec.get("tds"), "tds")
+            cond = self._fmt_num(rec.get("cond"), "cond")
+            sal = self._fmt_num(rec.get("sal"), "sal")
+            t_text   = f"{temperature} °C" if temperature else "--"
+            tds_text = f"{tds} ppm"        if tds else "--"
+            cu_text  = f"{cond} µS/cm"     if cond else "--"
+            s_text   = f"{sal} PSU"        if sal else "--"
+
+            self.tds_level_frame["temperature_label"].config(text=f"Temperature: {t_text}")
+            self.tds_level_frame["tds_level_label"].config(text=f"TDS: {tds_text}")
+            self.tds_level_frame["cond_uScm_level_label"].config(text=f"Conductivity: {cu_text}")
+            self.tds_level_frame["sal_level_label"].config(text=f"Salinity: {s_text}")
+            self.layout_tds_tile()
+
     def sensor_watchdog(self):
         while True:
+            self.loop_monitor.checkpoint("watchdog")
             for sensor_id, sensor in self.sensors.items():
                 # Skip sensors we have decided to disable after too many failures
                 if self.sensor_disabled_flags.get(sensor_id, False):
@@ -2833,24 +7276,20 @@ class SensorGUI:
 
                 if not running:
                     attempt_num = self.sensor_fail_counts.get(sensor_id, 0) + 1
-                    print(
-                        f"[WATCHDOG] Sensor {sensor_id} not running. "
-                        f"Attempting reconnect ({attempt_num}/{self.MAX_SENSOR_RETRIES})."
+                    self.reconnect_counts[sensor_id] += 1
+                    log_sensors.info(
+                        "[WATCHDOG] Sensor %s not running. "
+                        "Attempting reconnect (%s/%s).", sensor_id, attempt_num, self.MAX_SENSOR_RETRIES
                     )
 
-                    # Update UI to show disconnected
-                    self.safe_gui_update(
-                        lambda sid=sensor_id: self.set_sensor_disconnected(
-                            self.get_sensor_frame_by_id(sid),
-                            sensor_id=sid
-                        )
-                    )
+                    # Publish disconnected (the tile follows on its next render pass)
+                    self.set_sensor_disconnected(sensor_id)
 
                     # Try reconnect
                     try:
                         ok = self.reconnect_sensor(sensor_id)
                     except Exception as e:
-                        print(f"[WATCHDOG ERROR] Failed to reconnect sensor {sensor_id}: {e}")
+                        log_sensors.error("[WATCHDOG ERROR] Failed to reconnect sensor %s: %s", sensor_id, e)
                         ok = False
 
                     if ok:
@@ -2862,9 +7301,10 @@ class SensorGUI:
                         self.sensor_fail_counts[sensor_id] = attempt_num
                         if attempt_num >= self.MAX_SENSOR_RETRIES:
                             self.sensor_disabled_flags[sensor_id] = True
-                            print(
-                                f"[WATCHDOG] Sensor {sensor_id} disabled after "
-                                f"{attempt_num} failed reconnect attempts."
+                            self.journal.record("sensor", sensor_id, "disabled", attempts=attempt_num)
+                            log_sensors.warning(
+                                "[WATCHDOG] Sensor %s disabled after "
+                                "%s failed reconnect attempts.", sensor_id, attempt_num
                             )
 
             time.sleep(5)  # Check every 5 seconds
@@ -2905,25 +7345,22 @@ class SensorGUI:
                         if t.readline():
                             self.sensors[sensor_id]["port"] = t
                             self.sensors[sensor_id]["is_running"] = True
+                            self.journal.record("sensor", sensor_id, "connected", transport="tcp", host=host, reconnect=True)
                             self.update_sensor_firmware(sensor_id)
 
                             # Reset failure tracking on success
                             self.sensor_fail_counts[sensor_id] = 0
                             self.sensor_disabled_flags[sensor_id] = False
-
-                            self.safe_gui_update(
-                                lambda: self.setup_sensor_ui(self.get_sensor_frame_by_id(sensor_id), t)
-                            )
                             threading.Thread(
                                 target=self.read_sensor_data,
                                 args=(sensor_id,),
                                 daemon=True
                             ).start()
-                            print(f"[WATCHDOG] Sensor {sensor_id} TCP reconnected {host}:{port}")
+                            log_sensors.info("[WATCHDOG] Sensor %s TCP reconnected %s:%s", sensor_id, host, port)
                             return True
     
                 except Exception as e:
-                    print(f"[WATCHDOG TCP] {sensor_id}: {e}")
+                    log_sensors.warning("[WATCHDOG TCP] %s: %s", sensor_id, e)
             # fall through to serial scan as last resort
 
         # serial scan (your existing code)
@@ -2952,26 +7389,24 @@ class SensorGUI:
                     if ts.readline():
                         self.sensors[sensor_id]["port"] = ts
                         self.sensors[sensor_id]["is_running"] = True
+                        self.journal.record("sensor", sensor_id, "connected", transport="serial",
+                                            device=port.device, reconnect=True)
                         self.update_sensor_firmware(sensor_id)
 
                         # Reset failure tracking on success
                         self.sensor_fail_counts[sensor_id] = 0
                         self.sensor_disabled_flags[sensor_id] = False
-
-                        self.safe_gui_update(
-                            lambda: self.setup_sensor_ui(self.get_sensor_frame_by_id(sensor_id), ts)
-                        )
                         threading.Thread(
                             target=self.read_sensor_data,
                             args=(sensor_id,),
                             daemon=True
                         ).start()
-                        print(f"[WATCHDOG] Sensor {sensor_id} reconnected on {port.device}")
+                        log_sensors.info("[WATCHDOG] Sensor %s reconnected on %s", sensor_id, port.device)
                         return True
                     
                 ts.close()
             except Exception as e:
-                print(f"[RECONNECT ERROR] {port.device}: {e}")
+                log_sensors.debug("[RECONNECT ERROR] %s: %s", port.device, e)
         return False
        
     def safe_gui_update(self, func):
@@ -2979,7 +7414,7 @@ class SensorGUI:
             if self.root and self.root.winfo_exists():
                 self.root.after(0, func)
         except Exception as e:
-            print(f"[GUI UPDATED]")
+            log_ui.debug("[GUI UPDATE] Skipped: %s", e)
 
     def update_sensor_ui(self, frame, temperature, water_level, ph_level, tds_level,
                          cond_uScm_level=None, cond_mScm_level=None, sal_level=None):
@@ -3041,7 +7476,7 @@ class SensorGUI:
                 label.config(text=f"Temperature: {temperature}")
 
         except Exception as e:
-            print(f"[ERROR] Updating temperature_label: {e}")
+            log_ui.error("[ERROR] Updating temperature_label: %s", e)
 
     def update_water_level_label(self, frame, water_level):
         try:
@@ -3082,7 +7517,7 @@ class SensorGUI:
                 else:
                     label.config(text=f"Level: {wl_mmwg:.1f} mmWG")
         except Exception as e:
-            print(f"[ERROR] Updating water_gauge_label: {e}")
+            log_ui.error("[ERROR] Updating water_gauge_label: %s", e)
 
     def update_ph_label(self, frame, ph_level):
         try:
@@ -3090,7 +7525,7 @@ class SensorGUI:
            if label and ph_level:
                 label.config(text=f"pH Level: {ph_level}")
         except Exception as e:
-            print(f"[ERROR] Updating ph_level_label: {e}")
+            log_ui.error("[ERROR] Updating ph_level_label: %s", e)
             
     def update_tds_label(self, frame, tds_level):
         try:
@@ -3098,7 +7533,7 @@ class SensorGUI:
            if label and tds_level:
                 label.config(text=f"TDS Level: {tds_level}")
         except Exception as e:
-            print(f"[ERROR] Updating tds_level_label: {e}")
+            log_ui.error("[ERROR] Updating tds_level_label: %s", e)
             
     def update_cond_uScm_label(self, frame, cond_uScm_level):
         try:
@@ -3106,7 +7541,7 @@ class SensorGUI:
            if label and cond_uScm_level:
                 label.config(text=f"Conductivity Level: {cond_uScm_level}")
         except Exception as e:
-            print(f"[ERROR] Updating cond_uScm_level_label: {e}")
+            log_ui.error("[ERROR] Updating cond_uScm_level_label: %s", e)
     
     def update_sal_label(self, frame, sal_level):
         try:
@@ -3114,7 +7549,7 @@ class SensorGUI:
            if label and sal_level:
                 label.config(text=f"Salinity Level: {sal_level}")
         except Exception as e:
-            print(f"[ERROR] Updating sal_level_label: {e}")    
+            log_ui.error("[ERROR] Updating sal_level_label: %s", e)    
 
     def toggle_fullscreen(self, event=None):
         self.fullscreen = not self.fullscreen
@@ -3126,75 +7561,20 @@ class SensorGUI:
 
     def reset_sensor(self, sensor_id):
         try:
+            if not self.acquires:
+                reply = ipc_request({"cmd": "reset", "sensor": sensor_id})
+                if not reply.get("ok"):
+                    raise ValueError(reply.get("error", "refused"))
+                return
             t = self.sensors.get(sensor_id, {}).get("port")
             if not t:
                 raise ValueError("No active connection.")
-            print("Sending reset command (r)...")
+            log_sensors.info("Sending reset command (r)...")
             t.write("r\n")
         except Exception as e:
-            print(f"Exception: {e}")
+            log_sensors.error("[RESET] Sensor %s: %s", sensor_id, e)
             self.root.after(0, lambda: messagebox.showerror("Error", f"Failed to reset sensor {sensor_id}: {e}"))
 
-    def check_ro_tank_alarm(self, sensor_id, wl_mmwg):
-        """
-        sensor_id should be 'C'
-        Uses display_units['C'] keys:
-          level_alarm (bool), use_liters/use_gallons (bool), width, depth,
-          min_alarm, max_alarm
-        Converts wl_mmwg to selected unit; if invalid config, falls back to normal.
-        """
-        label = self.ro_tank_frame["connection_status"]
-        try:
-            settings = self.display_units.get(sensor_id, {})
-            if not settings.get("level_alarm", False):
-                self._set_alarm_state("ro_tank", "normal", label)
-                return
-
-            # reading -> chosen unit
-            wl_val = self._num(wl_mmwg)
-            if wl_val is None:
-                self._set_alarm_state("ro_tank", "normal", label)
-                return
-
-            use_liters  = bool(settings.get("use_liters", False))
-            use_gallons = bool(settings.get("use_gallons", False))
-            width = self._num(settings.get("width"))
-            depth = self._num(settings.get("depth"))
-
-            if use_liters or use_gallons:
-                if not width or not depth or width <= 0 or depth <= 0:
-                    print("[RO ALARM] Missing/invalid width/depth; treating as normal.")
-                    self._set_alarm_state("ro_tank", "normal", label)
-                    return
-                liters = wl_val * width * depth / 10000.0
-                value = liters if use_liters else liters * 0.264172
-            else:
-                # raw mmWG mode
-                value = wl_val
-
-            lo = self._num(settings.get("min_alarm"))
-            hi = self._num(settings.get("max_alarm"))
-            if lo is None or hi is None or lo >= hi:
-                print("[RO ALARM] Invalid thresholds; treating as normal.")
-                self._set_alarm_state("ro_tank", "normal", label)
-                return
-
-            margin = 50 if not (use_liters or use_gallons) else (2.0 if use_liters else 0.5)
-            if value <= lo or value >= hi:
-                self._set_alarm_state("ro_tank", "critical", label)
-            elif (lo < value <= lo + margin) or (hi - margin <= value < hi):
-                self._set_alarm_state("ro_tank", "approach", label)
-            else:
-                self._set_alarm_state("ro_tank", "normal", label)
-
-        except Exception as e:
-            print("[RO ALARM] Exception:", e)
-            try:
-                import traceback; traceback.print_exc()
-            except Exception:
-                pass
-            self._set_alarm_state("ro_tank", "normal", label)
-
     def _num(self, x):
         """best-effort float; returns None on blank, ERR, --, etc."""
         try:
@@ -3205,158 +7585,10 @@ class SensorGUI:
         except Exception:
             return None
 
-    def _set_alarm_state(self, sensor_key, state, label):
-        """sensor_key: 'ro_tank' or 'ph_sensor' or 'tds_sensor'"""
-        # Avoid thrash if unchanged
-        if self.current_status_text.get(sensor_key, "") == state:
-            return
-        self.current_status_text[sensor_key] = state
-
-        if state == "normal":
-            # stop flashing + set green
-            self.stop_alarm_flash(sensor_key)
-            try:
-                label.config(text="Connected", fg="green")
-            except Exception:
-                pass
-                # also stop any alarm sounds if you’ve added them
-                if hasattr(self, "_reset_alarm_sound_state"):
-                    self._reset_alarm_sound_state(sensor_key)
-                elif state == "approach":
-                    label.config(text="APPROACHING LIMIT")
-                    self.start_alarm_flash(label, sensor_key, base_color="orange")
-                    if hasattr(self, "_maybe_play_alarm"):
-                        self._maybe_play_alarm(sensor_key, severity="approach")
-                    elif state == "critical":
-                        label.config(text="LEVEL CRITICAL")
-                        self.start_alarm_flash(label, sensor_key, base_color="red")
-                        if hasattr(self, "_maybe_play_alarm"):
-                            self._maybe_play_alarm(sensor_key, severity="critical")
- 
-    def check_ph_alarm(self, sensor_id, ph_reading):
-        """
-        sensor_id should be 'D'
-        Uses display_units['D'] keys:
-          ph_alarm_enabled (bool), ph_min (floaty), ph_max (floaty)
-        """
-        label = self.ph_level_frame["connection_status"]
-        try:
-            settings = self.display_units.get(sensor_id, {})
-            if not settings.get("ph_alarm_enabled", False):
-                # alarm disabled => normal
-                self._set_alarm_state("ph_sensor", "normal", label)
-                return
-
-            val = self._num(ph_reading)
-            if val is None:
-                # No valid reading => do not alarm; show normal
-                self._set_alarm_state("ph_sensor", "normal", label)
-                return
-
-            lo = self._num(settings.get("ph_min"))
-            hi = self._num(settings.get("ph_max"))
-            if lo is None or hi is None or lo >= hi:
-                # misconfigured thresholds => treat as disabled
-                print("[PH ALARM] Invalid thresholds; treating as normal.")
-                self._set_alarm_state("ph_sensor", "normal", label)
-                return
-
-            margin = 0.5  # near-threshold buffer
-            if val <= lo or val >= hi:
-                self._set_alarm_state("ph_sensor", "critical", label)
-            elif (lo < val <= lo + margin) or (hi - margin <= val < hi):
-                self._set_alarm_state("ph_sensor", "approach", label)
-            else:
-                self._set_alarm_state("ph_sensor", "normal", label)
-
-        except Exception as e:
-            # never surface "Alarm Error" to UI; log and show normal
-            print("[PH ALARM] Exception:", e)
-            try:
-                import traceback; traceback.print_exc()
-            except Exception:
-                pass
-            self._set_alarm_state("ph_sensor", "normal", label) 
-
-    def check_tds_alarm(self, sensor_id, tds_reading):
-            """
-            sensor_id should be 'E'
-            Uses display_units['E'] keys:
-              tds_alarm_enabled (bool), tds_min (floaty), tds_max (floaty)
-            """
-            label = self.tds_level_frame["connection_status"]
-            try:
-                settings = self.display_units.get(sensor_id, {})
-                if not settings.get("tds_alarm_enabled", False):
-                    # alarm disabled => normal
-                    self._set_alarm_state("tds_sensor", "normal", label)
-                    return
-
-                val = self._num(tds_reading)
-                if val is None:
-                    # No valid reading => do not alarm; show normal
-                    self._set_alarm_state("tds_sensor", "normal", label)
-                    return
-
-                lo = self._num(settings.get("tds_min"))
-                hi = self._num(settings.get("tds_max"))
-                if lo is None or hi is None or lo >= hi:
-                    # misconfigured thresholds => treat as disabled
-                    print("[TDS ALARM] Invalid thresholds; treating as normal.")
-                    self._set_alarm_state("tds_sensor", "normal", label)
-                    return
-
-                margin = 0.5  # near-threshold buffer
-                if val <= lo or val >= hi:
-                    self._set_alarm_state("tds_sensor", "critical", label)
-                elif (lo < val <= lo + margin) or (hi - margin <= val < hi):
-                    self._set_alarm_state("tds_sensor", "approach", label)
-                else:
-                    self._set_alarm_state("tds_sensor", "normal", label)
-
-            except Exception as e:
-                # never surface "Alarm Error" to UI; log and show normal
-                print("[TDS ALARM] Exception:", e)
-                try:
-                    import traceback; traceback.print_exc()
-                except Exception:
-                    pass
-                self._set_alarm_state("tds_sensor", "normal", label)
-
     def start_alarm_flash(self, label, sensor_key, base_color):
-        """Flash between base_color and its alt shade. Cancels any existing job for this sensor."""
+        """Flash between base_color and its alt shade. Replaces any existing flash for this sensor."""
         alt = "#CC8400" if base_color == "orange" else "#A52A2A"
-
-        # cancel any stale job first
-        self.stop_alarm_flash(sensor_key, restore=False)
-
-        def _tick():
-            try:
-                cur = label.cget("fg")
-                label.config(fg=alt if cur == base_color else base_color)
-                self.alarm_flash_jobs[sensor_key] = label.after(500, _tick)
-            except Exception as e:
-                print(f"[FLASH] {sensor_key} error:", e)
-
-        label.config(fg=base_color)
-        self.alarm_flash_jobs[sensor_key] = label.after(500, _tick)
-
-    def stop_alarm_flash(self, sensor_key, restore=True, label=None):
-        """Stop flashing job for sensor_key. If restore, set label green."""
-        job = self.alarm_flash_jobs.pop(sensor_key, None)
-        if job and label:
-            try:
-                label.after_cancel(job)
-            except Exception:
-                pass
-        elif job:
-            pass
-
-        if restore and label:
-            try:
-                label.config(fg="green")
-            except Exception:
-                pass
+        self._call_ui(lambda: self.blink.start(sensor_key, label, base_color, alt))
 
     def _play_wav_async(self, key: str):
         """
@@ -3367,12 +7599,12 @@ class SensorGUI:
         try:
             # Ensure 'aplay' is available
             if shutil.which("aplay") is None:
-                print("[ALARM SOUND] 'aplay' not found. Install with: sudo apt-get install alsa-utils")
+                log_alarms.warning("[ALARM SOUND] 'aplay' not found. Install with: sudo apt-get install alsa-utils")
                 return
 
             path = self.sound_paths.get(key)
             if not path or not os.path.isfile(path):
-                print(f"[ALARM SOUND] File missing for key '{key}': {path}")
+                log_alarms.warning("[ALARM SOUND] File missing for key '%s': %s", key, path)
                 return
 
             # If the same sound is already playing, do nothing
@@ -3390,10 +7622,10 @@ class SensorGUI:
                 stderr=subprocess.DEVNULL,
                 start_new_session=True, 
             )
-            print(f"[ALARM SOUND] Playing '{key}' -> {path}")
+            log_alarms.info("[ALARM SOUND] Playing '%s' -> %s", key, path)
 
         except Exception as e:
-            print(f"[ALARM SOUND] Failed to play '{key}': {e}")
+            log_alarms.warning("[ALARM SOUND] Failed to play '%s': %s", key, e)
 
     def _maybe_play_alarm(self, sensor_id, state, min_interval=2.0):
         key = "approaching" if state == "approaching" else "critical"
@@ -3435,34 +7667,107 @@ class SensorGUI:
             self._sound_proc = None
             self._sound_key  = None
         except Exception as e:
-            print(f"[ALARM SOUND] Reset error: {e}")
+            log_alarms.warning("[ALARM SOUND] Reset error: %s", e)
             self._sound_proc = None
             self._sound_key  = None
   
-    def _set_alarm_state(self, sensor_id, new_state, label):
+    def alarm_rule_specs(self):
         """
-        new_state: 'normal' | 'approaching' | 'critical'
-        Edge-triggered: only acts when state changes.
+        Rules for the current settings: low/high critical limits and the
+        approaching band inside them for the RO tank (C), pH (D) and TDS (E)
+        alarms set up in the sensor popups, then alarm_settings["rules"].
+        RO limits are compared in the unit they were entered in.
         """
-        prev = self.alarm_state.get(sensor_id, "normal")
-        if prev == new_state:
-            return  # no change; prevents sound echo and re-flash
+        cfg = self.alarm_settings
+        hold = float(cfg.get("hold_s", 5.0))
+        frac = float(cfg.get("hysteresis", 0.25))
+        margins = cfg.get("margins", {})
+        specs = []
+
+        def band(sid, metric, lo, hi, margin, scale=1.0):
+            lo, hi = self._num(lo), self._num(hi)
+            if lo is None or hi is None or lo >= hi:
+                log_alarms.warning("[ALARM] Sensor %s: invalid limits; alarm off", sid)
+                return
+            hyst = margin * frac
+            for kind, limit, near in (("below", lo, lo + margin), ("above", hi, hi - margin)):
+                specs.append({"sensor": sid, "metric": metric, "kind": kind, "threshold": limit,
+                              "severity": "critical", "hysteresis": hyst, "hold_s": hold, "scale": scale})
+                if margin > 0:
+                    specs.append({"sensor": sid, "metric": metric, "kind": kind, "threshold": near,
+                                  "severity": "approaching", "hysteresis": hyst, "hold_s": hold, "scale": scale})
+
+        c = self.display_units.get("C", {})
+        if c.get("level_alarm"):
+            if c.get("use_liters") or c.get("use_gallons"):
+                width, depth = self._num(c.get("width")) or 0, self._num(c.get("depth")) or 0
+                if width > 0 and depth > 0:
+                    gallons = not c.get("use_liters")
+                    scale = width * depth / 10000.0 * (0.264172 if gallons else 1.0)
+                    margin = float(margins.get("C_gallons" if gallons else "C_liters", 0.5 if gallons else 2.0))
+                    band("C", "level", c.get("min_alarm"), c.get("max_alarm"), margin, scale)
+                else:
+                    log_alarms.warning("[ALARM] RO tank: volume alarm without width/depth; alarm off")
+            else:
+                band("C", "level", c.get("min_alarm"), c.get("max_alarm"), float(margins.get("C", 50.0)))
+        for sid, metric, flag, lo_key, hi_key in (("D", "ph", "ph_alarm_enabled", "ph_min", "ph_max"),
+                                                  ("E", "tds", "tds_alarm_enabled", "tds_min", "tds_max")):
+            u = self.display_units.get(sid, {})
+            if u.get(flag):
+                band(sid, metric, u.get(lo_key), u.get(hi_key), float(margins.get(sid, 0.5)))
+
+        for spec in cfg.get("rules", []):
+            problem = AlarmEngine.check_rule(spec)
+            if problem:
+                log_alarms.warning("[ALARM] Skipping rule %s: %s", spec, problem)
+                continue
+            specs.append({"hold_s": hold, **spec})
+        return specs
 
-        # Stop old effects first
-        self.stop_alarm_flash(sensor_id, restore=False, label=label)
-        self._reset_alarm_sound_state()
+    def reload_alarm_rules(self):
+        try:
+            specs = self.alarm_rule_specs()
+            self.alarms.load(specs)
+            log_alarms.info("[ALARM] %s alarm rules loaded", len(specs))
+        except Exception as e:
+            log_alarms.error("[ALARM] Could not load alarm rules: %s", e)
+
+    def clear_alarms(self, sensor_id):
+        """Sensor went away: drop its alarms to normal (its tile shows Disconnected instead)."""
+        for alarm in self.alarms.clear(sensor_id):
+            prev = self.alarm_state.get(alarm, "normal")
+            self.alarm_state[alarm] = "normal"
+            if alarm in ReadingsTable.SENSORS:
+                self.readings.publish(alarm, alarm=0)
+            if prev != "normal":
+                self.journal.record("alarm", alarm, "normal", previous=prev, reason="disconnected")
+        if all(v == "normal" for v in self.alarm_state.values()):
+            self._reset_alarm_sound_state()
 
-        # Apply new state
+    def _set_alarm_state(self, sensor_id, new_state):
+        """
+        new_state: 'normal' | 'approaching' | 'critical'. Called by the alarm
+        engine on transitions only, so the sound restarts once per change
+        instead of once per reading. The tile flashes from the severity
+        published here.
+        """
+        prev = self.alarm_state.get(sensor_id, "normal")
+        if prev == new_state:
+            return
         self.alarm_state[sensor_id] = new_state
+        self.journal.record("alarm", sensor_id, new_state, previous=prev)
+        log_alarms.info("[ALARM] Sensor %s: %s -> %s", sensor_id, prev, new_state)
+        if sensor_id not in ReadingsTable.SENSORS:
+            return
+        self.readings.publish(sensor_id, alarm=AlarmEngine.SEVERITY[new_state])
 
         if new_state == "normal":
-            label.config(text="Connected", fg="green")
+            # Leave the sound alone while another sensor is still alarming
+            if all(v == "normal" for v in self.alarm_state.values()):
+                self._reset_alarm_sound_state()
             return
-
-        base = "orange" if new_state == "approaching" else "red"
-        self.start_alarm_flash(label, sensor_id, base)
         self._maybe_play_alarm(sensor_id, new_state)
-        
+
     def layout_tds_tile(self):
         if not hasattr(self, "_tds_last_visibility"):
             self._tds_last_visivility = None
@@ -3507,7 +7812,16 @@ class SensorGUI:
         if btn: btn.pack(pady=5)
 
     def cleanup_on_exit(self):
-        print("[CLEANUP] Cleaning up serial ports and GPIO...")
+        if not self.acquires:
+            # Sessions, pumps and history belong to the acquisition process:
+            # stop it only if this GUI started it
+            if self.acquirer is not None:
+                log.info("[CLEANUP] Stopping the acquisition process...")
+                self._stop_acquisition()
+            self.settings_writer.flush()
+            self.readings.close()
+            return
+        log.info("[CLEANUP] Cleaning up serial ports and GPIO...")
         # Stop all sensor threads
         for sensor_id in self.sensors:
             self.sensors[sensor_id]["is_running"] = False
@@ -3515,36 +7829,77 @@ class SensorGUI:
             if port and port.is_open:
                 try:
                     port.close()
-                    print(f"[CLEANUP] Closed port for Sensor {sensor_id}")
+                    log.info("[CLEANUP] Closed port for Sensor %s", sensor_id)
                 except Exception as e:
-                    print(f"[CLEANUP ERROR] Could not close port for Sensor {sensor_id}: {e}")
+                    log.error("[CLEANUP ERROR] Could not close port for Sensor %s: %s", sensor_id, e)
 
         # Turn off pumps safely
         for pump_name, pin in self.pump_gpio.items():
             try:
                 GPIO.output(pin, GPIO.LOW)
             except Exception as e:
-               print(f"[CLEANUP ERROR] Could not turn off pump '{pump_name}': {e}")
+               log.error("[CLEANUP ERROR] Could not turn off pump '%s': %s", pump_name, e)
+
+        try:
+            self.save_last_readings()
+        except Exception as e:
+            log.error("[CLEANUP ERROR] Could not save last readings: %s", e)
+        self.settings_writer.flush()
+        self.journal.close()
+        if self.store:
+            self.store.stop()
+        if self.ipc:
+            self.ipc.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        self.readings.close()
 
         # Clean up GPIO
         try:
             GPIO.cleanup()
-            print("[CLEANUP] GPIO cleaned up.")
+            log.info("[CLEANUP] GPIO cleaned up.")
         except Exception as e:
-            print(f"[CLEANUP ERROR] GPIO cleanup failed: {e}")
+            log.error("[CLEANUP ERROR] GPIO cleanup failed: %s", e)
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        sys.exit(export_cli(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "report":
+        sys.exit(report_cli(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "acquire":
+        sys.exit(acquire_cli(sys.argv[2:]))
+    if "--bench-history" in sys.argv:
+        args = sys.argv[sys.argv.index("--bench-history") + 1:]
+        bench_history(args[0] if args else None)
+        sys.exit(0)
+
+    log_listener = setup_logging()
     root = tk.Tk()
-    gui = SensorGUI(root)
+    try:
+        try:
+            table, proc = start_acquisition()
+        except Exception as e:
+            log_acquire.warning("[ACQUIRE] No acquisition process (%s); polling and pump control run in the GUI", e)
+            gui = SensorGUI(root)
+        else:
+            gui = SensorGUI(root, role="view", readings=table, acquirer=proc)
+    except ReadingsTableBusy as e:
+        log.error("[STARTUP] SAM-Max is already running: %s", e)
+        root.withdraw()
+        messagebox.showerror("SAM-Max", "SAM-Max is already running on this device.")
+        root.destroy()
+        log_listener.stop()
+        sys.exit(1)
 
     def on_closing():
         gui.cleanup_on_exit()
         root.destroy()
+        log_listener.stop()
 
     root.protocol("WM_DELETE_WINDOW", on_closing)
 
     try:
         root.mainloop()
     except KeyboardInterrupt:
-        print("[EXIT] Interrupted by user.")
+        log.info("[EXIT] Interrupted by user.")
         on_closing()
\ No newline at end of file
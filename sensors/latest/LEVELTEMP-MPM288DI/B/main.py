@@ -471,6 +471,26 @@ def tcp_server_thread():
         except:
             print(e)
 
+# LOG RING
+# Commands are logged into a small in-RAM ring instead of printed; printing to
+# the USB console on every command costs milliseconds. Fetch with RX249.
+LOG_SIZE = 64
+_log_buf = [None] * LOG_SIZE
+_log_pos = 0
+
+def log(level, tag, value=""):
+    global _log_pos
+    _log_buf[_log_pos % LOG_SIZE] = (time.ticks_ms(), level, tag, value)
+    _log_pos += 1
+
+def log_lines():
+    out = []
+    start = max(0, _log_pos - LOG_SIZE)
+    for i in range(start, _log_pos):
+        t, level, tag, value = _log_buf[i % LOG_SIZE]
+        out.append("{} {} {} {}".format(t, level, tag, value))
+    return out
+
 def tcp_server():
     import sys
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -484,7 +504,7 @@ def tcp_server():
         conn = None
         try:
             conn, addr = s.accept()
-            print("Connection from:", addr)
+            log("I", "CONN", addr[0])
             conn.settimeout(5)
             buf = b""
 
@@ -499,23 +519,27 @@ def tcp_server():
                     cmd = line.decode().strip()
                     if not cmd:
                         continue
-                    print("RX-CMD:", cmd)
 
                     try:
                         if cmd == "RX201":
                             val = read_temperature()
                             conn.send((val + "\n").encode())
-                            print("TX-Temperature=", val)
+                            log("D", "Temperature", val)
 
                         elif cmd == "RX203":
                             val = read_pressure()
                             conn.send((val + "\n").encode())
-                            print("TX-Level=", val)
+                            log("D", "Level", val)
 
                         elif cmd == "RX800":
                             val = identify_sensor()
                             conn.send((val + "\n").encode())
-                            print("TX-ID=", val)
+                            log("D", "ID", val)
+
+                        elif cmd == "RX249":
+                            for entry in log_lines():
+                                conn.send((entry + "\n").encode())
+                            conn.send(b"END\n")
 
                         elif cmd.lower() == "r":
                             conn.send(b"Rebooting\n")
@@ -529,7 +553,7 @@ def tcp_server():
                             conn.send(b"?\n")
 
                     except Exception as e:
-                        print("Command Error:")
+                        log("E", "CMD", cmd)
                         try: sys.print_exception(e)
                         except: print(e)
 
@@ -25,7 +25,7 @@ de_re.value(0)
 
 SENSOR_ID = "D"
 MODEL = "PH"
-FW_VERSION = "1.1.0"
+FW_VERSION = "2.1.0"
 VARIANT = "RS485-MODBUS"
 
 OTA_ENABLED = True
@@ -678,6 +678,26 @@ def ota_apply():
             pass
         return False
 
+# LOG RING
+# Commands are logged into a small in-RAM ring instead of printed; printing to
+# the USB console on every command costs milliseconds. Fetch with RX249.
+LOG_SIZE = 64
+_log_buf = [None] * LOG_SIZE
+_log_pos = 0
+
+def log(level, tag, value=""):
+    global _log_pos
+    _log_buf[_log_pos % LOG_SIZE] = (time.ticks_ms(), level, tag, value)
+    _log_pos += 1
+
+def log_lines():
+    out = []
+    start = max(0, _log_pos - LOG_SIZE)
+    for i in range(start, _log_pos):
+        t, level, tag, value = _log_buf[i % LOG_SIZE]
+        out.append("{} {} {} {}".format(t, level, tag, value))
+    return out
+
 def tcp_server():
     import sys
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -691,7 +711,7 @@ def tcp_server():
         conn = None
         try:
             conn, addr = s.accept()
-            print("Connection from:", addr)
+            log("I", "CONN", addr[0])
             conn.settimeout(5)
             buf = b""
 
@@ -707,23 +727,27 @@ def tcp_server():
                     cmd = line.decode().strip()
                     if not cmd:
                         continue
-                    print("RX-CMD:", cmd)
 
                     try:
                         if cmd == "RX201":            # temperature
                             val = read_temperature()
                             conn.send((val + "\n").encode())
-                            print("TX-Temperature=", val)
+                            log("D", "Temperature", val)
 
                         elif cmd == "RX205":          # pH
                             val = read_ph()
                             conn.send((val + "\n").encode())
-                            print("TX-pH=", val)
+                            log("D", "pH", val)
 
                         elif cmd == "RX800":          # identify
                             val = identify_sensor()
                             conn.send((val + "\n").encode())
-                            print("TX-ID=", val)
+                            log("D", "ID", val)
+
+                        elif cmd == "RX249":
+                            for entry in log_lines():
+                                conn.send((entry + "\n").encode())
+                            conn.send(b"END\n")
 
                         elif cmd.lower() == "r":      # reboot
                             conn.send(b"Rebooting\n")
@@ -754,7 +778,7 @@ def tcp_server():
                             conn.send(b"?\n")
 
                     except Exception as e:
-                        print("Command Error:")
+                        log("E", "CMD", cmd)
                         try: sys.print_exception(e)
                         except: print(e)
                         # don't kill the connection immediately; continue to next line
@@ -10,7 +10,7 @@ from machine import Pin, UART
 
 SENSOR_ID = "E"
 MODEL = "TDS"
-FW_VERSION = "1.1.0"
+FW_VERSION = "2.1.0"
 VARIANT = "RS485-MODBUS"
 
 OTA_ENABLED = True
@@ -818,6 +818,26 @@ def blink_led_thread(led, interval):
         try: sys.print_exception(e)
         except: print(e)
 
+# LOG RING
+# Commands are logged into a small in-RAM ring instead of printed; printing to
+# the USB console on every command costs milliseconds. Fetch with RX249.
+LOG_SIZE = 64
+_log_buf = [None] * LOG_SIZE
+_log_pos = 0
+
+def log(level, tag, value=""):
+    global _log_pos
+    _log_buf[_log_pos % LOG_SIZE] = (time.ticks_ms(), level, tag, value)
+    _log_pos += 1
+
+def log_lines():
+    out = []
+    start = max(0, _log_pos - LOG_SIZE)
+    for i in range(start, _log_pos):
+        t, level, tag, value = _log_buf[i % LOG_SIZE]
+        out.append("{} {} {} {}".format(t, level, tag, value))
+    return out
+
 def tcp_server():
     import sys
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -831,7 +851,7 @@ def tcp_server():
         conn = None
         try:
             conn, addr = s.accept()
-            print("Connection from:", addr)
+            log("I", "CONN", addr[0])
             conn.settimeout(5)
             buf = b""
 
@@ -847,13 +867,12 @@ def tcp_server():
                     cmd = line.decode().strip()
                     if not cmd:
                         continue
-                    print("RX-CMD:", cmd)
 
                     try:
                         if cmd == "RX201":            # temperature
                             val = read_temperature()
                             conn.send((val + "\n").encode())
-                            print("TX-Temperature=", val)
+                            log("D", "Temperature", val)
                             
                         elif cmd == "RX207C":         # Calculated TDS with current settings (FOR TESTING ONLY, not used in GUI)
                             ec = read_conductivity_uScm_raw()   # use RAW, not probe-comp
@@ -867,19 +886,19 @@ def tcp_server():
                                 v = int(round(float(ec25) * k)) if ec25 != "ERR" else None
                                 val = str(v) if v is not None else "ERR"
                             except Exception as e:
-                                print("calc ppm err:", e); val = "ERR"
+                                log("E", "PPM", e); val = "ERR"
                             conn.send((val + "\n").encode())
-                            print("TX-TDS(calc)=", val)
+                            log("D", "TDS(calc)", val)
                         
                         elif cmd == "RX206":          # Conductivity (µS/cm) (added)
                             val = read_conductivity_uScm()
                             conn.send((val + "\n").encode())
-                            print("TX-EC_uS/cm=", val)
+                            log("D", "EC_uS/cm", val)
 
                         elif cmd == "RX208":          # Salinity (PSU) (added)
                             val = read_salinity_psu()
                             conn.send((val + "\n").encode())
-                            print("TX-PSU=", val)
+                            log("D", "PSU", val)
 
                         elif cmd == "RX209":          # Conversion settings report (added)
                             srep = "MODE={};K={:.3f};TC={};ALPHA={:.3f};FW={}{}".format(
@@ -890,7 +909,7 @@ def tcp_server():
                                 SENSOR_ID, FW_VERSION
                             )
                             conn.send((srep + "\n").encode())
-                            print("TX-CFG=", srep)
+                            log("D", "CFG", srep)
 
                         elif cmd.startswith("RX240"):  # Set k-factor (added)
                             try:
@@ -898,7 +917,7 @@ def tcp_server():
                                 _tds_cfg["k"] = max(0.3, min(0.9, float(val)))
                                 conn.send(b"OK\n")
                             except Exception as e:
-                                print("RX240 err:", e); conn.send(b"ERR\n")
+                                log("E", "RX240", e); conn.send(b"ERR\n")
 
                         elif cmd.startswith("RX241"):  # Set TC on/off (added)
                             try:
@@ -906,7 +925,7 @@ def tcp_server():
                                 _tds_cfg["tc"] = (val.strip() in ("1","ON","on","true","True"))
                                 conn.send(b"OK\n")
                             except Exception as e:
-                                print("RX241 err:", e); conn.send(b"ERR\n")
+                                log("E", "RX241", e); conn.send(b"ERR\n")
 
                         elif cmd.startswith("RX242"):  # Set alpha (added)
                             try:
@@ -914,7 +933,7 @@ def tcp_server():
                                 _tds_cfg["alpha"] = max(0.0, min(0.04, float(val)))
                                 conn.send(b"OK\n")
                             except Exception as e:
-                                print("RX242 err:", e); conn.send(b"ERR\n")
+                                log("E", "RX242", e); conn.send(b"ERR\n")
 
                         elif cmd == "RX243":          # Save cfg (added)
                             _save_tds_cfg(); conn.send(b"OK\n")
@@ -956,16 +975,16 @@ def tcp_server():
                                     v = int(round(float(ec25) * k)) if ec25 != "ERR" else None
                                     val = str(v) if v is not None else "ERR"
                                 except Exception as e:
-                                    print("calc ppm err:", e); val = "ERR"
+                                    log("E", "PPM", e); val = "ERR"
                             else:
                                 val = read_tds()
                             conn.send((val + "\n").encode())
-                            print("TX-TDS=", val)
+                            log("D", "TDS", val)
                         
                         elif cmd == "RX800":          # identify
                             val = identify_sensor()
                             conn.send((val + "\n").encode())
-                            print("TX-ID=", val)
+                            log("D", "ID", val)
                         
                         elif cmd == "RX260":         # DIAG snapshot
                             snap = get_probe_cfg_snapshot()
@@ -977,7 +996,12 @@ def tcp_server():
                                 fmt(snap.get("alpha_x1000")), fmt(snap.get("tds_k_x1000")),
                                 fmt(snap.get("refT_C")), fmt(snap.get("meascoef")))
                             conn.send((line + "\n").encode())
-                            print("TX-DIAG=", line)
+                            log("D", "DIAG", line)
+
+                        elif cmd == "RX249":          # log ring dump
+                            for entry in log_lines():
+                                conn.send((entry + "\n").encode())
+                            conn.send(b"END\n")
 
                         elif cmd.lower() == "r":      # reboot
                             conn.send(b"Rebooting\n")
@@ -991,7 +1015,7 @@ def tcp_server():
                             conn.send(b"?\n")
 
                     except Exception as e:
-                        print("Command Error:")
+                        log("E", "CMD", cmd)
                         try: sys.print_exception(e)
                         except: print(e)
                         # don't kill the connection immediately; continue to next line